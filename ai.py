@@ -0,0 +1,105 @@
+import random
+
+# Computer opponent logic, shared by single player mode and server-hosted bots
+
+DIFFICULTIES = ("easy", "medium", "hard", "expert")
+
+# Pixels per frame the AI's paddle moves (the player's moves 7)
+AI_SPEEDS = {"easy": 3, "medium": 5, "hard": 7, "expert": 7}
+
+# The expert plays from the lookup table ai_table.py builds, loaded on first use
+policy_table_loaded = False
+policy_table_cache = None
+
+def policy_table():
+    """The expert's ai_table.PolicyTable, or None if it hasn't been built"""
+    global policy_table_loaded, policy_table_cache
+    if not policy_table_loaded:
+        policy_table_loaded = True
+        try:
+            import ai_table
+            policy_table_cache = ai_table.PolicyTable()
+        except (OSError, ValueError):
+            policy_table_cache = None
+    return policy_table_cache
+
+def predict_ball_y(ball_x, ball_y, ball_speed_x, ball_speed_y, paddle_x, ball_size=20, height=600):
+    """Where the ball's center will be when it reaches paddle_x, bouncing off the walls"""
+    time_to_hit = abs(paddle_x - ball_x) / abs(ball_speed_x)
+    future_y = ball_y + ball_size / 2 + ball_speed_y * time_to_hit
+
+    # Fold the straight line back into the field for every wall bounce
+    while future_y < 0 or future_y > height:
+        if future_y < 0:
+            future_y = -future_y
+        elif future_y > height:
+            future_y = 2 * height - future_y
+    return future_y
+
+def paddle_move(difficulty, side, paddle_y, ball_x, ball_y, ball_speed_x, ball_speed_y,
+                paddle_width=20, paddle_height=100, ball_size=20, width=800, height=600, rng=random):
+    """How many pixels the AI moves its paddle this frame (before clamping)
+
+    side is "left" or "right"; paddles sit 50 pixels from their edge of the
+    screen. Easy follows the ball slowly and sometimes twitches, medium
+    follows it with a dead zone, and hard aims for where the ball will
+    arrive and recenters while the ball moves away. Expert looks up where
+    to be, aiming its returns, and plays like hard if it has no table.
+    """
+    speed = AI_SPEEDS[difficulty]
+    ball_center_y = ball_y + ball_size // 2
+
+    if difficulty == "easy":
+        # 15% chance AI will move randomly
+        if rng.random() < 0.15:
+            return rng.choice([-3, 3])
+        desired_y = ball_center_y - paddle_height // 2
+        dead_zone = 0
+
+    elif difficulty == "medium":
+        # Add slight delay/lag to medium difficulty
+        desired_y = ball_center_y - paddle_height // 2
+        dead_zone = 10
+
+    elif difficulty == "expert" and policy_table() is not None:
+        desired_y = policy_table().target_y(side, ball_x, ball_y, ball_speed_x, ball_speed_y, ball_size, width)
+        dead_zone = 0
+
+    else:
+        if side == "left":
+            approaching = ball_speed_x < 0
+            paddle_face, ball_edge = 50 + paddle_width, ball_x
+        else:
+            approaching = ball_speed_x > 0
+            paddle_face, ball_edge = width - 50 - paddle_width, ball_x + ball_size
+        if approaching:
+            future_y = predict_ball_y(ball_edge, ball_y, ball_speed_x, ball_speed_y, paddle_face,
+                                      ball_size, height)
+            desired_y = future_y - paddle_height // 2
+        else:
+            # When ball is moving away, return to center position
+            desired_y = height // 2 - paddle_height // 2
+        dead_zone = 0
+
+    if paddle_y < desired_y - dead_zone:
+        return speed
+    if paddle_y > desired_y + dead_zone:
+        return -speed
+    return 0
+
+class Bot:
+    """An AI player moving one paddle of a GameState, e.g. in a server slot no human has"""
+    def __init__(self, difficulty, rng=random):
+        self.difficulty = difficulty
+        self.rng = rng
+
+    def move(self, game_state, player_id):
+        """Move this bot's paddle for one tick"""
+        paddle_y = game_state.paddle_y(player_id)
+        dy = paddle_move(self.difficulty, "left" if player_id == 0 else "right", paddle_y,
+                         game_state.ball_x, game_state.ball_y,
+                         game_state.ball_speed_x, game_state.ball_speed_y,
+                         game_state.paddle_width, game_state.paddle_height,
+                         game_state.ball_size, game_state.width, game_state.height, self.rng)
+        if dy:
+            game_state.set_paddle_y(player_id, paddle_y + dy)
@@ -0,0 +1,155 @@
+import array
+import mmap
+import os
+import struct
+import sys
+import time
+
+from game_state import DEFAULT_CONFIG, GameState
+
+# The "expert" AI looks up where to put its paddle instead of working it out
+# every frame. The table is built offline by simulating the ball from every
+# cell of a grid over ball x, ball y and the ball's slope (y speed over x
+# speed) with the game's own physics, and saved as a flat array of uint16
+# paddle targets that is memory-mapped when a game loads it.
+#
+# Only balls heading towards the paddle need a cell. Paddle y isn't part of
+# the key: where to go doesn't depend on where the paddle is, and moving
+# towards the target is a comparison, not a lookup.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_table.bin")
+
+MAGIC = b"PPAI"
+VERSION = 1
+# magic, version, cell size (px), x cells, y cells, slope cells, max slope, aim
+HEADER = struct.Struct("<4sHHHHHff")
+
+BALL_SPEED_X = 5  # The physics never changes the ball's x speed, only its sign
+
+class PolicyTable:
+    """A memory-mapped table of paddle targets for a right-hand paddle
+
+    Lookups for the left paddle mirror the ball first.
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # e.g. an interrupted build: too short to unpack or cast to uint16
+        if len(self.map) < HEADER.size or (len(self.map) - HEADER.size) % 2:
+            self.map.close()
+            raise ValueError(f"{path} is truncated")
+        (magic, version, self.cell_size, self.x_cells, self.y_cells,
+         self.slope_cells, self.max_slope, self.aim) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} AI table")
+
+        targets = memoryview(self.map)[HEADER.size:]
+        if sys.byteorder == "little":
+            self.targets = targets.cast("H")
+        else:
+            # Big-endian hosts pay for a copy instead of mapping
+            self.targets = array.array("H", targets)
+            self.targets.byteswap()
+        if len(self.targets) != self.x_cells * self.y_cells * self.slope_cells:
+            raise ValueError(f"{path} is truncated")
+
+        self.slope_step = 2 * self.max_slope / (self.slope_cells - 1)
+        self.rest_y = DEFAULT_CONFIG.height // 2 - DEFAULT_CONFIG.paddle_height // 2
+
+    def size(self):
+        """Bytes the table takes on disk (and in memory, once paged in)"""
+        return len(self.map)
+
+    def target_y(self, side, ball_x, ball_y, ball_speed_x, ball_speed_y, ball_size=20, width=800):
+        """Where a paddle on side ("left" or "right") should go"""
+        if side == "left":
+            # Mirror the field so the paddle is on the right
+            ball_x = width - ball_x - ball_size
+            ball_speed_x = -ball_speed_x
+        if ball_speed_x <= 0:
+            return self.rest_y  # Moving away
+
+        x = min(self.x_cells - 1, max(0, int(ball_x) // self.cell_size))
+        y = min(self.y_cells - 1, max(0, int(ball_y) // self.cell_size))
+        slope = ball_speed_y / ball_speed_x
+        s = min(self.slope_cells - 1, max(0, round((slope + self.max_slope) / self.slope_step)))
+        return self.targets[(s * self.x_cells + x) * self.y_cells + y]
+
+    def close(self):
+        if isinstance(self.targets, memoryview):
+            self.targets.release()
+        self.map.close()
+
+def arrival_y(ball_x, ball_y, slope):
+    """Where the ball's center is when it reaches the right paddle, by simulation"""
+    state = GameState()
+    state.game_active = True
+    # Paddles out of the way so only the walls bounce the ball
+    state.left_paddle_y = state.right_paddle_y = -10 * state.height
+    state.ball_x, state.ball_y = ball_x, ball_y
+    state.ball_speed_x, state.ball_speed_y = BALL_SPEED_X, slope * BALL_SPEED_X
+
+    paddle_face = state.width - 50 - state.paddle_width
+    while state.ball_x + state.ball_size < paddle_face:
+        state.update_ball()
+    return state.ball_y + state.ball_size / 2
+
+def build(path=DEFAULT_PATH, cell_size=10, slope_cells=21, aim=0.5):
+    """Simulate every cell and write the table to path
+
+    aim (0 to 1) is how far off center the paddle meets the ball, on the
+    side that sends it back towards the far wall. Off-center hits return
+    the ball at a steeper angle, which is harder to reach, but the further
+    off center the less room for error.
+    """
+    state = GameState()
+    x_cells = state.width // cell_size
+    y_cells = (state.height - state.ball_size) // cell_size + 1
+    max_slope = 1.0  # Paddle hits give the ball at most 5 px/tick of y speed
+    slope_step = 2 * max_slope / (slope_cells - 1)
+    half = state.paddle_height / 2
+    max_offset = aim * (half - state.ball_size)
+
+    targets = array.array("H")
+    for s in range(slope_cells):
+        slope = -max_slope + s * slope_step
+        for x in range(x_cells):
+            for y in range(y_cells):
+                # Simulate from the middle of the cell
+                center_y = arrival_y(x * cell_size + cell_size / 2,
+                                     min(y * cell_size + cell_size / 2, state.height - state.ball_size),
+                                     slope)
+                offset = max_offset if center_y < state.height / 2 else -max_offset
+                target = center_y - half - offset
+                targets.append(int(max(0, min(state.height - state.paddle_height, target))))
+
+    if sys.byteorder != "little":
+        targets.byteswap()
+    # Written next to it and renamed, so an interrupted build leaves the
+    # old table (or none) rather than half of a new one
+    partial = path + ".partial"
+    with open(partial, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, cell_size, x_cells, y_cells, slope_cells, max_slope, aim))
+        targets.tofile(f)
+    os.replace(partial, path)
+    return len(targets)
+
+def main(argv=None, prog=None):
+    """Build the expert AI's table from the command line"""
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog, description="Build the lookup table the expert AI plays from")
+    parser.add_argument("--out", default=DEFAULT_PATH, help="where to write the table")
+    parser.add_argument("--cell", type=int, default=10, help="grid cell size in pixels")
+    parser.add_argument("--slopes", type=int, default=21, help="number of ball slope buckets")
+    parser.add_argument("--aim", type=float, default=0.5,
+                        help="0 = hit the ball dead center, 1 = as steep a return as possible")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    cells = build(args.out, args.cell, args.slopes, args.aim)
+    print(f"Wrote {cells:,} cells ({os.path.getsize(args.out):,} bytes) to {args.out} "
+          f"in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
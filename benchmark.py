@@ -0,0 +1,611 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules the single player path should never pay for
+NETWORK_MODULES = ("network", "discovery", "protocol", "socket", "selectors", "pickle")
+
+def headless_env():
+    """Environment that lets pygame open its window without a display"""
+    env = dict(os.environ)
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env.setdefault("SDL_AUDIODRIVER", "dummy")
+    env["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    return env
+
+def parse_importtime(stderr):
+    """Turn -X importtime output into (module, depth, self_us, cumulative_us) rows"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+def time_first_frame(command, runs):
+    """Run command until it exits and collect wall and in-process first-frame times"""
+    wall_times = []
+    first_frames = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=HERE, env=headless_env(),
+                                capture_output=True, text=True, timeout=120)
+        wall_times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed:\n{result.stderr}")
+        for line in result.stdout.splitlines():
+            if line.startswith("First frame after"):
+                first_frames.append(float(line.split()[3]))
+    return wall_times, first_frames
+
+def bench_startup(args):
+    """Client time-to-first-frame and import cost, plus the headless server's imports"""
+    client = [sys.executable, "main.py", "--exit-after-first-frame"]
+    wall_times, first_frames = time_first_frame(client, args.runs)
+    print(f"Client startup over {args.runs} runs (SDL dummy driver):")
+    print(f"  process start to exit after first frame: median {statistics.median(wall_times) * 1000:.1f} ms")
+    if first_frames:
+        print(f"  interpreter start to first frame:        median {statistics.median(first_frames) * 1000:.1f} ms")
+    
+    result = subprocess.run([sys.executable, "-X", "importtime"] + client[1:], cwd=HERE,
+                            env=headless_env(), capture_output=True, text=True, timeout=120)
+    rows = parse_importtime(result.stderr)
+    top_level = sorted((row for row in rows if row[1] == 0), key=lambda row: -row[3])
+    print(f"\nSlowest top-level imports (-X importtime, {len(rows)} modules in total):")
+    for name, depth, self_us, cumulative_us in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    loaded = {row[0] for row in rows}
+    leaked = [name for name in NETWORK_MODULES if name in loaded]
+    print(f"  networking modules loaded by the single player path: {', '.join(leaked) or 'none'}")
+    
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"], cwd=HERE,
+                            env=headless_env(), capture_output=True, text=True, timeout=120)
+    rows = parse_importtime(result.stderr)
+    total = sum(row[3] for row in rows if row[1] == 0)
+    has_pygame = any(row[0] == "pygame" for row in rows)
+    print(f"\nHeadless server imports: {total / 1000:.1f} ms, pygame loaded: {'yes' if has_pygame else 'no'}")
+
+def bench_physics(args):
+    """How many server ticks per second one core can simulate"""
+    import pickle
+    from game_state import GameState, History
+    state = GameState()
+    state.start_game()
+    steps = args.steps
+    start = time.perf_counter()
+    for _ in range(steps):
+        state.update_ball()
+        if not state.game_active:
+            state.start_game()
+    elapsed = time.perf_counter() - start
+    print(f"GameState.update_ball: {steps / elapsed:,.0f} ticks/s ({elapsed / steps * 1e6:.2f} us per tick)")
+    
+    # What the server adds per room tick: keeping the tick in the lag
+    # compensation history, and the snapshot every client is sent
+    history = History(13)
+    start = time.perf_counter()
+    for tick in range(steps):
+        history.save(tick, state)
+    elapsed = time.perf_counter() - start
+    snapshot = pickle.dumps(("state", steps, state, (steps, steps)))
+    print(f"History.save: {elapsed / steps * 1e6:.2f} us per tick; snapshot: {len(snapshot)} bytes")
+
+def bench_bots(args):
+    """What a server-hosted bot adds to the cost of a room's tick"""
+    import ai
+    import server
+    from game_state import GameState
+    server.log = lambda message: None
+    
+    table = ai.policy_table()
+    if table is None:
+        print("No expert AI table (build it with: python ai_table.py) - expert plays like hard")
+    else:
+        print(f"Expert AI table: {table.x_cells}x{table.y_cells}x{table.slope_cells} cells, "
+              f"{table.size():,} bytes, memory-mapped from {table.path}")
+    for difficulty in ai.DIFFICULTIES:
+        # Time just the bots' decisions while they play a real game
+        state = GameState()
+        state.start_game()
+        bots = {0: ai.Bot(difficulty), 1: ai.Bot(difficulty)}
+        deciding = 0
+        for _ in range(args.ticks):
+            start = time.perf_counter()
+            for player_id, bot in bots.items():
+                bot.move(state, player_id)
+            deciding += time.perf_counter() - start
+            state.update_ball()
+            if not state.game_active:
+                state.start_game()
+        
+        # And a whole room tick, snapshot included, for scale
+        room = server.Room(0)
+        room.bots = bots
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            room.tick(tick)
+        per_tick = (time.perf_counter() - start) / args.ticks
+        print(f"{difficulty:>6} bot: {deciding / (2 * args.ticks) * 1e6:.2f} us per decision, "
+              f"bot-vs-bot room tick {per_tick * 1e6:.2f} us")
+
+def bench_env(args):
+    """Training environment throughput, random actions, auto-reset"""
+    import random
+    from pong_env import VectorPongEnv
+    
+    actions = random.Random(0)
+    for pixels in (False, True):
+        envs = VectorPongEnv(args.envs, seed=0, frame_skip=args.frame_skip, pixels=pixels)
+        envs.reset()
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            envs.step([actions.randrange(3) for _ in range(args.envs)])
+            steps += args.envs
+        rate = steps / (time.perf_counter() - start)
+        kind = "pixel" if pixels else "vector"
+        print(f"{args.envs} envs, frame skip {args.frame_skip}, {kind} observations: "
+              f"{rate:,.0f} steps/s ({rate * 3600 / 1e6:,.0f}M steps/hour on one core)")
+
+def bench_results(args):
+    """Cost of saving a match result to the game loop, and how many the writer keeps up with"""
+    import tempfile
+    import results
+    
+    stats = results.MatchStats()
+    for side in (0, 1, 0, 0, 1, 0, 0, 0, 1, 0, 0):
+        stats.on_hit(1 - side)
+        stats.on_point(side)
+    with tempfile.TemporaryDirectory() as directory:
+        store = results.ResultsStore(os.path.join(directory, "results.db"))
+        start = time.perf_counter()
+        for _ in range(args.matches):
+            store.record(stats.result(("medium bot", "hard bot"), 0, "server", 0, bots=("medium", "hard")))
+        queued = time.perf_counter() - start
+        store.close(timeout=None)
+        elapsed = time.perf_counter() - start
+        print(f"record(): {queued / args.matches * 1e6:.2f} us per match on the game loop")
+        print(f"Writer: {store.written:,} matches in {store.batches} transactions, "
+              f"{store.written / elapsed:,.0f} matches/s")
+    print(f"(At one finished match per room per minute, that covers {store.written / elapsed * 60:,.0f} rooms)")
+
+def bench_rollback(args):
+    """What a P2P rollback costs: saving and restoring the state, and replaying frames"""
+    import random
+    from rollback import FixedGame, RollbackSession
+    
+    rng = random.Random(0)
+    inputs = [(rng.randrange(3), rng.randrange(3)) for _ in range(args.frames)]
+    game = FixedGame(1)
+    start = time.perf_counter()
+    for left, right in inputs:
+        game.step(left, right)
+    per_step = (time.perf_counter() - start) / args.frames
+    
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        saved = game.save()
+    per_save = (time.perf_counter() - start) / args.frames
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        game.restore(saved)
+    per_restore = (time.perf_counter() - start) / args.frames
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        FixedGame.checksum(saved)
+    per_checksum = (time.perf_counter() - start) / args.frames
+    
+    # The worst a frame gets: restore, then replay every frame a guess can reach
+    depth = RollbackSession.MAX_ROLLBACK
+    start = time.perf_counter()
+    for frame in range(0, args.frames - depth, depth):
+        game.restore(saved)
+        for left, right in inputs[frame:frame + depth]:
+            saved = game.save()
+            game.step(left, right)
+    per_rollback = (time.perf_counter() - start) / ((args.frames - depth) // depth)
+    
+    print(f"FixedGame.step: {per_step * 1e6:.2f} us, save: {per_save * 1e6:.2f} us, "
+          f"restore: {per_restore * 1e6:.2f} us, checksum: {per_checksum * 1e6:.2f} us")
+    print(f"Rolling back {depth} frames: {per_rollback * 1e6:.1f} us "
+          f"({per_rollback / (1 / 60) * 100:.2f}% of a 60 Hz frame)")
+
+def bench_chaos(args):
+    """Chaos mode tick cost, and its spatial hash broadphase against testing every pair"""
+    from chaos import ChaosGame
+    
+    print(f"{'balls':>6} {'tick':>9} {'grid pairs':>11} {'grid':>9} {'all pairs':>10} {'naive':>10}")
+    for count in args.balls:
+        game = ChaosGame(count, seed=0, win_score=0)
+        for _ in range(60):  # Let the serve pattern break up
+            game.step(game.ai_buttons(0), game.ai_buttons(1))
+        
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            game.step(game.ai_buttons(0), game.ai_buttons(1))
+        per_tick = (time.perf_counter() - start) / args.ticks
+        
+        # The collision phase alone, both ways, on the same positions
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            game.collide(game.grid_pairs())
+        per_grid = (time.perf_counter() - start) / args.ticks
+        grid_checks = game.pair_checks
+        naive = "-"
+        if count <= args.naive_max:
+            runs = max(1, args.ticks // 20)
+            start = time.perf_counter()
+            for _ in range(runs):
+                game.collide(game.all_pairs())
+            naive = f"{(time.perf_counter() - start) / runs * 1e3:.2f} ms"
+        print(f"{count:6} {per_tick * 1e3:6.2f} ms {grid_checks:11,} {per_grid * 1e3:6.2f} ms "
+              f"{count * (count - 1) // 2:10,} {naive:>10}")
+    print(f"(tick: everything chaos mode simulates per tick; a 60 FPS frame has {1000 / 60:.1f} ms)")
+
+def bench_render(args):
+    """A gameplay frame drawn object by object vs batched by render.SpriteBatch, under SDL's dummy driver"""
+    import random
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    import pygame
+    from render import SpriteBatch
+    
+    pygame.init()
+    screen = pygame.display.set_mode((800, 600))
+    font = pygame.font.Font(None, 74)
+    small_font = pygame.font.Font(None, 36)
+    rng = random.Random(0)
+    
+    def draw_rects(positions, left_score, right_score):
+        # What the game did before: a draw call per object, text rendered every frame
+        screen.fill((0, 0, 0))
+        for x, y in positions:
+            pygame.draw.rect(screen, (255, 255, 0), (x, y, 10, 10))
+        screen.blit(font.render(str(left_score), True, (255, 255, 255)), (200, 10))
+        screen.blit(font.render(str(right_score), True, (255, 255, 255)), (600, 10))
+        screen.blit(small_font.render("Press P to pause | H for Home", True, (150, 150, 150)), (250, 570))
+    
+    sprites = SpriteBatch()
+    def draw_batched(positions, left_score, right_score):
+        screen.fill((0, 0, 0))
+        sprites.rects((255, 255, 0), positions, 10, 10)
+        sprites.draw_text(font, str(left_score), (255, 255, 255), 200, 10)
+        sprites.draw_text(font, str(right_score), (255, 255, 255), 600, 10)
+        sprites.draw_text(small_font, "Press P to pause | H for Home", (150, 150, 150), 250, 570)
+        sprites.draw(screen)
+    
+    print(f"{'entities':>8} {'draw.rect':>11} {'batched':>11} {'speedup':>8}")
+    for count in args.entities:
+        frames = [[(rng.uniform(0, 790), rng.uniform(0, 590)) for _ in range(count)] for _ in range(10)]
+        times = []
+        for draw in (draw_rects, draw_batched):
+            start = time.perf_counter()
+            for frame in range(args.frames):
+                # The score changes every 60 frames, like a point every second
+                draw(frames[frame % len(frames)], frame // 60, frame // 90)
+            times.append((time.perf_counter() - start) / args.frames)
+        print(f"{count:8,} {times[0] * 1e3:8.3f} ms {times[1] * 1e3:8.3f} ms {times[0] / times[1]:7.1f}x")
+    print(f"(frame time without display.flip(), under the {pygame.display.get_driver()} video driver)")
+    pygame.quit()
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def bench_network(args):
+    """Clients playing on a local server through the impairment proxy: what they see of the link"""
+    import contextlib
+    import io
+    import random
+    import socket
+    import impair
+    
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "server.py", "--port", str(port), "--no-results",
+                               "--rooms", str((args.clients + 1) // 2)],
+                              cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    proxy = None
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("The server didn't start")
+                time.sleep(0.1)
+        # The clients connect through the proxy unless it's turned off
+        if args.profile != "off":
+            proxy = impair.ImpairmentProxy("127.0.0.1", port, profile=args.profile, seed=0,
+                                           event_log=args.event_log).start()
+            port = proxy.port
+        
+        import network
+        network.DEBUG_MODE = False  # Leave the game's own debug log alone
+        rng = random.Random(0)
+        clients = []
+        with contextlib.redirect_stdout(io.StringIO()):  # network.log() prints every send
+            for _ in range(args.clients):
+                # On TCP even with the proxy off: shared memory would skip the
+                # proxy (and isn't the network this measures)
+                client = network.Network("127.0.0.1", port, shared_memory=False)
+                if client.player_id is None:
+                    raise RuntimeError("A client could not join")
+                client.samples = []
+                client.link.on_sample = client.samples.append
+                client.snapshots = 0
+                client.longest_gap = 0.0
+                client.buttons = 0
+                clients.append(client)
+            
+            start = time.monotonic()
+            next_tick = start
+            while time.monotonic() - start < args.seconds:
+                for client in clients:
+                    if rng.random() < 0.1:
+                        client.buttons = rng.choice((0, 1, 2))
+                    tick = client.snapshot_tick
+                    gap = time.monotonic() - client.last_snapshot
+                    client.send_input(client.buttons)
+                    if client.snapshot_tick != tick:
+                        client.snapshots += 1
+                        client.longest_gap = max(client.longest_gap, gap)
+                next_tick += 1 / 60
+                time.sleep(max(0.0, next_tick - time.monotonic()))
+            for client in clients:
+                client.disconnect()
+    finally:
+        if proxy is not None:
+            proxy.close()
+        server.terminate()
+        server.wait()
+    
+    samples = sorted(rtt for client in clients for rtt in client.samples)
+    rates = [client.snapshots / args.seconds for client in clients]
+    print(f"{args.clients} clients for {args.seconds:g} s through profile {args.profile}:")
+    if samples:
+        print(f"  RTT: p50 {samples[len(samples) // 2] * 1000:.1f} ms, "
+              f"p95 {samples[int(len(samples) * 0.95)] * 1000:.1f} ms, max {samples[-1] * 1000:.1f} ms")
+    print(f"  New snapshots per second: min {min(rates):.1f}, mean {statistics.mean(rates):.1f}")
+    print(f"  Longest wait for a snapshot: {max(client.longest_gap for client in clients) * 1000:.0f} ms")
+    if args.event_log:
+        print(f"  What the proxy did is in {args.event_log} (python main.py --analyze-log {args.event_log})")
+
+def bench_ratings(args):
+    """Rating a match and querying the leaderboard, against re-sorting every player per query"""
+    import random
+    import ratings
+    
+    rng = random.Random(0)
+    table = ratings.Ratings()
+    table.load((f"player{i}", rng.gauss(ratings.DEFAULT_RATING, 200), 30, 15) for i in range(args.players))
+    names = list(table.players)
+    pairs = [rng.sample(names, 2) for _ in range(args.matches)]
+    
+    start = time.perf_counter()
+    for winner, loser in pairs:
+        table.record_match(winner, loser)
+    per_match = (time.perf_counter() - start) / args.matches
+    
+    start = time.perf_counter()
+    for winner, loser in pairs:
+        table.rank(winner)
+    per_rank = (time.perf_counter() - start) / args.matches
+    
+    start = time.perf_counter()
+    for _ in range(1000):
+        table.top(10)
+    per_top = (time.perf_counter() - start) / 1000
+    
+    start = time.perf_counter()
+    for _ in range(10):
+        ordered = sorted(table.players, key=lambda name: table.players[name][0], reverse=True)
+        ordered.index(names[0])
+    per_sort = (time.perf_counter() - start) / 10
+    
+    print(f"{args.players:,} players:")
+    print(f"  record_match(): {per_match * 1e6:.1f} us (rating and leaderboard update)")
+    print(f"  rank():         {per_rank * 1e6:.1f} us")
+    print(f"  top(10):        {per_top * 1e6:.1f} us")
+    print(f"  re-sorting every player instead: {per_sort * 1e3:.1f} ms per query")
+
+def yield_cpu():
+    """Let the other end run while spinning, even with a single CPU"""
+    if hasattr(os, "sched_yield"):
+        os.sched_yield()
+    else:
+        time.sleep(0)
+
+def echo_socket(port, count):
+    """Send back each message from the benchmark over a loopback TCP socket"""
+    import socket
+    from protocol import MessageBuffer, encode_message
+    inbox = MessageBuffer()
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        echoed = 0
+        while echoed < count:
+            inbox.feed(sock.recv(65536))
+            for message in inbox.messages():
+                sock.sendall(encode_message(message))
+                echoed += 1
+
+def echo_shm(name, count):
+    """Send back each message from the benchmark through its shared memory segment"""
+    import shmlink
+    from protocol import encode_message
+    link = shmlink.SharedMemoryLink(name)
+    echoed = 0
+    while echoed < count:
+        if not link.receive():
+            yield_cpu()  # Spin on the doorbell
+            continue
+        for message in link.inbox.messages():
+            link.send(encode_message(message))
+            echoed += 1
+    link.close()
+
+def bench_transport(args):
+    """Round trips of a snapshot to another process: loopback TCP against a shared memory ring"""
+    def start_echo(function, *args):
+        # A process of its own, not a multiprocessing child, which would
+        # share our resource tracker and so our claim on the segment
+        return subprocess.Popen([sys.executable, "-c", f"import benchmark; benchmark.{function}{args!r}"], cwd=HERE)
+    
+    import socket
+    import shmlink
+    from game_state import GameState
+    from protocol import MessageBuffer, encode_message, recv_message
+    
+    snapshot = ("state", 1, GameState(), (0, 0))
+    print(f"{args.round_trips:,} round trips of a {len(encode_message(snapshot))} byte snapshot "
+          f"(pickled and unpickled both ways)")
+    
+    def report(label, times):
+        times.sort()
+        print(f"{label:>14}: median {statistics.median(times) * 1e6:7.1f} us, "
+              f"p99 {times[int(len(times) * 0.99)] * 1e6:7.1f} us")
+    
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        echo = start_echo("echo_socket", listener.getsockname()[1], args.round_trips)
+        sock, _ = listener.accept()
+    with sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        inbox = MessageBuffer()
+        times = []
+        for _ in range(args.round_trips):
+            start = time.perf_counter()
+            sock.sendall(encode_message(snapshot))
+            recv_message(sock, inbox)
+            times.append(time.perf_counter() - start)
+    echo.wait()
+    report("TCP loopback", times)
+    
+    if not shmlink.supported():
+        print("Shared memory is not supported on this platform")
+        return
+    link = shmlink.SharedMemoryLink()
+    echo = start_echo("echo_shm", link.name, args.round_trips)
+    times = []
+    try:
+        for _ in range(args.round_trips):
+            start = time.perf_counter()
+            link.send(encode_message(snapshot))
+            while not link.receive():
+                yield_cpu()
+            next(link.inbox.messages())
+            times.append(time.perf_counter() - start)
+        echo.wait()
+    finally:
+        link.close()
+    report("shared memory", times)
+    print(f"(both ends spinning, yielding the CPU; in the game the server looks at the rings every "
+          f"{shmlink.SHM_POLL_INTERVAL * 1e3:g} ms and the client once a frame)")
+    
+    # What each transport costs the CPU on its own, with no other process to wait for
+    message = encode_message(snapshot)
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        sender = socket.create_connection(listener.getsockname())
+        receiver, _ = listener.accept()
+    with sender, receiver:
+        start = time.perf_counter()
+        for _ in range(args.round_trips):
+            sender.sendall(message)
+            receiver.recv(65536)
+        per_socket = (time.perf_counter() - start) / args.round_trips
+    link = shmlink.SharedMemoryLink()
+    try:
+        start = time.perf_counter()
+        for _ in range(args.round_trips):
+            link.outgoing.write(message)
+            link.outgoing.read()
+        per_ring = (time.perf_counter() - start) / args.round_trips
+    finally:
+        link.close()
+    print(f"Writing and reading one snapshot in one process: TCP {per_socket * 1e6:.1f} us, "
+          f"ring {per_ring * 1e6:.1f} us")
+
+def impair_profiles():
+    from impair import PROFILES
+    return PROFILES
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Ping Pong benchmarks")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+    
+    startup = benchmarks.add_parser("startup", help="client time-to-first-frame and import times")
+    startup.add_argument("--runs", type=int, default=5, help="client launches to time")
+    startup.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    startup.set_defaults(run=bench_startup)
+    
+    physics = benchmarks.add_parser("physics", help="server simulation ticks per second")
+    physics.add_argument("--steps", type=int, default=200000, help="ticks to simulate")
+    physics.set_defaults(run=bench_physics)
+    
+    bots = benchmarks.add_parser("bots", help="per-tick cost of server-hosted AI bots")
+    bots.add_argument("--ticks", type=int, default=60000, help="ticks to simulate per configuration")
+    bots.set_defaults(run=bench_bots)
+    
+    results = benchmarks.add_parser("results", help="match results store throughput")
+    results.add_argument("--matches", type=int, default=50000, help="match results to save")
+    results.set_defaults(run=bench_results)
+    
+    rollback = benchmarks.add_parser("rollback", help="P2P rollback state save/restore and replay cost")
+    rollback.add_argument("--frames", type=int, default=100000, help="frames to simulate")
+    rollback.set_defaults(run=bench_rollback)
+    
+    chaos = benchmarks.add_parser("chaos", help="chaos mode physics and broadphase scaling")
+    chaos.add_argument("--balls", type=int, nargs="+", default=[100, 250, 500, 1000, 2000, 5000],
+                       help="ball counts to measure")
+    chaos.add_argument("--ticks", type=int, default=200, help="ticks to time per count")
+    chaos.add_argument("--naive-max", type=int, default=2000, help="most balls to test every pair of")
+    chaos.set_defaults(run=bench_chaos)
+    
+    render = benchmarks.add_parser("render", help="gameplay drawing, per object vs batched with Surface.blits")
+    render.add_argument("--entities", type=int, nargs="+", default=[10, 100, 1000], help="objects on screen")
+    render.add_argument("--frames", type=int, default=600, help="frames to draw per measurement")
+    render.set_defaults(run=bench_render)
+    
+    net = benchmarks.add_parser("network", help="local clients and server through the impairment proxy")
+    net.add_argument("--profile", default="hotel-wifi", choices=sorted(impair_profiles()) + ["off"],
+                     help="network conditions (see impair.py; off = connect directly)")
+    net.add_argument("--clients", type=int, default=4, help="clients to run")
+    net.add_argument("--seconds", type=float, default=30, help="how long they play")
+    net.add_argument("--event-log", metavar="PATH", default=None, help="record what the proxy did")
+    net.set_defaults(run=bench_network)
+    
+    transport = benchmarks.add_parser("transport", help="snapshot round trips over TCP loopback and shared memory")
+    transport.add_argument("--round-trips", type=int, default=20000, help="round trips per transport")
+    transport.set_defaults(run=bench_transport)
+    
+    ratings = benchmarks.add_parser("ratings", help="rating updates and leaderboard queries")
+    ratings.add_argument("--players", type=int, default=100000, help="rated players")
+    ratings.add_argument("--matches", type=int, default=20000, help="matches to rate")
+    ratings.set_defaults(run=bench_ratings)
+    
+    env = benchmarks.add_parser("env", help="training environment steps per second")
+    env.add_argument("--envs", type=int, default=64, help="environments stepped per call")
+    env.add_argument("--frame-skip", type=int, default=4, help="game ticks per step")
+    env.add_argument("--seconds", type=float, default=3.0, help="how long to run each configuration")
+    env.set_defaults(run=bench_env)
+    
+    args = parser.parse_args(argv)
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -2,68 +2,199 @@ import os
 import sys
 import subprocess
 import platform
+import argparse
+import statistics
+import time
 
-def create_executable():
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# How each build mode packages the game. --onefile is a single file to hand
+# out, but every launch unpacks the whole bundle (Python, pygame, SDL) to a
+# temporary directory first, which takes seconds on a slow disk. --onedir
+# leaves it unpacked next to the executable, so a launch only maps what it
+# loads. It skips UPX too, since decompressing every library on each launch
+# is the same cost again.
+BUILD_MODES = {
+    "onefile": ["--onefile"],
+    "onedir": ["--onedir", "--noupx"],
+}
+
+# Modules the game never imports but PyInstaller would bundle anyway, since
+# something references them: the server's optional netifaces lookup (the
+# game runs servers from source) and the standard library's debugging
+# and test tooling
+EXCLUDED_MODULES = [
+    "netifaces",
+    "pdb",
+    "doctest",
+    "unittest",
+    "pydoc",
+    "cProfile",
+    "profile",
+    "pstats",
+    "tracemalloc",
+    "tkinter",
+]
+
+# Bytecode optimization level the bundled modules are compiled at (1 = like
+# python -O: asserts stripped, docstrings kept)
+OPTIMIZE = 1
+
+def executable_path(mode):
+    """Where a build mode's executable ends up"""
+    name = "PingPong.exe" if platform.system() == "Windows" else "PingPong"
+    if mode == "onedir":
+        return os.path.join(HERE, "dist", mode, "PingPong", name)
+    return os.path.join(HERE, "dist", mode, name)
+
+def create_executable(mode="onefile"):
     """Create standalone executable using PyInstaller"""
     try:
         # Check if PyInstaller is installed
         subprocess.check_call([sys.executable, "-m", "pip", "install", "pyinstaller"])
-        
+
         # Determine the appropriate icon for the platform
         icon_path = None
         if platform.system() == "Windows":
             icon_path = "pygame/pygame_icon.bmp"
         elif platform.system() == "Darwin":  # macOS
             icon_path = "pygame/pygame_icon.icns"
-        
-        # Set PyInstaller command arguments
+
+        # Set PyInstaller command arguments. Each mode gets its own output
+        # and work directories so both builds can sit side by side.
         pyinstaller_args = [
-            "pyinstaller",
-            "--onefile",
+            sys.executable, "-m", "PyInstaller",
+            *BUILD_MODES[mode],
             "--windowed",
+            "--noconfirm",
             "--name=PingPong",
-            "main.py"
+            f"--optimize={OPTIMIZE}",
+            f"--distpath={os.path.join(HERE, 'dist', mode)}",
+            f"--workpath={os.path.join(HERE, 'build', mode)}",
+            f"--specpath={os.path.join(HERE, 'build', mode)}",
         ]
-        
+        pyinstaller_args += [f"--exclude-module={module}" for module in EXCLUDED_MODULES]
+
+        # The expert AI's table, if it has been built (see ai_table.py)
+        table_path = os.path.join(HERE, "ai_table.bin")
+        if os.path.exists(table_path):
+            pyinstaller_args.append(f"--add-data={table_path}{os.pathsep}.")
+
         # Add icon if available
         if icon_path and os.path.exists(icon_path):
-            pyinstaller_args.append(f"--icon={icon_path}")
-        
+            pyinstaller_args.append(f"--icon={os.path.abspath(icon_path)}")
+
         # Execute PyInstaller
-        subprocess.check_call(pyinstaller_args)
-        
+        subprocess.check_call(pyinstaller_args + [os.path.join(HERE, "main.py")], cwd=HERE)
+
         print("Build completed successfully!")
-        print(f"Executable can be found in the 'dist' directory:")
-        print("- PingPong (Game with single player and multiplayer modes)")
-        
+        print(f"Executable can be found in the 'dist/{mode}' directory:")
+        print(f"- {os.path.relpath(executable_path(mode), HERE)} (Game with single player and multiplayer modes)")
+
     except Exception as e:
         print(f"Error creating executable: {e}")
         return False
-    
+
     return True
 
+def time_launch(command, timeout=60):
+    """Seconds from starting command until it reports its first frame, or None if it never does
+
+    Counted from before the process exists, so it includes everything a
+    player waits through: the bootloader, unpacking (for --onefile),
+    the interpreter, imports and opening the window. The game quits
+    right after that frame.
+    """
+    import benchmark
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=HERE, env=benchmark.headless_env(),
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    elapsed = None
+    try:
+        for line in process.stdout:
+            if line.startswith("First frame after"):
+                elapsed = time.perf_counter() - start
+                break
+        process.stdout.close()
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return elapsed
+
+def benchmark_launches(runs=5):
+    """Time process start to first frame for running from source and each build mode that has been built"""
+    launchers = [("source", [sys.executable, os.path.join(HERE, "main.py")])]
+    for mode in BUILD_MODES:
+        path = executable_path(mode)
+        if os.path.exists(path):
+            launchers.append((mode, [path]))
+        else:
+            print(f"{mode}: not built (python build.py --mode {mode})")
+
+    print(f"Process start to first frame over {runs} launches (SDL dummy driver):")
+    for label, command in launchers:
+        times = [time_launch(command + ["--exit-after-first-frame"]) for _ in range(runs)]
+        times = [seconds for seconds in times if seconds is not None]
+        if not times:
+            # --windowed executables have no stdout on Windows to report through
+            print(f"  {label:>8}: no first frame reported")
+            continue
+        print(f"  {label:>8}: median {statistics.median(times) * 1000:7.1f} ms, "
+              f"best {min(times) * 1000:7.1f} ms")
+
 def create_requirements():
     """Create requirements.txt file for easy installation of dependencies"""
     with open("requirements.txt", "w") as f:
         f.write("pygame>=2.0.0\n")
     print("Created requirements.txt file")
 
-def main():
+def menu():
     print("==== Ping Pong Game Build Utility ====")
-    print("1. Create executable (requires PyInstaller)")
-    print("2. Generate requirements.txt")
-    print("3. Exit")
-    
-    choice = input("Enter your choice (1-3): ")
-    
+    print("1. Create one-file executable (requires PyInstaller)")
+    print("2. Create one-directory executable (starts faster, requires PyInstaller)")
+    print("3. Time launches of the built executables")
+    print("4. Generate requirements.txt")
+    print("5. Exit")
+
+    choice = input("Enter your choice (1-5): ")
+
     if choice == "1":
-        create_executable()
+        create_executable("onefile")
     elif choice == "2":
-        create_requirements()
+        create_executable("onedir")
     elif choice == "3":
+        benchmark_launches()
+    elif choice == "4":
+        create_requirements()
+    elif choice == "5":
         print("Exiting...")
     else:
         print("Invalid choice. Please try again.")
 
+def main(argv=None, prog=None):
+    """Build without questions when given options, otherwise show the menu"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        menu()
+        return
+
+    parser = argparse.ArgumentParser(prog=prog, description="Build standalone Ping Pong executables")
+    parser.add_argument("--mode", choices=sorted(BUILD_MODES) + ["all"], default=None,
+                        help="build this mode: onefile (one file, unpacks itself on every launch), "
+                             "onedir (a directory, starts faster) or all")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time process start to first frame of each built mode (after building, with --mode)")
+    parser.add_argument("--runs", type=int, default=5, help="launches to time per mode")
+    args = parser.parse_args(argv)
+    if args.mode is None and not args.benchmark:
+        parser.error("give --mode, --benchmark or both")
+
+    for mode in (BUILD_MODES if args.mode == "all" else [args.mode] if args.mode else []):
+        if not create_executable(mode):
+            sys.exit(1)
+    if args.benchmark:
+        benchmark_launches(args.runs)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,210 @@
+import operator
+from array import array
+from itertools import combinations
+
+from game_state import DEFAULT_CONFIG, INPUT_UP, INPUT_DOWN, PADDLE_SPEED, MatchRandom
+
+# Chaos mode: hundreds of balls at once, bouncing off the walls, the
+# paddles and each other. Every ball that gets past a paddle is a point.
+#
+# The balls live in flat arrays of floats (positions and speeds), not in
+# one object each, so moving them all is one bulk pass over the arrays.
+# Ball-ball collisions come from a spatial hash: a grid of ball-sized
+# cells, so two touching balls are always in the same or neighbouring
+# cells and only those pairs are tested. That's a few candidate pairs per
+# ball instead of every pair, O(n) rather than O(n²).
+
+CHAOS_BALLS = 500
+BALL_SIZE = 10
+WIN_SCORE = 1000
+SERVE_SPREAD = 100  # Served balls start up to this far either side of the center line
+
+class ChaosGame:
+    """A chaos match: two paddles and count balls of ball_size, first to win_score points (0 = endless)
+
+    xs, ys (top left corners) and speed_xs, speed_ys hold ball i at index
+    i. Nothing else refers to a ball, so the arrays are the whole state.
+    """
+
+    def __init__(self, count=CHAOS_BALLS, config=DEFAULT_CONFIG, seed=None, ball_size=BALL_SIZE,
+                 win_score=WIN_SCORE):
+        self.config = config
+        self.win_score = win_score
+        self.rng = MatchRandom(seed)
+        self.count = count
+        self.ball_size = ball_size
+
+        # Grid cells are ball_size square, with a spare column so that
+        # neighbours off the right edge never alias real cells of the next row
+        self.columns = config.width // ball_size + 2
+
+        self.xs = array("d", [0.0]) * count
+        self.ys = array("d", [0.0]) * count
+        self.speed_xs = array("d", [0.0]) * count
+        self.speed_ys = array("d", [0.0]) * count
+
+        self.left_paddle_y = config.height // 2 - config.paddle_height // 2
+        self.right_paddle_y = self.left_paddle_y
+
+        # Candidate pairs the broadphase found and collisions, last tick
+        self.pair_checks = 0
+        self.collisions = 0
+        self.start_game()
+
+    def start_game(self):
+        self.left_score = 0
+        self.right_score = 0
+        self.winner = 0  # 1 = left, 2 = right
+        for i in range(self.count):
+            self.serve(i)
+
+    def serve(self, i):
+        """Put ball i back near the center line, heading for either side"""
+        config = self.config
+        rng = self.rng
+        self.xs[i] = config.width // 2 - self.ball_size // 2 + rng.randint(-SERVE_SPREAD, SERVE_SPREAD)
+        self.ys[i] = rng.randint(0, config.height - self.ball_size)
+        self.speed_xs[i] = (2 + 3 * rng.random()) * rng.choice((-1, 1))
+        self.speed_ys[i] = 6 * rng.random() - 3
+
+    def step_paddle(self, paddle_y, buttons):
+        if buttons & INPUT_UP:
+            paddle_y -= PADDLE_SPEED
+        if buttons & INPUT_DOWN:
+            paddle_y += PADDLE_SPEED
+        return max(0, min(self.config.height - self.config.paddle_height, paddle_y))
+
+    def step(self, left_buttons, right_buttons):
+        """Advance one tick with both players' buttons"""
+        self.left_paddle_y = self.step_paddle(self.left_paddle_y, left_buttons)
+        self.right_paddle_y = self.step_paddle(self.right_paddle_y, right_buttons)
+        if self.winner:
+            return
+        self.move_balls()
+        self.collide(self.grid_pairs())
+
+    def move_balls(self):
+        config = self.config
+        size = self.ball_size
+        bottom = config.height - size
+        paddle_width = config.paddle_width
+        paddle_height = config.paddle_height
+
+        # Every ball at once
+        self.xs = xs = array("d", map(operator.add, self.xs, self.speed_xs))
+        self.ys = ys = array("d", map(operator.add, self.ys, self.speed_ys))
+        speed_xs = self.speed_xs
+        speed_ys = self.speed_ys
+
+        # Walls
+        for i in [i for i, y in enumerate(ys) if y <= 0 or y >= bottom]:
+            ys[i] = 0 if ys[i] <= 0 else bottom
+            speed_ys[i] = -speed_ys[i]
+
+        # Paddles and scoring; only balls near either end need a look
+        left_face = 50 + paddle_width
+        right_face = config.width - 50 - paddle_width - size
+        for i in [i for i, x in enumerate(xs) if x <= left_face or x >= right_face]:
+            x = xs[i]
+            y = ys[i]
+            if x <= left_face and x + size >= 50 and speed_xs[i] < 0 and (
+                    self.left_paddle_y - size <= y <= self.left_paddle_y + paddle_height):
+                # As in GameState: the return angle depends on where it hit
+                speed_ys[i] = (y + size / 2 - self.left_paddle_y - paddle_height / 2) / (paddle_height / 2) * 5
+                speed_xs[i] = -speed_xs[i]
+                xs[i] = left_face + 1
+            elif x >= right_face and x <= config.width - 50 and speed_xs[i] > 0 and (
+                    self.right_paddle_y - size <= y <= self.right_paddle_y + paddle_height):
+                speed_ys[i] = (y + size / 2 - self.right_paddle_y - paddle_height / 2) / (paddle_height / 2) * 5
+                speed_xs[i] = -speed_xs[i]
+                xs[i] = right_face - 1
+            elif x <= 0:
+                self.right_score += 1
+                self.serve(i)
+            elif x + size >= config.width:
+                self.left_score += 1
+                self.serve(i)
+
+        if not self.win_score:
+            return
+        if self.left_score >= self.win_score:
+            self.winner = 1
+        elif self.right_score >= self.win_score:
+            self.winner = 2
+
+    def grid_pairs(self):
+        """Pairs of balls (i, j) in the same or neighbouring grid cells: the broadphase"""
+        size = self.ball_size
+        columns = self.columns
+        grid = {}
+        for i, cell in enumerate([int(x // size) + int(y // size) * columns for x, y in zip(self.xs, self.ys)]):
+            members = grid.get(cell)
+            if members is None:
+                grid[cell] = [i]
+            else:
+                members.append(i)
+
+        # Each cell against itself and the four neighbours after it (right,
+        # and the three below), so every neighbouring pair comes up once
+        pairs = []
+        get = grid.get
+        for cell, members in grid.items():
+            if len(members) > 1:
+                pairs += combinations(members, 2)
+            for neighbour in (cell + 1, cell + columns - 1, cell + columns, cell + columns + 1):
+                others = get(neighbour)
+                if others is not None:
+                    pairs += [(i, j) for i in members for j in others]
+        return pairs
+
+    def all_pairs(self):
+        """Every pair of balls: what the broadphase saves testing"""
+        return combinations(range(self.count), 2)
+
+    def collide(self, pairs):
+        """Bounce apart every candidate pair that touches and is closing in"""
+        xs = self.xs
+        ys = self.ys
+        speed_xs = self.speed_xs
+        speed_ys = self.speed_ys
+        touching = self.ball_size * self.ball_size
+        checks = collisions = 0
+        for i, j in pairs:
+            checks += 1
+            dx = xs[j] - xs[i]
+            dy = ys[j] - ys[i]
+            distance = dx * dx + dy * dy
+            if distance >= touching or distance == 0:
+                continue
+            closing = (speed_xs[j] - speed_xs[i]) * dx + (speed_ys[j] - speed_ys[i]) * dy
+            if closing >= 0:
+                continue  # Already moving apart
+            # Equal masses: they swap their speeds along the line between them
+            k = closing / distance
+            speed_xs[i] += k * dx
+            speed_ys[i] += k * dy
+            speed_xs[j] -= k * dx
+            speed_ys[j] -= k * dy
+            collisions += 1
+        self.pair_checks = checks
+        self.collisions = collisions
+
+    def ai_buttons(self, side):
+        """Buttons for a simple opponent on side (0 = left): chase the nearest ball coming its way"""
+        xs = self.xs
+        if side == 0:
+            coming = [i for i, speed in enumerate(self.speed_xs) if speed < 0]
+            nearest = min(coming, key=xs.__getitem__, default=None)
+            paddle_y = self.left_paddle_y
+        else:
+            coming = [i for i, speed in enumerate(self.speed_xs) if speed > 0]
+            nearest = max(coming, key=xs.__getitem__, default=None)
+            paddle_y = self.right_paddle_y
+        if nearest is None:
+            return 0
+        offset = self.ys[nearest] + self.ball_size / 2 - (paddle_y + self.config.paddle_height / 2)
+        if offset < -PADDLE_SPEED:
+            return INPUT_UP
+        if offset > PADDLE_SPEED:
+            return INPUT_DOWN
+        return 0
@@ -0,0 +1,1143 @@
+import pygame
+from pygame.locals import *
+import sys
+import time
+
+import ai
+from game_state import MatchRandom
+from render import SpriteBatch
+
+# Screen size
+width = 800
+height = 600
+
+# Display, fonts and clock are created by init_display() when the game starts,
+# so importing this module never opens a window
+screen = None
+font = None
+small_font = None
+clock = None
+sprites = None  # render.SpriteBatch every gameplay frame is drawn with
+
+# Define colors
+black = (0, 0, 0)
+white = (255, 255, 255)
+gray = (150, 150, 150)
+green = (0, 255, 0)
+yellow = (255, 255, 0)
+red = (255, 0, 0)
+
+# Physics settings
+ball_base_speed = 5  # Base ball speed (will be modified by settings)
+ball_speed_multiplier = 1.0  # Multiplier for ball speed
+gravity_enabled = False  # Option to enable gravity
+bounce_dampening = 1.0  # How much energy is retained on bounce (1.0 = perfect bounce)
+paddle_rebound_strength = 1.0  # How strongly paddles affect ball trajectory
+
+# Timing: the game is simulated in fixed ticks, however fast frames are drawn.
+# Frames between two ticks show the paddles and ball interpolated between them
+SIM_RATE = 60  # Simulation ticks per second; all speeds are per tick
+SIM_DT = 1 / SIM_RATE
+MAX_FRAME_TIME = 0.25  # Longer stalls (e.g. dragging the window) aren't caught up
+SNAP_DISTANCE = 50  # Pixels moved in one tick beyond which nothing is interpolated
+
+# Create paddles
+paddle_width = 20
+paddle_height = 100
+left_paddle = pygame.Rect(50, height//2 - paddle_height//2, paddle_width, paddle_height)
+right_paddle = pygame.Rect(width - 50 - paddle_width, height//2 - paddle_height//2, paddle_width, paddle_height)
+
+# Serves and the AI's random moves come from one generator, reseeded when
+# each match starts: from match_seed if one was given (--seed), so the same
+# seed and the same key presses replay the same match
+match_rng = MatchRandom()
+match_seed = None
+
+# Create ball
+ball_size = 20
+ball = pygame.Rect(width//2 - ball_size//2, height//2 - ball_size//2, ball_size, ball_size)
+
+# Set initial ball speed
+ball_speed_x = ball_base_speed * ball_speed_multiplier * match_rng.choice([-1, 1])
+ball_speed_y = match_rng.randint(-int(ball_base_speed), int(ball_base_speed)) * ball_speed_multiplier
+
+# Initialize dragging flags
+dragging_speed = False
+dragging_bounce = False
+dragging_rebound = False
+
+# Set scores
+left_score = 0
+right_score = 0
+
+# Game state variables
+game_over = False
+winner = ""
+game_started = False
+paused = False
+settings_screen = False
+leaderboard_screen = False
+practice_mode = False
+difficulty = "medium"  # Default difficulty
+
+# Statistics of the match being played (results.MatchStats) and where
+# finished matches are saved, opened when the first one ends
+match_stats = None
+results_store = None
+
+# Who is playing (set by run()) and the local ratings (ratings.Ratings),
+# loaded from results.db when first needed. Matches against the AI are
+# rated, with each difficulty rated as a player of its own
+player_name = None
+local_ratings = None
+
+# Physics settings
+ball_base_speed = 5  # Base ball speed (will be modified by settings)
+ball_speed_multiplier = 1.0  # Multiplier for ball speed
+gravity_enabled = False  # Option to enable gravity
+bounce_dampening = 1.0  # How much energy is retained on bounce (1.0 = perfect bounce)
+paddle_rebound_strength = 1.0  # How strongly paddles affect ball trajectory
+
+# Function to reset the ball to the center
+def reset_ball():
+    global ball_speed_x, ball_speed_y
+    ball.center = (width//2, height//2)
+    ball_speed_x = ball_base_speed * ball_speed_multiplier * match_rng.choice([-1, 1])
+    ball_speed_y = match_rng.randint(-int(ball_base_speed), int(ball_base_speed)) * ball_speed_multiplier
+    
+# Function to open the window and build the fonts
+def init_display():
+    global screen, font, small_font, clock, sprites
+    pygame.init()
+    screen = pygame.display.set_mode((width, height))
+    pygame.display.set_caption("Ping Pong")
+    
+    # Set up font for text rendering
+    font = pygame.font.Font(None, 74)
+    small_font = pygame.font.Font(None, 36)
+    clock = pygame.time.Clock()
+    sprites = SpriteBatch()
+
+# Function to run multiplayer mode
+def run_multiplayer_mode():
+    # The networking stack is only loaded once Multiplayer is chosen
+    from network import ConnectAttempt
+    from game_state import INPUT_UP, INPUT_DOWN
+    from discovery import ServerBrowser
+    
+    # Set up fonts for the multiplayer mode
+    multiplayer_font = pygame.font.Font(None, 74)
+    multiplayer_small_font = pygame.font.Font(None, 36)
+    
+    # Ask for server IP if not localhost
+    server_ip = "localhost"  # Default to localhost
+    server_port = 5555
+    server_addresses = []  # Other addresses the chosen server answered discovery from
+    
+    # Look for servers on the LAN while the player decides
+    browser = ServerBrowser()
+    discovered = []
+    selected = 0
+    server_rows = []
+    
+    # Get IP input
+    ip_input = ""
+    ip_active = True
+    pygame.key.set_repeat(500, 50)
+    
+    while ip_active:
+        discovered = browser.poll()
+        selected = min(selected, max(len(discovered) - 1, 0))
+        
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                browser.close()
+                pygame.quit()
+                sys.exit()
+                
+            if event.type == KEYDOWN:
+                if event.key == K_RETURN:
+                    if ip_input.strip() != "":
+                        server_ip = ip_input.strip()
+                        # A typed address of a discovered server can race its other addresses
+                        for info in discovered:
+                            if server_ip in info["addresses"]:
+                                server_addresses = info["addresses"]
+                    elif discovered:
+                        # Empty input joins the highlighted server
+                        server_ip = discovered[selected]["address"]
+                        server_port = discovered[selected]["port"]
+                        server_addresses = discovered[selected]["addresses"]
+                    ip_active = False
+                elif event.key == K_ESCAPE:
+                    browser.close()
+                    return
+                elif event.key == K_UP and discovered:
+                    selected = (selected - 1) % len(discovered)
+                elif event.key == K_DOWN and discovered:
+                    selected = (selected + 1) % len(discovered)
+                elif event.key == K_BACKSPACE:
+                    ip_input = ip_input[:-1]
+                else:
+                    # Only allow valid IP characters
+                    if event.unicode.isdigit() or event.unicode == '.' or event.unicode.isalpha():
+                        ip_input += event.unicode
+            
+            if event.type == MOUSEBUTTONDOWN:
+                for i, row in enumerate(server_rows):
+                    if row.collidepoint(event.pos) and i < len(discovered):
+                        server_ip = discovered[i]["address"]
+                        server_port = discovered[i]["port"]
+                        server_addresses = discovered[i]["addresses"]
+                        ip_active = False
+        
+        # Redraw the whole dialog every frame since the server list is live
+        screen.fill(black)
+        title_text = multiplayer_font.render("Multiplayer Setup", True, white)
+        screen.blit(title_text, (width//2 - title_text.get_width()//2, height//8))
+        
+        y_offset = height//8 + 80
+        if discovered:
+            list_text = multiplayer_small_font.render("Servers on your network (click, or arrows + Enter):", True, white)
+        else:
+            list_text = multiplayer_small_font.render("Searching for servers on your network...", True, (200, 200, 200))
+        screen.blit(list_text, (width//2 - list_text.get_width()//2, y_offset))
+        y_offset += 40
+        
+        # Discovered servers, least loaded first
+        server_rows = []
+        for i, info in enumerate(discovered[:5]):
+            row = pygame.Rect(width//2 - 250, y_offset, 500, 34)
+            server_rows.append(row)
+            row_color = (0, 255, 255) if i == selected else (200, 200, 200)
+            pygame.draw.rect(screen, row_color, row, 1 if i != selected else 2)
+            players = info.get("players", 0)
+            capacity = 2 * info.get("max_rooms", 1)
+            row_text = multiplayer_small_font.render(
+                f"{info.get('name', '?')}  {info['address']}:{info['port']}  {players}/{capacity} players",
+                True, row_color)
+            screen.blit(row_text, (row.x + 8, row.y + 6))
+            y_offset += 40
+        
+        y_offset = max(y_offset, height//2) + 20
+        instruction_text = multiplayer_small_font.render("Or type a server IP (Enter alone = selected / localhost):", True, white)
+        screen.blit(instruction_text, (width//2 - instruction_text.get_width()//2, y_offset))
+        
+        # Display connection explanations with more spacing
+        connect_text = multiplayer_small_font.render("For same computer: use 'localhost'   ESC: back", True, (200, 200, 200))
+        screen.blit(connect_text, (width//2 - connect_text.get_width()//2, y_offset + 35))
+        
+        # Redraw input box
+        input_rect = pygame.Rect(width//2 - 140, y_offset + 80, 280, 40)
+        pygame.draw.rect(screen, white, input_rect)
+        text_surface = multiplayer_small_font.render(ip_input, True, black)
+        screen.blit(text_surface, (input_rect.x + 5, input_rect.y + 5))
+        
+        pygame.display.flip()
+        clock.tick(30)
+    
+    browser.close()
+    print(f"Connecting to server: {server_ip}")
+    
+    # Connect to the chosen server (standard port 5555 unless discovery said otherwise)
+    # in the background, racing all of its known addresses
+    attempt = ConnectAttempt(server_ip, server_port,
+                             [address for address in server_addresses if address != server_ip], player_name)
+    status_font = multiplayer_small_font
+    connect_start = time.time()
+    
+    # Connection status display, kept responsive until the attempt finishes
+    while not attempt.done:
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                attempt.cancel()
+                pygame.quit()
+                sys.exit()
+            if event.type == KEYDOWN and event.key == K_ESCAPE:
+                attempt.cancel()
+                return
+        
+        screen.fill(black)
+        dots = "." * (int((time.time() - connect_start) * 3) % 4)
+        connecting_text = status_font.render(f"Connecting to {server_ip}{dots}", True, white)
+        screen.blit(connecting_text, (width//2 - connecting_text.get_width()//2, height//2 - 40))
+        status_text = status_font.render(attempt.status, True, (200, 200, 200))
+        screen.blit(status_text, (width//2 - status_text.get_width()//2, height//2))
+        cancel_text = status_font.render("Press ESC to cancel", True, gray)
+        screen.blit(cancel_text, (width//2 - cancel_text.get_width()//2, height//2 + 60))
+        pygame.display.flip()
+        clock.tick(30)
+    
+    n = attempt.network
+    player_id = n.player_id if n is not None else None
+    
+    if player_id is None:
+        # Display connection error and wait before returning
+        error_text = status_font.render("Failed to connect to server.", True, (255, 100, 100))
+        hint_text = status_font.render("Check IP address and ensure server is running.", True, (255, 200, 100))
+        back_text = status_font.render("Press any key to return to menu...", True, white)
+        
+        screen.fill(black)
+        screen.blit(error_text, (width//2 - error_text.get_width()//2, height//2 - 50))
+        screen.blit(hint_text, (width//2 - hint_text.get_width()//2, height//2))
+        screen.blit(back_text, (width//2 - back_text.get_width()//2, height//2 + 100))
+        pygame.display.flip()
+        
+        # Wait for keypress before returning
+        waiting = True
+        while waiting:
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    pygame.quit()
+                    sys.exit()
+                if event.type == KEYDOWN:
+                    waiting = False
+        
+        return
+        
+    # Success message
+    success_text = status_font.render(f"Connected to server as Player {player_id+1}", True, (100, 255, 100))
+    ready_text = status_font.render("Sending ready signal...", True, white)
+    screen.fill(black)
+    screen.blit(success_text, (width//2 - success_text.get_width()//2, height//2 - 25))
+    screen.blit(ready_text, (width//2 - ready_text.get_width()//2, height//2 + 25))
+    pygame.display.flip()
+    
+    print(f"Connected to server as Player {player_id}")
+    
+    # Tell server we're ready
+    game_state = n.send("ready")
+    if game_state is None:
+        # Display communication error
+        error_text = status_font.render("Failed to communicate with server", True, (255, 100, 100))
+        back_text = status_font.render("Press any key to return to menu...", True, white)
+        
+        screen.fill(black)
+        screen.blit(error_text, (width//2 - error_text.get_width()//2, height//2))
+        screen.blit(back_text, (width//2 - back_text.get_width()//2, height//2 + 100))
+        pygame.display.flip()
+        
+        # Wait for keypress before returning
+        waiting = True
+        while waiting:
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    pygame.quit()
+                    sys.exit()
+                if event.type == KEYDOWN:
+                    waiting = False
+                    
+        n.disconnect()
+        return
+        
+    # Waiting for opponent screen
+    if game_state.winner == "" and not game_state.game_active:
+        waiting_text = status_font.render("Connected! Waiting for opponent...", True, (100, 255, 100))
+        screen.fill(black)
+        screen.blit(waiting_text, (width//2 - waiting_text.get_width()//2, height//2))
+        pygame.display.flip()
+    
+    # Main game loop for multiplayer
+    multiplayer_running = True
+    multiplayer_clock = pygame.time.Clock()
+    
+    while multiplayer_running:
+        # Handle events
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                multiplayer_running = False
+            if event.type == KEYDOWN:
+                if event.key == K_ESCAPE:
+                    multiplayer_running = False
+                if event.key == K_r and game_state.winner:  # Restart after game over
+                    # Show restart message
+                    restart_msg = multiplayer_small_font.render("Restarting game...", True, (100, 255, 100))
+                    screen.fill(black)
+                    screen.blit(restart_msg, (width//2 - restart_msg.get_width()//2, height//2))
+                    pygame.display.flip()
+                    
+                    # Send restart command (the next frame's send catches a lost link)
+                    game_state = n.send("restart") or game_state
+                    
+                    # Force a small delay to ensure the game restarts properly
+                    pygame.time.delay(200)
+        
+        # Get paddle movement from keyboard; the server moves the paddle
+        buttons = 0
+        keys = pygame.key.get_pressed()
+        if keys[K_UP]:
+            buttons |= INPUT_UP
+        if keys[K_DOWN]:
+            buttons |= INPUT_DOWN
+            
+        # Send this frame's input to server. While the connection is being
+        # resumed this returns None and we keep drawing the last state.
+        latest_state = n.send_input(buttons)
+        if latest_state is not None:
+            game_state = latest_state
+        elif not n.reconnecting():
+            print("Lost connection to server")
+            break
+            
+        # Draw everything
+        screen.fill(black)
+        
+        # Draw paddles based on game state, ours where our inputs will put it
+        left_paddle_y = game_state.left_paddle_y
+        right_paddle_y = game_state.right_paddle_y
+        if player_id == 0:
+            left_paddle_y = n.predicted_paddle_y()
+        else:
+            right_paddle_y = n.predicted_paddle_y()
+        # Highlight the player's paddle in cyan
+        sprites.rect((0, 255, 255) if player_id == 0 else white, 50, left_paddle_y,
+                     game_state.paddle_width, game_state.paddle_height)
+        sprites.rect((0, 255, 255) if player_id == 1 else white, width - 50 - game_state.paddle_width,
+                     right_paddle_y, game_state.paddle_width, game_state.paddle_height)
+            
+        # Draw ball
+        sprites.rect(white, game_state.ball_x, game_state.ball_y, game_state.ball_size, game_state.ball_size)
+        
+        # Draw scores
+        sprites.draw_text(multiplayer_font, str(game_state.left_score), white, width//4, 10)
+        sprites.draw_text(multiplayer_font, str(game_state.right_score), white, 3*width//4, 10)
+        
+        # Draw player info
+        if player_id == 0:
+            sprites.draw_text(multiplayer_small_font, "You are Player 1 (Left)", (0, 255, 255), None, 10)
+        else:
+            sprites.draw_text(multiplayer_small_font, "You are Player 2 (Right)", (0, 255, 255), None, 10)
+
+        # Connection quality, measured by ping exchanges with the server
+        link_text = sprites.text(multiplayer_small_font, n.link.describe(), (150, 150, 150))
+        sprites.blit(link_text, (10, height - link_text.get_height() - 10))
+
+        # Show game status or winner
+        if n.reconnecting():
+            sprites.draw_text(multiplayer_small_font, "Connection lost - reconnecting...", yellow, None, height//2)
+        elif not game_state.game_active and not game_state.winner:
+            sprites.draw_text(multiplayer_small_font, "Waiting for players to connect...", yellow, None, height//2)
+        elif game_state.winner:
+            sprites.draw_text(multiplayer_font, game_state.winner, white, None, height//2 - 50)
+            sprites.draw_text(multiplayer_small_font, "Press R to restart", white, None, height//2 + 50)
+        
+        sprites.draw(screen)
+        pygame.display.flip()
+        multiplayer_clock.tick(60)
+    
+    # Disconnect from server
+    n.disconnect()
+
+# Function to run a peer-to-peer match: host it when join_host is None,
+# else join the peer hosting at join_host
+def run_p2p_mode(join_host=None, port=None, input_delay=None):
+    # Only loaded for P2P matches, like the server networking stack
+    import rollback
+    from game_state import INPUT_UP, INPUT_DOWN
+    
+    p2p_font = pygame.font.Font(None, 74)
+    p2p_small_font = pygame.font.Font(None, 36)
+    port = port or rollback.P2P_PORT
+    input_delay = rollback.INPUT_DELAY if input_delay is None else input_delay
+    
+    try:
+        handshake = rollback.P2PHandshake(join_host, port, input_delay)
+    except OSError as e:
+        print(f"Could not start the P2P match: {e}")
+        return
+    
+    # Wait for the other peer, keeping the window responsive
+    session = None
+    while session is None:
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                handshake.cancel()
+                pygame.quit()
+                sys.exit()
+            if event.type == KEYDOWN and event.key == K_ESCAPE:
+                handshake.cancel()
+                return
+        session = handshake.poll()
+        
+        screen.fill(black)
+        status_text = p2p_small_font.render(handshake.status, True, red if handshake.failed else white)
+        screen.blit(status_text, (width//2 - status_text.get_width()//2, height//2 - 20))
+        cancel_text = p2p_small_font.render("Press ESC to go back", True, gray)
+        screen.blit(cancel_text, (width//2 - cancel_text.get_width()//2, height//2 + 40))
+        pygame.display.flip()
+        clock.tick(30)
+    
+    print(f"P2P match started as Player {session.side + 1}")
+    p2p_running = True
+    while p2p_running:
+        for event in pygame.event.get():
+            if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                p2p_running = False
+        
+        buttons = 0
+        keys = pygame.key.get_pressed()
+        if keys[K_UP]:
+            buttons |= INPUT_UP
+        if keys[K_DOWN]:
+            buttons |= INPUT_DOWN
+        if keys[K_r]:
+            buttons |= rollback.INPUT_RESTART
+        
+        # One frame per tick of the clock; it waits instead if the peer is behind
+        session.advance(buttons)
+        if session.disconnected:
+            print(session.disconnected)
+            break
+        
+        # Draw the match, converting from subpixels
+        game = session.game
+        config = game.config
+        screen.fill(black)
+        sprites.rect((0, 255, 255) if session.side == 0 else white, 50, game.left_paddle_y // rollback.SUBPIXELS,
+                     config.paddle_width, config.paddle_height)
+        sprites.rect((0, 255, 255) if session.side == 1 else white, width - 50 - config.paddle_width,
+                     game.right_paddle_y // rollback.SUBPIXELS, config.paddle_width, config.paddle_height)
+        sprites.rect(white, game.ball_x // rollback.SUBPIXELS, game.ball_y // rollback.SUBPIXELS,
+                     config.ball_size, config.ball_size)
+        
+        sprites.draw_text(p2p_font, str(game.left_score), white, width//4, 10)
+        sprites.draw_text(p2p_font, str(game.right_score), white, 3*width//4, 10)
+        sprites.draw_text(p2p_small_font, f"P2P: you are Player {session.side + 1} "
+                                          f"({'Left' if session.side == 0 else 'Right'})", (0, 255, 255), None, 10)
+        link_text = sprites.text(p2p_small_font, session.describe(), (150, 150, 150))
+        sprites.blit(link_text, (10, height - link_text.get_height() - 10))
+        
+        if game.winner:
+            sprites.draw_text(p2p_font, f"Player {game.winner} Wins!", white, None, height//2 - 50)
+            sprites.draw_text(p2p_small_font, "Press R to restart", white, None, height//2 + 50)
+        
+        sprites.draw(screen)
+        pygame.display.flip()
+        clock.tick(rollback.RollbackSession.FRAME_RATE)
+    
+    session.close()
+
+def run_chaos_mode(balls=None):
+    """Chaos mode: you (left) against a simple AI with hundreds of balls in play"""
+    import chaos
+    from game_state import INPUT_UP, INPUT_DOWN
+
+    chaos_font = pygame.font.Font(None, 74)
+    chaos_small_font = pygame.font.Font(None, 36)
+    game = chaos.ChaosGame(balls or chaos.CHAOS_BALLS, seed=match_seed)
+    size = game.ball_size
+    config = game.config
+
+    accumulator = 0.0
+    last_frame_at = time.perf_counter()
+    chaos_running = True
+    while chaos_running:
+        now = time.perf_counter()
+        accumulator += min(now - last_frame_at, MAX_FRAME_TIME)
+        last_frame_at = now
+
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                pygame.quit()
+                sys.exit()
+            if event.type == KEYDOWN:
+                if event.key in (K_ESCAPE, K_h):
+                    chaos_running = False
+                if event.key == K_r and game.winner:
+                    game.start_game()
+
+        buttons = 0
+        keys = pygame.key.get_pressed()
+        if keys[K_UP] or keys[K_w]:
+            buttons |= INPUT_UP
+        if keys[K_DOWN] or keys[K_s]:
+            buttons |= INPUT_DOWN
+        while accumulator >= SIM_DT:
+            game.step(buttons, game.ai_buttons(1))
+            accumulator -= SIM_DT
+
+        screen.fill(black)
+        sprites.rect(white, 50, game.left_paddle_y, config.paddle_width, config.paddle_height)
+        sprites.rect(white, width - 50 - config.paddle_width, game.right_paddle_y,
+                     config.paddle_width, config.paddle_height)
+        sprites.rects(yellow, zip(game.xs, game.ys), size, size)
+
+        sprites.draw_text(chaos_font, str(game.left_score), white, width//4, 10)
+        sprites.draw_text(chaos_font, str(game.right_score), white, 3*width//4, 10)
+        info_text = sprites.text(chaos_small_font, f"Chaos: {game.count} balls, {clock.get_fps():.0f} FPS", gray)
+        sprites.blit(info_text, (10, height - info_text.get_height() - 10))
+
+        if game.winner:
+            sprites.draw_text(chaos_font, "You Win!" if game.winner == 1 else "AI Wins!", white, None, height//2 - 50)
+            sprites.draw_text(chaos_small_font, "Press R to restart, H for home", white, None, height//2 + 50)
+
+        sprites.draw(screen)
+        pygame.display.flip()
+        clock.tick(SIM_RATE)
+
+# Create difficulty button rectangles
+easy_button = pygame.Rect(width//2 - 150, height//2 - 120, 300, 50)
+medium_button = pygame.Rect(width//2 - 150, height//2 - 60, 300, 50)
+hard_button = pygame.Rect(width//2 - 150, height//2, 300, 50)
+practice_button = pygame.Rect(width//2 - 150, height//2 + 60, 300, 50)
+
+# Multiplayer button
+multiplayer_button = pygame.Rect(width//2 - 150, height//2 + 120, 300, 50)
+
+# Settings button and sliders
+settings_button = pygame.Rect(width//2 - 150, height//2 + 180, 300, 40)
+back_button = pygame.Rect(width//2 - 150, height - 100, 300, 40)
+
+# Sliders for physics settings
+speed_slider = pygame.Rect(width//2 - 100, height//2 - 80, 200, 20)
+speed_handle = pygame.Rect(width//2, height//2 - 80, 20, 20)  # Position will be updated
+
+bounce_slider = pygame.Rect(width//2 - 100, height//2, 200, 20)
+bounce_handle = pygame.Rect(width//2, height//2, 20, 20)  # Position will be updated
+
+rebound_slider = pygame.Rect(width//2 - 100, height//2 + 80, 200, 20)
+rebound_handle = pygame.Rect(width//2, height//2 + 80, 20, 20)  # Position will be updated
+
+# Toggle button for gravity
+gravity_toggle = pygame.Rect(width//2 - 100, height//2 - 150, 200, 30)
+
+# Function to advance the local game by one simulation tick; speeds are in
+# pixels per tick, so the game plays at the same speed whatever the frame rate
+def step_game(keys):
+    global left_score, right_score, ball_speed_x, ball_speed_y, game_over, winner, match_stats
+    if match_stats is None and not practice_mode:
+        import results
+        match_stats = results.MatchStats()
+        # A new match: serve from its seed
+        match_rng.seed(match_seed)
+        reset_ball()
+    # Additional controls for practice mode
+    if practice_mode:
+        # Reset ball position with spacebar
+        if keys[K_SPACE]:
+            reset_ball()
+        # Adjust ball speed with additional keys in practice mode
+        if keys[K_w]:  # Increase vertical speed up
+            ball_speed_y -= 0.2
+        if keys[K_s]:  # Increase vertical speed down
+            ball_speed_y += 0.2
+        if keys[K_a]:  # Decrease horizontal speed
+            if ball_speed_x > 0:
+                ball_speed_x -= 0.2
+            else:
+                ball_speed_x += 0.2
+        if keys[K_d]:  # Increase horizontal speed
+            if ball_speed_x > 0:
+                ball_speed_x += 0.2
+            else:
+                ball_speed_x -= 0.2
+    # AI difficulty affects paddle speed (see ai.py)
+    left_paddle.y += ai.paddle_move(difficulty, "left", left_paddle.y, ball.x, ball.y,
+                                    ball_speed_x, ball_speed_y, paddle_width, paddle_height,
+                                    ball_size, width, height, match_rng)
+
+    # Player controls for right paddle
+    if keys[K_UP]:
+        right_paddle.y -= 7  # Player speed fixed at 7
+    if keys[K_DOWN]:
+        right_paddle.y += 7
+
+    # Clamp paddles to stay within screen bounds
+    left_paddle.clamp_ip(screen.get_rect())
+    right_paddle.clamp_ip(screen.get_rect())
+
+    # Move ball
+    ball.x += ball_speed_x
+    ball.y += ball_speed_y
+
+    # Apply gravity if enabled
+    if gravity_enabled:
+        ball_speed_y += 0.2  # Constant downward acceleration
+
+    # Ball collision with top and bottom walls
+    if ball.top <= 0:
+        ball.top = 0
+        ball_speed_y = -ball_speed_y * bounce_dampening
+    elif ball.bottom >= height:
+        ball.bottom = height
+        ball_speed_y = -ball_speed_y * bounce_dampening
+
+    # Ball collision with paddles
+    if ball.colliderect(left_paddle):
+        hit_pos = (ball.centery - left_paddle.centery) / (paddle_height / 2)
+        # Adjust vertical speed based on hit position and rebound strength
+        ball_speed_y = hit_pos * 5 * paddle_rebound_strength
+        # Bounce horizontally with dampening
+        ball_speed_x = -ball_speed_x * bounce_dampening
+        # Ensure ball doesn't get stuck in paddle
+        ball.left = left_paddle.right + 1
+        if match_stats is not None:
+            match_stats.on_hit(0)
+
+        # Increase speed slightly on hit for more challenge as game progresses
+        if ball_speed_x > 0:
+            ball_speed_x += 0.2 * ball_speed_multiplier
+        else:
+            ball_speed_x -= 0.2 * ball_speed_multiplier
+
+    elif ball.colliderect(right_paddle):
+        hit_pos = (ball.centery - right_paddle.centery) / (paddle_height / 2)
+        # Adjust vertical speed based on hit position and rebound strength
+        ball_speed_y = hit_pos * 5 * paddle_rebound_strength
+        # Bounce horizontally with dampening
+        ball_speed_x = -ball_speed_x * bounce_dampening
+        # Ensure ball doesn't get stuck in paddle
+        ball.right = right_paddle.left - 1
+        if match_stats is not None:
+            match_stats.on_hit(1)
+
+        # Increase speed slightly on hit
+        if ball_speed_x > 0:
+            ball_speed_x += 0.2 * ball_speed_multiplier
+        else:
+            ball_speed_x -= 0.2 * ball_speed_multiplier
+
+    # Scoring and win condition
+    if not practice_mode:
+        match_stats.on_ball_speed(ball_speed_x, ball_speed_y)
+        if ball.left <= 0:
+            right_score += 1
+            match_stats.on_point(1)
+            reset_ball()
+        elif ball.right >= width:
+            left_score += 1
+            match_stats.on_point(0)
+            reset_ball()
+
+        # **Check if someone scores over 30 points**
+        if left_score > 7:
+            winner = "Computer Wins!"
+            game_over = True
+        elif right_score > 7:
+            winner = "Player Wins!"
+            game_over = True
+        if game_over:
+            save_match(0 if left_score > 7 else 1)
+    else:
+        # Practice mode - just reset the ball when it goes out, no scoring
+        if ball.left <= 0 or ball.right >= width:
+            reset_ball()
+
+# Function to load the local ratings from results.db the first time they're needed
+def get_local_ratings():
+    global local_ratings
+    import ratings
+    import results
+    if local_ratings is None:
+        local_ratings = ratings.Ratings()
+        try:
+            local_ratings.load(results.load_ratings(results.connect()))
+        except Exception as e:
+            print(f"Could not load the ratings: {e}")
+    return local_ratings
+
+# Function to rate the local match that just ended and save it to results.db
+def save_match(winner_side):
+    global match_stats, results_store
+    import results
+    stats, match_stats = match_stats, None
+    names = (f"{difficulty.capitalize()} AI", player_name or "You")
+    try:
+        changes = ()
+        if player_name:
+            changes = get_local_ratings().record_match(names[winner_side], names[1 - winner_side])
+        if results_store is None:
+            results_store = results.ResultsStore()
+        results_store.record(stats.result(names, winner_side, "local", bots=(difficulty, None),
+                                          rating_changes=changes))
+    except Exception as e:
+        print(f"Could not save the match result: {e}")
+
+# Function to draw the local leaderboard, with the player's own place below it
+def draw_leaderboard():
+    screen.fill(black)
+    title_text = font.render("Leaderboard", True, white)
+    screen.blit(title_text, (width//2 - title_text.get_width()//2, height//10))
+    local = get_local_ratings()
+    rows = local.top(10)
+    if not rows:
+        empty_text = small_font.render("No rated matches yet", True, gray)
+        screen.blit(empty_text, (width//2 - empty_text.get_width()//2, height//2))
+    for i, (rank, name, rating, matches, wins) in enumerate(rows):
+        color = yellow if name == player_name else white
+        row_text = small_font.render(f"{rank:2}. {name[:20]}   {rating}   ({wins}/{matches} won)", True, color)
+        screen.blit(row_text, (width//2 - 220, height//10 + 80 + i * 34))
+    rank = local.rank(player_name) if player_name else None
+    if rank is not None and rank > 10:
+        own_text = small_font.render(f"You: #{rank} of {len(local.leaderboard)} ({round(local.rating(player_name))})",
+                                     True, yellow)
+        screen.blit(own_text, (width//2 - own_text.get_width()//2, height - 90))
+    back_text = small_font.render("Press L or click to go back", True, gray)
+    screen.blit(back_text, (width//2 - back_text.get_width()//2, height - 50))
+
+# Function to pick the frame rate when none is given: the display's refresh
+# rate if this pygame can report it, else 60
+def display_refresh_rate():
+    try:
+        if hasattr(pygame.display, "get_current_refresh_rate"):  # pygame-ce
+            rate = pygame.display.get_current_refresh_rate()
+        elif hasattr(pygame.display, "get_desktop_refresh_rates"):  # pygame 2.6+
+            rate = pygame.display.get_desktop_refresh_rates()[0]
+        else:
+            rate = 0
+    except (pygame.error, IndexError):
+        rate = 0
+    return rate or 60
+
+# Function to find where to draw rect this frame: alpha (0 to 1) of the way
+# from where it was one tick ago to where it is now
+def interpolated(rect, previous, alpha):
+    if previous is None:
+        return rect
+    dx = rect.x - previous[0]
+    dy = rect.y - previous[1]
+    if abs(dx) > SNAP_DISTANCE or abs(dy) > SNAP_DISTANCE:
+        return rect  # Teleported (e.g. the ball was reset), don't draw it sliding
+    return pygame.Rect(round(previous[0] + dx * alpha), round(previous[1] + dy * alpha), rect.width, rect.height)
+
+# Main game loop
+def run(exit_after_first_frame=False, started_at=None, fps=None, precise_timing=False, event_log=None,
+        name=None, p2p=None, seed=None, chaos_balls=None):
+    """Open the window and run the game until the player quits
+    
+    started_at is a time.perf_counter() value taken as early as possible at
+    startup; the time from it to the first frame on screen is printed.
+    fps caps the frames drawn per second (default: the display's refresh
+    rate, 0 = uncapped); the simulation runs at SIM_RATE regardless.
+    precise_timing paces frames with a busy loop, which is steadier than
+    sleeping but keeps a CPU core busy. With event_log set, multiplayer
+    traffic and round trip times are logged to that file (see eventlog.py).
+    name is who the player's matches are rated as (see ratings.py); without
+    one nothing is rated. p2p, a (join_host, port, input_delay) tuple,
+    starts with a peer-to-peer match (run_p2p_mode()) before the menu.
+    With seed set, every local match serves (and the AI plays) the same way.
+    chaos_balls is how many balls chaos mode (C on the menu) plays with.
+    """
+    global game_started, game_over, paused, settings_screen, leaderboard_screen, practice_mode, winner
+    global difficulty, left_score, right_score, ball_speed_x, ball_speed_y
+    global ball_speed_multiplier, gravity_enabled, bounce_dampening, paddle_rebound_strength
+    global dragging_speed, dragging_bounce, dragging_rebound, match_stats, player_name, match_seed
+    
+    player_name = name
+    match_seed = seed
+    if started_at is None:
+        started_at = time.perf_counter()
+    if event_log is not None:
+        import eventlog
+        import network
+        network.EVENT_LOG = eventlog.EventLog(event_log)
+    
+    init_display()
+    if p2p is not None:
+        run_p2p_mode(*p2p)
+    first_frame = True
+    if fps is None:
+        fps = display_refresh_rate()
+    tick = clock.tick_busy_loop if precise_timing else clock.tick
+    
+    # Real time not yet simulated, and where things were one tick ago
+    accumulator = 0.0
+    previous_positions = None
+    last_frame_at = time.perf_counter()
+    
+    running = True
+    while running:
+        now = time.perf_counter()
+        frame_time = min(now - last_frame_at, MAX_FRAME_TIME)
+        last_frame_at = now
+        
+        # Handle events
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                running = False
+            if event.type == KEYDOWN:
+                if event.key == K_ESCAPE:
+                    running = False
+                # Toggle pause when P key is pressed, but only if game has started and not over
+                if event.key == K_p and game_started and not game_over:
+                    paused = not paused
+                # X on the main menu plays the expert AI (needs ai_table.py's table)
+                if (event.key == K_x and not game_started and not settings_screen and not leaderboard_screen
+                        and ai.policy_table() is not None):
+                    difficulty = "expert"
+                    game_started = True
+                    practice_mode = False
+                # L on the main menu shows the leaderboard, and L or H hides it again
+                if event.key == K_l and not game_started and not settings_screen:
+                    leaderboard_screen = not leaderboard_screen
+                # C on the main menu plays chaos mode
+                if event.key == K_c and not game_started and not settings_screen and not leaderboard_screen:
+                    run_chaos_mode(chaos_balls)
+                    last_frame_at = time.perf_counter()
+                if event.key == K_h and leaderboard_screen:
+                    leaderboard_screen = False
+                # Return to home screen when H key is pressed
+                if event.key == K_h and game_started:
+                    game_started = False
+                    game_over = False
+                    paused = False
+                    settings_screen = False
+                    left_score = 0
+                    right_score = 0
+                    reset_ball()
+                    match_stats = None  # Abandoned, not saved
+                    accumulator = 0.0
+                    previous_positions = None
+                
+            # Handle mouse clicks on buttons
+            if event.type == MOUSEBUTTONDOWN:
+                mouse_pos = pygame.mouse.get_pos()
+            
+                # Any click closes the leaderboard
+                if leaderboard_screen:
+                    leaderboard_screen = False
+            
+                # Main menu buttons
+                elif not game_started and not settings_screen:
+                    if easy_button.collidepoint(mouse_pos):
+                        difficulty = "easy"
+                        game_started = True
+                        practice_mode = False
+                    elif medium_button.collidepoint(mouse_pos):
+                        difficulty = "medium"
+                        game_started = True
+                        practice_mode = False
+                    elif hard_button.collidepoint(mouse_pos):
+                        difficulty = "hard"
+                        game_started = True
+                        practice_mode = False
+                    elif practice_button.collidepoint(mouse_pos):
+                        difficulty = "medium"
+                        game_started = True
+                        practice_mode = True
+                    elif multiplayer_button.collidepoint(mouse_pos):
+                        # Handle multiplayer mode directly in main.py
+                        run_multiplayer_mode()
+                    elif settings_button.collidepoint(mouse_pos):
+                        settings_screen = True
+            
+                # Settings screen buttons
+                elif settings_screen:
+                    if back_button.collidepoint(mouse_pos):
+                        settings_screen = False
+                    elif gravity_toggle.collidepoint(mouse_pos):
+                        gravity_enabled = not gravity_enabled
+                    
+            # Handle slider dragging
+            if event.type == MOUSEBUTTONDOWN and settings_screen:
+                mouse_pos = pygame.mouse.get_pos()
+                # Check if any slider handle is clicked
+                if speed_handle.collidepoint(mouse_pos):
+                    dragging_speed = True
+                elif bounce_handle.collidepoint(mouse_pos):
+                    dragging_bounce = True
+                elif rebound_handle.collidepoint(mouse_pos):
+                    dragging_rebound = True
+                
+            if event.type == MOUSEBUTTONUP:
+                # Stop dragging
+                dragging_speed = False
+                dragging_bounce = False
+                dragging_rebound = False
+            
+            # Update slider positions when dragging
+            if event.type == MOUSEMOTION:
+                mouse_pos = pygame.mouse.get_pos()
+                if settings_screen:
+                    if dragging_speed:
+                        # Constrain x position to slider bounds
+                        new_x = max(speed_slider.left, min(mouse_pos[0], speed_slider.right))
+                        speed_handle.centerx = new_x
+                        # Calculate ball speed multiplier based on handle position (0.5x to 2.0x)
+                        ball_speed_multiplier = 0.5 + ((new_x - speed_slider.left) / speed_slider.width) * 1.5
+                
+                    if dragging_bounce:
+                        new_x = max(bounce_slider.left, min(mouse_pos[0], bounce_slider.right))
+                        bounce_handle.centerx = new_x
+                        # Calculate bounce dampening (0.5 to 1.0)
+                        bounce_dampening = 0.5 + ((new_x - bounce_slider.left) / bounce_slider.width) * 0.5
+                
+                    if dragging_rebound:
+                        new_x = max(rebound_slider.left, min(mouse_pos[0], rebound_slider.right))
+                        rebound_handle.centerx = new_x
+                        # Calculate paddle rebound strength (0.5 to 1.5)
+                        paddle_rebound_strength = 0.5 + ((new_x - rebound_slider.left) / rebound_slider.width)
+
+        # Display the leaderboard
+        if leaderboard_screen:
+            draw_leaderboard()
+        
+        # Display difficulty selection screen
+        elif not game_started and not settings_screen:
+            screen.fill(black)
+            title_text = font.render("Select Mode", True, white)
+            screen.blit(title_text, (width//2 - title_text.get_width()//2, height//6))  # Moved up from height//4
+        
+            # Draw buttons
+            pygame.draw.rect(screen, green, easy_button)
+            easy_text = small_font.render("Easy", True, black)
+            screen.blit(easy_text, (easy_button.centerx - easy_text.get_width()//2, easy_button.centery - easy_text.get_height()//2))
+        
+            pygame.draw.rect(screen, yellow, medium_button)
+            medium_text = small_font.render("Medium", True, black)
+            screen.blit(medium_text, (medium_button.centerx - medium_text.get_width()//2, medium_button.centery - medium_text.get_height()//2))
+        
+            pygame.draw.rect(screen, red, hard_button)
+            hard_text = small_font.render("Hard", True, black)
+            screen.blit(hard_text, (hard_button.centerx - hard_text.get_width()//2, hard_button.centery - hard_text.get_height()//2))
+        
+            # Practice button
+            pygame.draw.rect(screen, (100, 100, 255), practice_button)  # Light blue
+            practice_text = small_font.render("Practice Mode", True, black)
+            screen.blit(practice_text, (practice_button.centerx - practice_text.get_width()//2, practice_button.centery - practice_text.get_height()//2))
+        
+            # Multiplayer button
+            pygame.draw.rect(screen, (255, 100, 100), multiplayer_button)  # Light red
+            multiplayer_text = small_font.render("Multiplayer Mode", True, black)
+            screen.blit(multiplayer_text, (multiplayer_button.centerx - multiplayer_text.get_width()//2, multiplayer_button.centery - multiplayer_text.get_height()//2))
+        
+            # Settings button
+            pygame.draw.rect(screen, gray, settings_button)
+            settings_text = small_font.render("Ball Physics Settings", True, black)
+            screen.blit(settings_text, (settings_button.centerx - settings_text.get_width()//2, settings_button.centery - settings_text.get_height()//2))
+        
+            if ai.policy_table() is not None:
+                instruction_text = small_font.render("Click to select mode (X: expert AI, C: chaos, L: leaderboard)",
+                                                     True, white)
+            else:
+                instruction_text = small_font.render("Click to select mode (C: chaos, L: leaderboard)", True, white)
+            screen.blit(instruction_text, (width//2 - instruction_text.get_width()//2, height - 50))
+    
+        # Display physics settings screen
+        elif settings_screen:
+            screen.fill(black)
+            title_text = font.render("Ball Physics Settings", True, white)
+            screen.blit(title_text, (width//2 - title_text.get_width()//2, height//6))
+        
+            # Update handle positions based on current settings
+            speed_handle.centerx = speed_slider.left + ((ball_speed_multiplier - 0.5) / 1.5) * speed_slider.width
+            bounce_handle.centerx = bounce_slider.left + ((bounce_dampening - 0.5) / 0.5) * bounce_slider.width
+            rebound_handle.centerx = rebound_slider.left + ((paddle_rebound_strength - 0.5) / 1.0) * rebound_slider.width
+        
+            # Gravity toggle
+            pygame.draw.rect(screen, gray, gravity_toggle)
+            gravity_color = green if gravity_enabled else red
+            gravity_status = "ON" if gravity_enabled else "OFF"
+            gravity_text = small_font.render(f"Gravity: {gravity_status}", True, gravity_color)
+            screen.blit(gravity_text, (gravity_toggle.centerx - gravity_text.get_width()//2, gravity_toggle.centery - gravity_text.get_height()//2))
+        
+            # Ball speed slider
+            speed_label = small_font.render(f"Ball Speed: {ball_speed_multiplier:.1f}x", True, white)
+            screen.blit(speed_label, (width//2 - speed_label.get_width()//2, speed_slider.top - 30))
+            pygame.draw.rect(screen, gray, speed_slider)
+            pygame.draw.rect(screen, white, speed_handle)
+        
+            # Bounce dampening slider
+            bounce_label = small_font.render(f"Bounce Energy: {bounce_dampening:.2f}", True, white)
+            screen.blit(bounce_label, (width//2 - bounce_label.get_width()//2, bounce_slider.top - 30))
+            pygame.draw.rect(screen, gray, bounce_slider)
+            pygame.draw.rect(screen, white, bounce_handle)
+        
+            # Paddle rebound strength slider
+            rebound_label = small_font.render(f"Paddle Power: {paddle_rebound_strength:.2f}", True, white)
+            screen.blit(rebound_label, (width//2 - rebound_label.get_width()//2, rebound_slider.top - 30))
+            pygame.draw.rect(screen, gray, rebound_slider)
+            pygame.draw.rect(screen, white, rebound_handle)
+        
+            # Back button
+            pygame.draw.rect(screen, gray, back_button)
+            back_text = small_font.render("Back to Main Menu", True, black)
+            screen.blit(back_text, (back_button.centerx - back_text.get_width()//2, back_button.centery - back_text.get_height()//2))
+        
+        # Game logic (only executes if game is started, not over, and not paused)
+        elif not game_over and not paused:
+            # Run as many simulation ticks as real time has passed since the last frame
+            accumulator += frame_time
+            keys = pygame.key.get_pressed()
+            while accumulator >= SIM_DT and not game_over:
+                previous_positions = (left_paddle.topleft, right_paddle.topleft, ball.topleft)
+                step_game(keys)
+                accumulator -= SIM_DT
+            alpha = min(1.0, accumulator / SIM_DT)
+
+            # Draw everything
+            screen.fill(black)
+        
+            # Draw game elements
+            left_previous, right_previous, ball_previous = previous_positions or (None, None, None)
+            for rect in (interpolated(left_paddle, left_previous, alpha),
+                         interpolated(right_paddle, right_previous, alpha),
+                         interpolated(ball, ball_previous, alpha)):
+                sprites.rect(white, rect.x, rect.y, rect.width, rect.height)
+        
+            # Draw scores
+            sprites.draw_text(font, str(left_score), white, width//4, 10)
+            sprites.draw_text(font, str(right_score), white, 3*width//4, 10)
+        
+            # Draw difficulty indicator
+            diff_color = green if difficulty == "easy" else yellow if difficulty == "medium" else red
+            sprites.draw_text(small_font, f"Difficulty: {difficulty.capitalize()}", diff_color, None, 10)
+        
+            # Display control hints
+            sprites.draw_text(small_font, "Press P to pause | H for Home", gray, None, height - 30)
+        
+            # Additional instructions for practice mode
+            if practice_mode:
+                sprites.draw_text(small_font, "SPACE: Reset Ball | W/S: Adjust Vertical | A/D: Adjust Horizontal",
+                                  gray, None, height - 60)
+            sprites.draw(screen)
+        
+        # Pause screen
+        elif paused and game_started and not game_over:
+            # Create semi-transparent overlay
+            overlay = pygame.Surface((width, height), pygame.SRCALPHA)
+            overlay.fill((0, 0, 0, 128))  # Black with alpha
+            screen.blit(overlay, (0, 0))
+        
+            # Draw pause text
+            pause_text = font.render("PAUSED", True, white)
+            screen.blit(pause_text, (width//2 - pause_text.get_width()//2, height//2 - pause_text.get_height()//2))
+        
+            # Draw controls reminder
+            resume_text = small_font.render("Press P to resume", True, white)
+            screen.blit(resume_text, (width//2 - resume_text.get_width()//2, height//2 + 50))
+        
+            home_text = small_font.render("Press H for home screen", True, white)
+            screen.blit(home_text, (width//2 - home_text.get_width()//2, height//2 + 90))
+        
+            quit_text = small_font.render("Press ESC to quit", True, white)
+            screen.blit(quit_text, (width//2 - quit_text.get_width()//2, height//2 + 130))
+    
+        elif game_over:
+            # Draw win message centered on screen
+            screen.fill(black)
+            win_text = font.render(winner, True, white)
+            screen.blit(win_text, (width//2 - win_text.get_width()//2, height//2 - win_text.get_height()//2))
+        
+            # Draw difficulty info
+            diff_color = green if difficulty == "easy" else yellow if difficulty == "medium" else red
+            diff_text = small_font.render(f"Difficulty: {difficulty.capitalize()}", True, diff_color)
+            screen.blit(diff_text, (width//2 - diff_text.get_width()//2, height//2 + 50))
+        
+            # Home screen option
+            home_text = small_font.render("Press H to return to home screen", True, white)
+            screen.blit(home_text, (width//2 - home_text.get_width()//2, height//2 + 100))
+
+        pygame.display.flip()
+    
+        # Report startup time once the first frame is on screen
+        if first_frame:
+            first_frame = False
+            print(f"First frame after {time.perf_counter() - started_at:.3f} s", flush=True)
+            if exit_after_first_frame:
+                running = False
+    
+        tick(fps)
+
+    # Quit Pygame
+    pygame.quit()
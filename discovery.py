@@ -0,0 +1,114 @@
+import json
+import socket
+import time
+
+# Servers answer UDP probes on this port with a small JSON description of
+# themselves, so clients on the LAN can list games without typing an IP
+DISCOVERY_PORT = 5556
+PROBE = b"PINGPONG?"
+REPLY_PREFIX = b"PINGPONG!"
+
+def open_responder(port=DISCOVERY_PORT):
+    """Create the non-blocking UDP socket a server answers probes on"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        # Lets several servers on one host all hear the broadcast
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except OSError:
+            pass
+    sock.bind(("", port))
+    sock.setblocking(False)
+    return sock
+
+def answer_probes(sock, info):
+    """Reply to every pending probe with info (a JSON-serializable dict)"""
+    reply = None
+    while True:
+        try:
+            data, addr = sock.recvfrom(512)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            return  # e.g. an ICMP error from an earlier reply
+        if data != PROBE:
+            continue
+        if reply is None:
+            reply = REPLY_PREFIX + json.dumps(info).encode()
+        try:
+            sock.sendto(reply, addr)
+        except OSError:
+            pass
+
+class ServerBrowser:
+    """Keeps a live list of servers on the LAN by broadcasting probes"""
+    PROBE_INTERVAL = 0.5  # Seconds between probes
+    EXPIRY = 3.0  # Forget servers that stop answering for this long
+
+    def __init__(self, port=DISCOVERY_PORT):
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.bind(("", 0))
+        self.sock.setblocking(False)
+
+        # Server ID -> (info, {address: time last seen}). A server on this
+        # machine answers on loopback and on its LAN address, so it's keyed by
+        # the random ID it puts in its replies rather than by address.
+        self.servers = {}
+        self.next_probe = 0
+
+    def probe(self):
+        # Broadcasts don't always loop back, so ask this machine directly too
+        for target in ("<broadcast>", "127.0.0.1"):
+            try:
+                self.sock.sendto(PROBE, (target, self.port))
+            except OSError:
+                pass  # No broadcast route (e.g. offline) - keep what we have
+
+    def poll(self):
+        """Probe when due, collect replies and return servers, least loaded first
+
+        Never blocks, so it can be called once per frame from a menu.
+        """
+        now = time.monotonic()
+        if now >= self.next_probe:
+            self.probe()
+            self.next_probe = now + self.PROBE_INTERVAL
+
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break
+            if not data.startswith(REPLY_PREFIX):
+                continue
+            try:
+                info = json.loads(data[len(REPLY_PREFIX):])
+                key = (str(info["id"]), int(info["port"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+            previous, addresses = self.servers.get(key, (None, {}))
+            addresses[addr[0]] = now
+            self.servers[key] = (info, addresses)
+
+        servers = []
+        for key, (info, addresses) in list(self.servers.items()):
+            for address, last_seen in list(addresses.items()):
+                if now - last_seen > self.EXPIRY:
+                    del addresses[address]
+            if not addresses:
+                del self.servers[key]
+                continue
+            # Loopback is the fastest way to reach a server on this machine
+            info["addresses"] = sorted(addresses, key=lambda address: (not address.startswith("127."), address))
+            info["address"] = info["addresses"][0]
+            servers.append(info)
+
+        return sorted(servers, key=lambda info: (info.get("load", 0), info["address"]))
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,323 @@
+import atexit
+import bisect
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from collections import defaultdict
+
+# A compact binary log of network events, fine-grained enough for latency
+# analysis and cheap enough to leave on. The text debug logs only have
+# one-second timestamps, so this is what timing questions should be asked of.
+#
+# A file is a header followed by fixed-size little-endian records:
+#   header: magic, version, wall clock (ns since the epoch) and
+#           time.monotonic_ns() taken at the same moment
+#   record: time.monotonic_ns(), event code, session, value
+# The session numbers connections within one file; the value's meaning
+# depends on the event (see below).
+
+MAGIC = b"PPEV"
+VERSION = 1
+HEADER = struct.Struct("<4sHqq")
+RECORD = struct.Struct("<qHHI")
+
+# Event codes
+OPEN = 1  # A session started (value: player ID, or 0xFFFF if not seated)
+CLOSE = 2  # A session ended
+SEND = 3  # Bytes handed to the socket in one go (value: bytes)
+RECV = 4  # One socket read (value: bytes; may hold several messages, or part of one)
+RTT = 5  # A round trip time sample (value: microseconds)
+SHED = 6  # A snapshot skipped because the link was backed up (value: bytes)
+# Written by the impairment proxy (impair.py)
+DELAY = 7  # A packet held back before forwarding (value: microseconds)
+DROP = 8  # A packet lost, or for TCP retransmitted late (value: bytes)
+
+NOT_SEATED = 0xFFFF
+
+class EventLog:
+    """Appends events to a binary log file
+
+    Records are buffered and written out every FLUSH_SIZE bytes or
+    FLUSH_INTERVAL seconds, whichever comes first, and on close(), which
+    also runs at exit (but not after os._exit(), as in forked workers). Callers
+    on several threads (e.g. the client's connect thread and its game loop)
+    may share one log. If writing fails the log turns itself off rather
+    than taking the game down with it.
+    """
+    FLUSH_SIZE = 64 * 1024
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, time.time_ns(), time.monotonic_ns()))
+        self.file.flush()
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+        self.flush_interval_ns = int(self.FLUSH_INTERVAL * 1e9)
+        self.flushed_at = time.monotonic_ns()
+        self.next_session = 0
+        self.events = 0
+        atexit.register(self.close)
+
+    def new_session(self):
+        """Number for the next connection's events"""
+        with self.lock:
+            session = self.next_session
+            self.next_session = (self.next_session + 1) & 0xFFFF
+        return session
+
+    def record(self, code, session, value=0):
+        now = time.monotonic_ns()
+        with self.lock:
+            if self.file is None:
+                return
+            self.buffer += RECORD.pack(now, code, session, min(max(0, int(value)), 0xFFFFFFFF))
+            self.events += 1
+            if len(self.buffer) >= self.FLUSH_SIZE or now - self.flushed_at >= self.flush_interval_ns:
+                self.write_buffer(now)
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.write_buffer(time.monotonic_ns())
+
+    def write_buffer(self, now):
+        # Called with the lock held
+        try:
+            self.file.write(self.buffer)
+            self.file.flush()
+        except OSError as e:
+            print(f"Event log {self.path} disabled, write failed: {e}")
+            self.file.close()
+            self.file = None
+        self.buffer = bytearray()
+        self.flushed_at = now
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+def worker_path(path, worker_index):
+    """Where a supervisor's worker writes its events: events.bin -> events.worker0.bin"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{worker_index}{ext}"
+
+# Reading logs back. Both readers produce (seconds, code, session, value)
+# tuples, where seconds only needs to be consistent within one file.
+
+def is_event_log(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def read_event_log(path):
+    """Events of a binary log, with session numbers as given"""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, wall_ns, monotonic_ns = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} event log")
+    end = len(data) - (len(data) - HEADER.size) % RECORD.size  # A crash can leave half a record
+    events = []
+    for ns, code, session, value in RECORD.iter_unpack(data[HEADER.size:end]):
+        if code in (RTT, DELAY):
+            value /= 1e6
+        events.append(((ns - monotonic_ns) / 1e9, code, session, value))
+    return wall_ns / 1e9, events
+
+# Lines of the text logs network.py and server.py write (and older
+# versions of them wrote) that say how much was sent or received
+LEGACY_LINE = re.compile(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] (?:\[worker \d+\] )?(.*)$")
+LEGACY_PATTERNS = [
+    # Client: one session per log
+    (re.compile(r"Network debug log started"), OPEN, None),
+    (re.compile(r"Pickled data size: (\d+) bytes"), SEND, None),
+    (re.compile(r"Received (\d+) bytes (?:from server|of data)"), RECV, None),
+    # Server: one session per player seated
+    (re.compile(r"Assigning player ID (\d+)(?: in room (\d+))?"), OPEN, "player"),
+    (re.compile(r"Received (\d+) bytes from Player (\d+)"), RECV, "player"),
+    (re.compile(r"Sending game state to Player (\d+) \((\d+) bytes\)"), SEND, "player"),
+    (re.compile(r"Sending player_id=(\d+) to client \((\d+) bytes\)"), SEND, "player"),
+]
+
+def read_legacy_log(path):
+    """Events of a network_debug.log or server_debug.log
+
+    Timestamps only have one-second resolution, and there are no RTT
+    events: legacy_rtt() estimates what it can.
+    """
+    events = []
+    sessions = {}  # Server player -> session of its current seat
+    next_session = 0
+    start = None
+    with open(path, errors="replace") as f:
+        for line in f:
+            match = LEGACY_LINE.match(line)
+            if match is None:
+                continue
+            stamp, message = match.groups()
+            seconds = time.mktime(time.strptime(stamp, "%Y-%m-%d %H:%M:%S"))
+            if start is None:
+                start = seconds
+            for pattern, code, kind in LEGACY_PATTERNS:
+                found = pattern.search(message)
+                if found is None:
+                    continue
+                numbers = found.groups()
+                if kind is None:
+                    if code == OPEN:
+                        next_session += 1
+                    events.append((seconds - start, code, next_session, int(numbers[0]) if numbers else 0))
+                elif code == OPEN:
+                    next_session += 1
+                    sessions[numbers[:1]] = next_session
+                    events.append((seconds - start, OPEN, next_session, int(numbers[0])))
+                else:
+                    player, size = (numbers[1], numbers[0]) if code == RECV else numbers
+                    session = sessions.get((player,))
+                    if session is None:
+                        next_session += 1
+                        session = sessions[(player,)] = next_session
+                    events.append((seconds - start, code, session, int(size)))
+                break
+    return start, events
+
+def legacy_rtt(events):
+    """Round trip estimates for a lockstep session from a legacy log
+
+    Old clients sent one message and waited for the reply before the next,
+    so n replies within one second took at most 1/n seconds each. Only
+    whole seconds are used (not the first or last of the session).
+    """
+    per_second = defaultdict(int)
+    for seconds, code, session, value in events:
+        if code == RECV:
+            per_second[int(seconds)] += 1
+    seconds = sorted(per_second)[1:-1]
+    return [1 / per_second[s] for s in seconds]
+
+# Reporting
+
+RTT_EDGES = [0.001, 0.002, 0.005, 0.010, 0.020, 0.050, 0.100, 0.200, 0.500, 1.0]
+RATE_EDGES = [1, 5, 10, 20, 30, 45, 60, 90, 120, 240]
+SIZE_EDGES = [16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 16384]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def histogram(title, values, edges, label, scale=1, width=40):
+    """Text histogram of values over the buckets edges, each shown with label(edge * scale)"""
+    if not values:
+        return []
+    counts = [0] * (len(edges) + 1)
+    for value in values:
+        counts[bisect.bisect_right(edges, value)] += 1
+    lines = [f"  {title}: n={len(values)}  min {min(values) * scale:.1f}  "
+             f"p50 {percentile(values, 0.5) * scale:.1f}  p95 {percentile(values, 0.95) * scale:.1f}  "
+             f"p99 {percentile(values, 0.99) * scale:.1f}  max {max(values) * scale:.1f}"]
+    most = max(counts)
+    for i, count in enumerate(counts):
+        if not count:
+            continue
+        if i == 0:
+            bucket = f"< {label(edges[0] * scale)}"
+        elif i == len(edges):
+            bucket = f">= {label(edges[-1] * scale)}"
+        else:
+            bucket = f"{label(edges[i - 1] * scale)}-{label(edges[i] * scale)}"
+        bar = "#" * max(1, round(width * count / most))
+        lines.append(f"    {bucket:>12} {bar:<{width}} {count}")
+    return lines
+
+def number(value):
+    return f"{value:g}"
+
+def rates(events, code):
+    """Events of one kind in each whole second of a session"""
+    per_second = defaultdict(int)
+    for seconds, event, session, value in events:
+        if event == code:
+            per_second[int(seconds)] += 1
+    if not per_second:
+        return []
+    first, last = min(per_second), max(per_second)
+    # Count quiet seconds too, but not the partial first and last ones
+    return [per_second[s] for s in range(first + 1, last)]
+
+def report_session(name, events, legacy):
+    duration = events[-1][0] - events[0][0]
+    sent = [value for seconds, code, session, value in events if code == SEND]
+    received = [value for seconds, code, session, value in events if code == RECV]
+    shed = sum(1 for event in events if event[1] == SHED)
+    dropped = sum(1 for event in events if event[1] == DROP)
+    lines = [f"{name}: {duration:.1f} s, sent {len(sent)} writes ({sum(sent):,} bytes), "
+             f"received {len(received)} reads ({sum(received):,} bytes)"
+             + (f", {shed} snapshots shed" if shed else "")
+             + (f", {dropped} packets lost" if dropped else "")]
+
+    if legacy:
+        rtts = legacy_rtt(events)
+        lines += histogram("RTT upper bound (ms, lockstep replies per second)", rtts, RTT_EDGES, number, 1000)
+    else:
+        rtts = [value for seconds, code, session, value in events if code == RTT]
+        lines += histogram("RTT (ms)", rtts, RTT_EDGES, number, 1000)
+        delays = [value for seconds, code, session, value in events if code == DELAY]
+        lines += histogram("Added delay (ms)", delays, RTT_EDGES, number, 1000)
+    lines += histogram("Writes per second", rates(events, SEND), RATE_EDGES, number)
+    lines += histogram("Reads per second", rates(events, RECV), RATE_EDGES, number)
+    lines += histogram("Write size (bytes)", sent, SIZE_EDGES, number)
+    lines += histogram("Read size (bytes)", received, SIZE_EDGES, number)
+    return lines
+
+def analyze(path, min_events=1):
+    """Report on every session in one log, binary or text"""
+    legacy = not is_event_log(path)
+    if legacy:
+        start, events = read_legacy_log(path)
+    else:
+        start, events = read_event_log(path)
+
+    by_session = defaultdict(list)
+    for event in events:
+        by_session[event[2]].append(event)
+
+    kind = "text debug log, 1 s timestamps" if legacy else "event log"
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start)) if start is not None else "?"
+    lines = [f"== {path} ({kind}, started {started}): {len(events)} events, {len(by_session)} sessions"]
+    for session, session_events in sorted(by_session.items()):
+        traffic = sum(1 for event in session_events if event[1] in (SEND, RECV))
+        if traffic < min_events:
+            continue
+        lines.append("")
+        lines += report_session(f"Session {session}", session_events, legacy)
+    return lines
+
+def main(argv=None, prog=None):
+    """Summarize event logs and legacy text debug logs from the command line"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog=prog, description="Per-session RTT, message rate and message size histograms "
+                               "from event logs (--event-log) and network_debug.log/server_debug.log")
+    parser.add_argument("logs", nargs="+", help="log files to analyze")
+    parser.add_argument("--min-events", type=int, default=10,
+                        help="skip sessions with fewer sends and receives than this")
+    args = parser.parse_args(argv)
+
+    for path in args.logs:
+        try:
+            lines = analyze(path, args.min_events)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            continue
+        print("\n".join(lines))
+        print()
+
+if __name__ == "__main__":
+    main()
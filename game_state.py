@@ -0,0 +1,284 @@
+import random
+import struct
+from array import array
+
+# Paddle input for one tick, as bits so it fits in a byte
+INPUT_UP = 1
+INPUT_DOWN = 2
+PADDLE_SPEED = 7  # Pixels a paddle moves per tick of input
+
+def xorshift32(x):
+    """The next state of a xorshift32 generator (never 0 unless x is)"""
+    x ^= (x << 13) & 0xFFFFFFFF
+    x ^= x >> 17
+    x ^= (x << 5) & 0xFFFFFFFF
+    return x
+
+class MatchRandom:
+    """A match's own random numbers, so the same seed plays the same serves
+
+    The whole generator is one 32-bit int, small enough to travel in every
+    snapshot. It has the choice(), randint() and random() that the game and
+    the AI use, so it can stand in for the random module.
+    """
+    __slots__ = ("state",)
+
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """Restart from seed (a fresh random one if None)"""
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.state = (seed & 0xFFFFFFFF) or 1
+
+    def next(self):
+        self.state = xorshift32(self.state)
+        return self.state
+
+    def random(self):
+        return self.next() / 4294967296
+
+    def randint(self, a, b):
+        return a + self.next() % (b - a + 1)
+
+    def choice(self, seq):
+        return seq[self.next() % len(seq)]
+
+class MatchConfig:
+    """What stays the same for a whole match, shared by every GameState of it"""
+    __slots__ = ("width", "height", "paddle_width", "paddle_height", "ball_size")
+
+    def __init__(self, width=800, height=600, paddle_width=20, paddle_height=100, ball_size=20):
+        # Screen dimensions
+        self.width = width
+        self.height = height
+
+        # Paddle and ball dimensions
+        self.paddle_width = paddle_width
+        self.paddle_height = paddle_height
+        self.ball_size = ball_size
+
+    def __reduce__(self):
+        return MatchConfig, (self.width, self.height, self.paddle_width, self.paddle_height, self.ball_size)
+
+DEFAULT_CONFIG = MatchConfig()
+
+class GameState:
+    """Everything that changes from tick to tick, plus the match's MatchConfig
+
+    The state is slotted, so an instance is a fixed block of fields rather
+    than a dict. Snapshots pickle it as one flat tuple of the fields that
+    change (and the config only when it isn't DEFAULT_CONFIG). Serves come
+    from rng, by default a MatchRandom that travels with the state, so a
+    copy of the state plays on exactly like the original.
+    """
+    # The fields History keeps for every tick, in this order
+    FIELDS = ("left_paddle_y", "right_paddle_y", "ball_x", "ball_y", "ball_speed_x", "ball_speed_y",
+              "left_score", "right_score", "game_active")
+    __slots__ = FIELDS + ("config", "rng", "winner")
+
+    def __init__(self, rng=None, config=DEFAULT_CONFIG, seed=None):
+        # Where serves get their random direction: anything with choice() and
+        # randint(), e.g. a seeded random.Random. Only a MatchRandom (made
+        # from seed if rng isn't given) is part of snapshots.
+        self.rng = rng or MatchRandom(seed)
+        self.config = config
+
+        # Default paddle positions
+        self.left_paddle_y = config.height // 2 - config.paddle_height // 2
+        self.right_paddle_y = config.height // 2 - config.paddle_height // 2
+
+        # Ball settings
+        self.ball_x = config.width // 2 - config.ball_size // 2
+        self.ball_y = config.height // 2 - config.ball_size // 2
+        self.ball_speed_x = 5 * self.rng.choice([-1, 1])
+        self.ball_speed_y = self.rng.randint(-5, 5)
+
+        # Scores
+        self.left_score = 0
+        self.right_score = 0
+
+        # Game status
+        self.game_active = False
+        self.winner = ""
+
+    # The match constants, read through to the config
+    width = property(lambda self: self.config.width)
+    height = property(lambda self: self.config.height)
+    paddle_width = property(lambda self: self.config.paddle_width)
+    paddle_height = property(lambda self: self.config.paddle_height)
+    ball_size = property(lambda self: self.config.ball_size)
+
+    def __getstate__(self):
+        return (self.left_paddle_y, self.right_paddle_y, self.ball_x, self.ball_y,
+                self.ball_speed_x, self.ball_speed_y, self.left_score, self.right_score,
+                self.game_active, self.winner, None if self.config is DEFAULT_CONFIG else self.config,
+                self.rng.state if isinstance(self.rng, MatchRandom) else None)
+
+    def __setstate__(self, state):
+        (self.left_paddle_y, self.right_paddle_y, self.ball_x, self.ball_y,
+         self.ball_speed_x, self.ball_speed_y, self.left_score, self.right_score,
+         self.game_active, self.winner, config, rng_state) = state
+        self.config = config or DEFAULT_CONFIG
+        self.rng = MatchRandom(rng_state)
+
+    def paddle_hit(self, side, ball_x, ball_y, paddle_y):
+        """Whether a ball at (ball_x, ball_y) touches side's paddle (0 = left) at paddle_y"""
+        config = self.config
+        if side == 0:
+            if not (ball_x <= 50 + config.paddle_width and ball_x + config.ball_size >= 50):
+                return False
+        elif not (ball_x + config.ball_size >= config.width - 50 - config.paddle_width
+                  and ball_x <= config.width - 50):
+            return False
+        return ball_y + config.ball_size >= paddle_y and ball_y <= paddle_y + config.paddle_height
+
+    def update_ball(self, seen=None):
+        """Advance the ball by one tick
+
+        seen optionally gives each side's (ball_x, ball_y) as that player
+        saw it when they sent the input that put their paddle where it is
+        now (see History). A ball coming at a paddle it misses is still
+        returned if the ball the player saw touches it (lag compensation).
+        """
+        if not self.game_active:
+            return
+        config = self.config
+        width = config.width
+        height = config.height
+        paddle_width = config.paddle_width
+        paddle_height = config.paddle_height
+        ball_size = config.ball_size
+
+        # Move the ball
+        self.ball_x += self.ball_speed_x
+        self.ball_y += self.ball_speed_y
+
+        # Ball collision with top and bottom walls
+        if self.ball_y <= 0:
+            self.ball_y = 0
+            self.ball_speed_y = -self.ball_speed_y
+        elif self.ball_y + ball_size >= height:
+            self.ball_y = height - ball_size
+            self.ball_speed_y = -self.ball_speed_y
+
+        # Check for paddle collisions
+        # Left paddle collision
+        hit_y = None
+        if (self.ball_x <= 50 + paddle_width and
+            self.ball_x + ball_size >= 50 and
+            self.ball_y + ball_size >= self.left_paddle_y and
+            self.ball_y <= self.left_paddle_y + paddle_height):
+            hit_y = self.ball_y
+        elif (seen is not None and seen[0] is not None and self.ball_speed_x < 0
+              and self.paddle_hit(0, seen[0][0], seen[0][1], self.left_paddle_y)):
+            hit_y = seen[0][1]
+        if hit_y is not None:
+            hit_pos = (hit_y + ball_size/2 - (self.left_paddle_y + paddle_height/2)) / (paddle_height/2)
+            self.ball_speed_y = hit_pos * 5
+            self.ball_speed_x = -self.ball_speed_x
+            self.ball_x = 50 + paddle_width + 1
+
+        # Right paddle collision
+        hit_y = None
+        if (self.ball_x + ball_size >= width - 50 - paddle_width and
+            self.ball_x <= width - 50 and
+            self.ball_y + ball_size >= self.right_paddle_y and
+            self.ball_y <= self.right_paddle_y + paddle_height):
+            hit_y = self.ball_y
+        elif (seen is not None and seen[1] is not None and self.ball_speed_x > 0
+              and self.paddle_hit(1, seen[1][0], seen[1][1], self.right_paddle_y)):
+            hit_y = seen[1][1]
+        if hit_y is not None:
+            hit_pos = (hit_y + ball_size/2 - (self.right_paddle_y + paddle_height/2)) / (paddle_height/2)
+            self.ball_speed_y = hit_pos * 5
+            self.ball_speed_x = -self.ball_speed_x
+            self.ball_x = width - 50 - paddle_width - ball_size - 1
+
+        # Scoring
+        if self.ball_x <= 0:
+            self.right_score += 1
+            self.reset_ball()
+        elif self.ball_x + ball_size >= width:
+            self.left_score += 1
+            self.reset_ball()
+
+        # Check win condition
+        if self.left_score > 7:
+            self.winner = "Player 1 Wins!"
+            self.game_active = False
+        elif self.right_score > 7:
+            self.winner = "Player 2 Wins!"
+            self.game_active = False
+
+    def step_paddle(self, paddle_y, buttons):
+        """Where a paddle at paddle_y ends up after one tick of input"""
+        if buttons & INPUT_UP:
+            paddle_y -= PADDLE_SPEED
+        if buttons & INPUT_DOWN:
+            paddle_y += PADDLE_SPEED
+        return max(0, min(self.config.height - self.config.paddle_height, paddle_y))
+
+    def move_paddle(self, player_id, buttons):
+        self.set_paddle_y(player_id, self.step_paddle(self.paddle_y(player_id), buttons))
+
+    def paddle_y(self, player_id):
+        if player_id == 0:  # Player 1 (left paddle)
+            return self.left_paddle_y
+        return self.right_paddle_y  # Player 2 (right paddle)
+
+    def set_paddle_y(self, player_id, paddle_y):
+        """Move a paddle, keeping it on screen"""
+        paddle_y = max(0, min(self.config.height - self.config.paddle_height, paddle_y))
+        if player_id == 0:
+            self.left_paddle_y = paddle_y
+        else:
+            self.right_paddle_y = paddle_y
+
+    def reset_ball(self):
+        config = self.config
+        self.ball_x = config.width // 2 - config.ball_size // 2
+        self.ball_y = config.height // 2 - config.ball_size // 2
+        self.ball_speed_x = 5 * self.rng.choice([-1, 1])
+        self.ball_speed_y = self.rng.randint(-5, 5)
+
+    def start_game(self):
+        self.left_score = 0
+        self.right_score = 0
+        self.reset_ball()
+        self.winner = ""
+        self.game_active = True
+
+class History:
+    """The GameState.FIELDS of the last capacity ticks, in a ring buffer
+
+    Every tick's record is packed into one buffer allocated up front, so
+    saving a tick allocates nothing and the buffer's size never changes.
+    """
+    RECORD = struct.Struct("<6d2i?")  # Paddles and ball, scores, active, as in GameState.FIELDS
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * self.RECORD.size)
+        self.ticks = array("q", [-1]) * capacity  # Tick held in each slot, -1 if none yet
+
+    def save(self, tick, state):
+        """Keep state as it is at the end of tick, over the oldest record"""
+        slot = tick % self.capacity
+        self.RECORD.pack_into(self.buffer, slot * self.RECORD.size,
+                              state.left_paddle_y, state.right_paddle_y, state.ball_x, state.ball_y,
+                              state.ball_speed_x, state.ball_speed_y, state.left_score, state.right_score,
+                              state.game_active)
+        self.ticks[slot] = tick
+
+    def get(self, tick):
+        """The GameState.FIELDS values saved for tick, or None if it's too old (or never saved)"""
+        slot = tick % self.capacity
+        if tick < 0 or self.ticks[slot] != tick:
+            return None
+        return self.RECORD.unpack_from(self.buffer, slot * self.RECORD.size)
+
+    def clear(self):
+        for slot in range(self.capacity):
+            self.ticks[slot] = -1
@@ -0,0 +1,476 @@
+import heapq
+import os
+import random
+import selectors
+import socket
+import threading
+import time
+
+import eventlog
+
+# A userspace proxy that makes loopback behave like a bad network, for
+# testing the multiplayer and P2P code without one. Point the game (or a
+# benchmark) at the proxy's port instead of the server's; everything it
+# forwards is held back by the current phase's delay and jitter, queued
+# behind a bandwidth cap, and lost or reordered at random.
+# A server on this machine needs --no-shm (the benchmark's clients pass
+# shared_memory=False): a client on the same host would otherwise switch
+# to a shared memory ring with it and go around the proxy.
+#
+# TCP can't lose or reorder bytes, so a "lost" TCP segment arrives a
+# retransmission timeout late instead, holding up everything behind it
+# (head-of-line blocking, which is what a real loss costs a TCP game).
+# UDP datagrams (P2P matches) really are dropped and reordered.
+#
+# Profiles are scripted: a list of phases, each lasting some seconds,
+# played in a loop, so a test sees the conditions change under it the way
+# a hotel's Wi-Fi does when someone starts a download. With an event log
+# every connection is recorded: bytes forwarded each way (SEND is towards
+# the target, RECV back towards the client), the delay added to each and
+# what was lost, for eventlog.py to analyze.
+
+RETRANSMIT_TIMEOUT = 0.2  # What a lost TCP segment costs (Linux's minimum RTO)
+CONNECT_TIMEOUT = 5  # Seconds a proxied connection waits for the target to answer
+UDP_IDLE_TIMEOUT = 60  # Seconds before a quiet UDP client's flow is forgotten
+
+def log(message):
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] [impair] {message}")
+
+class Impairment:
+    """Network conditions one way: seconds of delay plus up to jitter more, loss and
+    reorder chances per packet, and bandwidth in bytes per second (None = unlimited)"""
+    __slots__ = ("delay", "jitter", "loss", "reorder", "bandwidth")
+
+    def __init__(self, delay=0.0, jitter=0.0, loss=0.0, reorder=0.0, bandwidth=None):
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.reorder = reorder
+        self.bandwidth = bandwidth
+
+    def describe(self):
+        text = f"{self.delay * 1000:.0f}+{self.jitter * 1000:.0f} ms, {self.loss:.1%} loss"
+        if self.reorder:
+            text += f", {self.reorder:.1%} reordered"
+        if self.bandwidth:
+            text += f", {self.bandwidth * 8 / 1000:,.0f} kbit/s"
+        return text
+
+# [(seconds, Impairment)] phases, played in a loop; None lasts forever
+PROFILES = {
+    "none": [(None, Impairment())],
+    "lan": [(None, Impairment(delay=0.0005, jitter=0.0005))],
+    "cross-country": [(None, Impairment(delay=0.035, jitter=0.005, loss=0.002, bandwidth=2_500_000))],
+    "hotel-wifi": [
+        (20, Impairment(delay=0.025, jitter=0.030, loss=0.01, reorder=0.01, bandwidth=250_000)),
+        # Someone down the hall starts a download
+        (4, Impairment(delay=0.150, jitter=0.200, loss=0.08, reorder=0.05, bandwidth=40_000)),
+        (10, Impairment(delay=0.040, jitter=0.060, loss=0.03, reorder=0.02, bandwidth=120_000)),
+    ],
+    "mobile": [
+        (15, Impairment(delay=0.045, jitter=0.020, loss=0.005, bandwidth=500_000)),
+        # A handover between cells: nothing gets through for a moment
+        (1, Impairment(delay=0.300, jitter=0.300, loss=0.5, reorder=0.1, bandwidth=20_000)),
+    ],
+}
+
+class Pipe:
+    """One direction of one proxied connection: schedules what's read for delivery"""
+
+    def __init__(self, proxy, session, code, stream, deliver):
+        self.proxy = proxy
+        self.session = session
+        self.code = code  # eventlog.SEND towards the target, RECV back
+        self.stream = stream  # TCP: keep the order
+        self.deliver = deliver  # Called with each chunk when it's due, None for end of stream
+        self.free_at = 0.0  # When the bandwidth cap lets the next packet start
+        self.last_due = 0.0
+
+    def schedule(self, data, now):
+        proxy = self.proxy
+        phase = proxy.phase(now)
+        rng = proxy.rng
+        start = now
+        if phase.bandwidth:
+            start = max(now, self.free_at)
+            self.free_at = start + len(data) / phase.bandwidth
+        due = start + phase.delay + rng.random() * phase.jitter
+        if rng.random() < phase.loss:
+            proxy.record(eventlog.DROP, self.session, len(data))
+            if not self.stream:
+                return
+            due += RETRANSMIT_TIMEOUT
+        elif not self.stream and rng.random() < phase.reorder:
+            # Held back long enough for the next few packets to overtake it
+            due += phase.delay + phase.jitter + 0.005
+        if self.stream:
+            due = max(due, self.last_due)
+        self.last_due = due
+        proxy.record(eventlog.DELAY, self.session, (due - now) * 1e6)
+        proxy.push(due, self, data)
+
+    def end(self, now):
+        """The source closed: pass that on after everything before it"""
+        self.proxy.push(max(now, self.last_due), self, None)
+
+class StreamLink:
+    """A proxied TCP connection: the client's socket, ours to the target and a Pipe each way
+
+    The connection to the target is made without blocking the proxy's
+    thread (every other link's deliveries are due meanwhile); nothing is
+    read from the client until it's up, or given up on after
+    CONNECT_TIMEOUT.
+    """
+
+    def __init__(self, proxy, client, addr, now):
+        self.proxy = proxy
+        self.addr = addr
+        upstream = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sockets = (client, upstream)
+        self.pending = {client: bytearray(), upstream: bytearray()}
+        self.closing = False
+        self.session = None  # Until connected
+        self.reading = {}
+        for sock in self.sockets:
+            sock.setblocking(False)
+        self.connect_deadline = now + CONNECT_TIMEOUT
+        proxy.connecting.add(self)
+        upstream.connect_ex(proxy.target)
+        proxy.selector.register(upstream, selectors.EVENT_WRITE, self)
+
+    def connected(self):
+        """The connection to the target is up or failed: start forwarding, or give up"""
+        proxy = self.proxy
+        proxy.connecting.discard(self)
+        client, upstream = self.sockets
+        error = upstream.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self.fail(os.strerror(error))
+            return
+        for sock in self.sockets:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.session = proxy.new_session()
+        proxy.record(eventlog.OPEN, self.session, eventlog.NOT_SEATED)
+        self.up = Pipe(proxy, self.session, eventlog.SEND, True, lambda data: self.write(upstream, data))
+        self.down = Pipe(proxy, self.session, eventlog.RECV, True, lambda data: self.write(client, data))
+        self.reading = {client: self.up, upstream: self.down}
+        for sock in self.sockets:
+            self.update(sock)
+
+    def fail(self, reason):
+        target = self.proxy.target
+        log(f"Could not reach {target[0]}:{target[1]} for {self.addr[0]}:{self.addr[1]}: {reason}")
+        self.proxy.connecting.discard(self)
+        self.close()
+
+    def on_event(self, sock, mask, now):
+        if self.session is None:
+            self.connected()
+            return
+        if mask & selectors.EVENT_WRITE:
+            self.flush(sock)
+        if mask & selectors.EVENT_READ and sock in self.reading:
+            try:
+                data = sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                data = b""
+            if data:
+                self.proxy.record(self.reading[sock].code, self.session, len(data))
+                self.reading[sock].schedule(data, now)
+            else:
+                # Stop reading it; the close reaches the other side in order
+                pipe = self.reading.pop(sock)
+                self.update(sock)
+                pipe.end(now)
+
+    def write(self, sock, data):
+        if self.closing:
+            return
+        if data is None:
+            self.closing = True
+        else:
+            self.pending[sock] += data
+        self.flush(sock)
+
+    def flush(self, sock):
+        pending = self.pending[sock]
+        try:
+            while pending:
+                sent = sock.send(pending)
+                del pending[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            pending.clear()
+            self.closing = True
+        if self.closing and not any(self.pending.values()):
+            self.close()
+        else:
+            self.update(sock)
+
+    def update(self, sock):
+        events = (selectors.EVENT_READ if sock in self.reading else 0) | (
+            selectors.EVENT_WRITE if self.pending[sock] else 0)
+        try:
+            if events:
+                self.proxy.selector.modify(sock, events, self)
+            else:
+                self.proxy.selector.unregister(sock)
+        except (KeyError, ValueError):
+            if events:
+                self.proxy.selector.register(sock, events, self)
+
+    def close(self):
+        if self not in self.proxy.links:
+            return
+        self.proxy.links.discard(self)
+        for sock in self.sockets:
+            try:
+                self.proxy.selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+            sock.close()
+        if self.session is not None:
+            self.proxy.record(eventlog.CLOSE, self.session)
+
+class DatagramFlow:
+    """One UDP client: its own socket to the target, so replies find their way back"""
+
+    def __init__(self, proxy, addr, session):
+        self.proxy = proxy
+        self.addr = addr
+        self.session = session
+        self.upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.upstream.setblocking(False)
+        self.upstream.connect(proxy.target)
+        self.last_active = time.monotonic()
+        self.up = Pipe(proxy, session, eventlog.SEND, False, self.send_up)
+        self.down = Pipe(proxy, session, eventlog.RECV, False, self.send_down)
+        proxy.selector.register(self.upstream, selectors.EVENT_READ, self)
+
+    def send_up(self, data):
+        try:
+            self.upstream.send(data)
+        except OSError:
+            pass  # As good as lost
+
+    def send_down(self, data):
+        try:
+            self.proxy.udp.sendto(data, self.addr)
+        except OSError:
+            pass
+
+    def on_event(self, sock, mask, now):
+        while True:
+            try:
+                data = self.upstream.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue  # e.g. the target isn't listening (yet)
+            self.last_active = now
+            self.proxy.record(eventlog.RECV, self.session, len(data))
+            self.down.schedule(data, now)
+
+    def close(self):
+        self.proxy.selector.unregister(self.upstream)
+        self.upstream.close()
+        self.proxy.record(eventlog.CLOSE, self.session)
+
+class ImpairmentProxy:
+    """Forwards TCP connections and UDP datagrams on port to target, impaired
+
+    profile is a PROFILES name or a list of (seconds, Impairment) phases,
+    applied to each direction separately. Runs on its own thread from
+    start() to close(); port 0 picks a free port (see .port).
+    """
+
+    def __init__(self, target_host="127.0.0.1", target_port=5555, port=0, profile="none",
+                 seed=None, event_log=None, host="127.0.0.1"):
+        # Resolved once: looking a name up again per connection would block
+        self.target = (socket.gethostbyname(target_host), target_port)
+        self.profile_name = profile if isinstance(profile, str) else "custom"
+        self.phases = PROFILES[profile] if isinstance(profile, str) else list(profile)
+        self.rng = random.Random(seed)
+        self.event_log = eventlog.EventLog(event_log) if isinstance(event_log, str) else event_log
+
+        self.selector = selectors.DefaultSelector()
+        self.tcp, self.udp = self.bind(host, port)
+        self.port = self.tcp.getsockname()[1]
+        self.selector.register(self.tcp, selectors.EVENT_READ, "accept")
+        self.selector.register(self.udp, selectors.EVENT_READ, "datagram")
+
+        self.links = set()
+        self.connecting = set()  # Links whose connection to the target isn't up yet
+        self.flows = {}  # UDP client address -> DatagramFlow
+        self.queue = []  # Heap of (due, sequence, pipe, data)
+        self.sequence = 0
+        self.started_at = time.monotonic()
+        self.phase_index = None
+        self.running = False
+        self.thread = None
+
+    @staticmethod
+    def bind(host, port):
+        """A TCP listener and a UDP socket on the same port"""
+        for _ in range(10 if port == 0 else 1):
+            tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            tcp.bind((host, port))
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                udp.bind((host, tcp.getsockname()[1]))
+            except OSError:
+                tcp.close()
+                udp.close()
+                continue  # Only with port 0: the UDP side of the port we got is taken
+            tcp.listen(64)
+            tcp.setblocking(False)
+            udp.setblocking(False)
+            return tcp, udp
+        raise OSError(f"No port free for both TCP and UDP on {host}")
+
+    def phase(self, now):
+        """The Impairment in force at now"""
+        phases = self.phases
+        index = 0
+        if len(phases) > 1:
+            elapsed = (now - self.started_at) % sum(seconds for seconds, impairment in phases)
+            while elapsed >= phases[index][0]:
+                elapsed -= phases[index][0]
+                index += 1
+        if index != self.phase_index:
+            self.phase_index = index
+            log(f"{self.profile_name} phase {index + 1}/{len(phases)}: {phases[index][1].describe()}")
+        return phases[index][1]
+
+    def push(self, due, pipe, data):
+        self.sequence += 1
+        heapq.heappush(self.queue, (due, self.sequence, pipe, data))
+
+    def record(self, code, session, value=0):
+        if self.event_log is not None:
+            self.event_log.record(code, session, value)
+
+    def new_session(self):
+        return self.event_log.new_session() if self.event_log is not None else 0
+
+    def start(self):
+        log(f"Forwarding port {self.port} to {self.target[0]}:{self.target[1]} ({self.profile_name})")
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="Impairment proxy", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        next_cleanup = time.monotonic() + UDP_IDLE_TIMEOUT
+        while self.running:
+            now = time.monotonic()
+            timeout = 0.05  # Checks running this often
+            if self.queue:
+                timeout = min(timeout, max(0.0, self.queue[0][0] - now))
+            for key, mask in self.selector.select(timeout):
+                now = time.monotonic()
+                if key.data == "accept":
+                    self.accept(now)
+                elif key.data == "datagram":
+                    self.on_datagrams(now)
+                else:
+                    key.data.on_event(key.fileobj, mask, now)
+
+            now = time.monotonic()
+            while self.queue and self.queue[0][0] <= now:
+                due, sequence, pipe, data = heapq.heappop(self.queue)
+                pipe.deliver(data)
+
+            for link in [link for link in self.connecting if now >= link.connect_deadline]:
+                link.fail("timed out")
+
+            if now >= next_cleanup:
+                next_cleanup = now + UDP_IDLE_TIMEOUT
+                for addr, flow in list(self.flows.items()):
+                    if now - flow.last_active > UDP_IDLE_TIMEOUT:
+                        del self.flows[addr]
+                        flow.close()
+
+    def accept(self, now):
+        try:
+            client, addr = self.tcp.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        self.links.add(StreamLink(self, client, addr, now))
+
+    def on_datagrams(self, now):
+        while True:
+            try:
+                data, addr = self.udp.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            flow = self.flows.get(addr)
+            if flow is None:
+                session = self.new_session()
+                self.record(eventlog.OPEN, session, eventlog.NOT_SEATED)
+                flow = self.flows[addr] = DatagramFlow(self, addr, session)
+            flow.last_active = now
+            self.record(eventlog.SEND, flow.session, len(data))
+            flow.up.schedule(data, now)
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        for link in list(self.links):
+            link.close()
+        for flow in self.flows.values():
+            flow.close()
+        self.flows = {}
+        self.tcp.close()
+        self.udp.close()
+        self.selector.close()
+        if self.event_log is not None:
+            self.event_log.flush()
+
+def main(argv=None, prog=None):
+    """Run the proxy in front of a server (or P2P host) until interrupted"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog=prog, description="Forward a port to a server through simulated delay, jitter, "
+                               "bandwidth limits, reordering and loss")
+    parser.add_argument("target", nargs="?", default="127.0.0.1:5555",
+                        help="HOST:PORT to forward to (default 127.0.0.1:5555)")
+    parser.add_argument("--port", type=int, default=6555, help="TCP and UDP port to listen on")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="none",
+                        help="scripted network conditions (the options below replace it)")
+    parser.add_argument("--delay", type=float, default=None, help="one-way delay (ms)")
+    parser.add_argument("--jitter", type=float, default=0, help="most extra random delay (ms)")
+    parser.add_argument("--loss", type=float, default=0, help="packet loss (%%)")
+    parser.add_argument("--reorder", type=float, default=0, help="UDP datagrams held back to arrive out of order (%%)")
+    parser.add_argument("--bandwidth", type=float, default=None, help="each way (kbit/s)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the random losses and delays")
+    parser.add_argument("--event-log", metavar="PATH", default=None,
+                        help="record what the proxy did, for eventlog.py to analyze")
+    args = parser.parse_args(argv)
+
+    profile = args.profile
+    if args.delay is not None or args.jitter or args.loss or args.reorder or args.bandwidth:
+        profile = [(None, Impairment(delay=(args.delay or 0) / 1000, jitter=args.jitter / 1000,
+                                     loss=args.loss / 100, reorder=args.reorder / 100,
+                                     bandwidth=args.bandwidth and args.bandwidth * 1000 / 8))]
+    host, _, port = args.target.rpartition(":")
+    proxy = ImpairmentProxy(host or "127.0.0.1", int(port), port=args.port, profile=profile,
+                            seed=args.seed, event_log=args.event_log, host="0.0.0.0")
+    proxy.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import time
+from collections import deque
+
+class LinkEstimator:
+    """Round trip time, jitter and clock offset of one peer
+
+    Either side of a connection can send ("ping", t0). The peer answers with
+    ("pong", t0, t1, t2): our send time echoed back, plus when it received
+    the ping and when it sent the pong, and we note when the pong arrives
+    (t3). Every timestamp is time.monotonic() on the machine that took it,
+    so the two clocks have an unknown offset, and the exchange estimates it:
+
+        rtt = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2    (peer clock minus ours)
+
+    The offset is exact when both directions take equally long. So, like
+    NTP's clock filter, it is taken from the fastest of the recent exchanges,
+    which had the least room for asymmetry.
+    """
+    PING_INTERVAL = 0.5  # Seconds between pings
+    RTT_GAIN = 1 / 8  # Weight of a new sample in the smoothed RTT (RFC 6298)
+    JITTER_GAIN = 1 / 4  # Weight of a new sample in the RTT deviation (RFC 6298)
+    MIN_RTT_WINDOW = 10.0  # Seconds of samples the lowest RTT is taken over
+    OFFSET_SAMPLES = 8  # Recent exchanges to pick the clock offset from
+
+    def __init__(self):
+        # All in seconds, None until the first sample
+        self.rtt = None
+        self.jitter = None
+        self.min_rtt = None
+        self.offset = None
+
+        # (time, rtt) of the samples that may yet be the lowest in the
+        # window: each newer and higher than the one before, so the first
+        # is the minimum and a new sample drops every higher one at the end
+        self.min_rtt_samples = deque()
+
+        # (rtt, offset) of the most recent ping exchanges
+        self.exchanges = deque(maxlen=self.OFFSET_SAMPLES)
+
+        self.next_ping = 0
+        self.pings_sent = 0
+        self.pongs_received = 0
+        
+        # Called with every RTT sample, e.g. to log it
+        self.on_sample = None
+
+    def ping_due(self, now):
+        return now >= self.next_ping
+
+    def ping(self, now):
+        """Build the next ping message"""
+        self.next_ping = now + self.PING_INTERVAL
+        self.pings_sent += 1
+        return ("ping", now)
+
+    @staticmethod
+    def pong(ping, received_at):
+        """Build the answer to a peer's ping, received at received_at"""
+        return ("pong", ping[1], received_at, time.monotonic())
+
+    def on_pong(self, pong, now):
+        """Update the estimates from a pong that arrived at now"""
+        _, sent_at, peer_received_at, peer_sent_at = pong
+        self.pongs_received += 1
+        rtt = max(0, (now - sent_at) - (peer_sent_at - peer_received_at))
+        offset = ((peer_received_at - sent_at) + (peer_sent_at - now)) / 2
+        self.exchanges.append((rtt, offset))
+        self.offset = min(self.exchanges)[1]
+        self.add_rtt_sample(rtt, now)
+
+    def add_rtt_sample(self, rtt, now):
+        """Fold in a round trip time measured some other way (e.g. acks)"""
+        if self.rtt is None:
+            self.rtt = rtt
+            self.jitter = rtt / 2
+        else:
+            self.jitter += self.JITTER_GAIN * (abs(rtt - self.rtt) - self.jitter)
+            self.rtt += self.RTT_GAIN * (rtt - self.rtt)
+        # Like BBR's min filter: the lowest sample of the last MIN_RTT_WINDOW
+        # seconds, so the baseline only rises once every lower sample has
+        # aged out, never to whatever one sample measured during a spike
+        samples = self.min_rtt_samples
+        while samples and samples[-1][1] >= rtt:
+            samples.pop()
+        samples.append((now, rtt))
+        while samples[0][0] < now - self.MIN_RTT_WINDOW:
+            samples.popleft()
+        self.min_rtt = samples[0][1]
+        if self.on_sample is not None:
+            self.on_sample(rtt)
+
+    def queueing_delay(self):
+        """How much longer round trips take now than on an idle link"""
+        if self.rtt is None:
+            return 0
+        return max(0, self.rtt - self.min_rtt)
+
+    def peer_time(self, local_time=None):
+        """Convert one of our monotonic timestamps to the peer's clock"""
+        if local_time is None:
+            local_time = time.monotonic()
+        return local_time + (self.offset or 0)
+
+    def local_time(self, peer_time):
+        """Convert one of the peer's monotonic timestamps to our clock"""
+        return peer_time - (self.offset or 0)
+
+    def describe(self):
+        """Short human readable summary, e.g. for a HUD or a log line"""
+        if self.rtt is None:
+            return "RTT --"
+        return f"RTT {self.rtt * 1000:.0f} ms (jitter {self.jitter * 1000:.0f} ms)"
@@ -1,14 +1,26 @@
 import socket
-import pickle
+import select
+import selectors
+import threading
 import sys
 import os
 import traceback
 import time
+from collections import deque
+
+from protocol import MessageBuffer, encode_message, recv_message, encode_inputs
+from latency import LinkEstimator
+import eventlog
+import shmlink
 
 # Create debug log file
 DEBUG_MODE = True
 DEBUG_LOG_PATH = os.path.join(os.path.dirname(__file__), "network_debug.log")
 
+# eventlog.EventLog to record traffic and RTT samples in, set by the game's
+# --event-log option
+EVENT_LOG = None
+
 def log(message):
     """Log a message to both console and log file"""
     timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -23,12 +35,70 @@ def log(message):
             pass  # If logging fails, continue anyway
 
 class Network:
-    def __init__(self, server="localhost", port=5555):
+    RESPONSE_TIMEOUT = 2  # Seconds without a snapshot before the link counts as dropped
+    REDUNDANT_INPUTS = 8  # Recent inputs repeated in every input packet
+    MAX_PREDICTED_INPUTS = 120  # Unapplied inputs replayed on top of the server's paddle
+    RECONNECT_WINDOW = 10  # Seconds to keep trying to resume a dropped session
+    RESUME_RETRY_DELAY = 0.2  # Seconds between attempts to resume it
+    
+    def __init__(self, server="localhost", port=5555, connect=True, name=None, shared_memory=True):
+        """Set up a connection to server:port
+        
+        With connect=False nothing is sent yet; ConnectAttempt uses that to
+        hand over a socket it already connected. name is what the server
+        rates us as (see ratings.py); without one we play unrated.
+        shared_memory=False keeps a server on this machine on the socket
+        (e.g. one behind impair.py's proxy, which the ring would bypass).
+        """
         log(f"Network initialization with server={server}, port={port}")
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.family = socket.AF_INET
         self.server = server
         self.port = port
         self.addr = (self.server, self.port)
+        self.name = name
+        
+        # Received bytes that haven't formed a complete message yet
+        self.inbox = MessageBuffer()
+        
+        # Session token from the server's welcome, used to resume after a drop,
+        # and while resuming: when to give up, and how far this attempt got
+        self.token = None
+        self.resume_deadline = None
+        self.resume_stage = None
+        self.resume_attempt_started = 0.0
+        
+        # Newest game state the server pushed, its tick (echoed back as an ack
+        # so the server can measure our round trip) and when it arrived
+        self.game_state = None
+        self.snapshot_tick = None
+        self.last_snapshot = time.monotonic()
+        
+        # Round trip time, jitter and clock offset to the server. It survives
+        # reconnects since it's the same server and the same clock.
+        self.link = LinkEstimator()
+        
+        # Number of this connection in the event log, if there is one
+        self.session = None
+        if EVENT_LOG is not None:
+            self.session = EVENT_LOG.new_session()
+            self.link.on_sample = lambda rtt: self.record(eventlog.RTT, rtt * 1e6)
+        
+        # (their timestamp, when we read it) of server pings to answer
+        self.pings_to_answer = []
+        
+        # Our input tick counter, the last few inputs (resent every time) and
+        # the (tick, buttons) the server hasn't applied yet, for prediction
+        self.input_tick = 0
+        self.recent_inputs = deque(maxlen=self.REDUNDANT_INPUTS)
+        self.unapplied_inputs = deque(maxlen=self.MAX_PREDICTED_INPUTS)
+        
+        # Shared memory link to a server on this machine (see shmlink.py):
+        # offered once the first snapshot is in, used both ways once the
+        # server accepts, and not offered again after it declines
+        self.shm = None
+        self.shm_active = False
+        self.shm_declined = not (shared_memory and shmlink.supported())
         
         # Set a socket timeout of 10 seconds
         self.client.settimeout(10)
@@ -42,7 +112,7 @@ class Network:
             except:
                 pass
                 
-        self.player_id = self.connect()
+        self.player_id = self.connect() if connect else None
         
     def connect(self):
         """Attempt to connect to the server and get player ID"""
@@ -51,37 +121,12 @@ class Network:
             log(f"Attempting to connect to {self.server}:{self.port}")
             log(f"Socket details: {self.client}")
             
-            # Get all possible IP addresses for the server
-            try:
-                all_ips = socket.gethostbyname_ex(self.server)
-                log(f"Resolved server IPs: {all_ips}")
-            except Exception as e:
-                log(f"Could not resolve server IPs: {e}")
-            
             # Try connection with increased timeout
             self.client.settimeout(30)  # 30-second timeout for connection
             log(f"Attempting to connect to {self.addr} with 30-second timeout")
             self.client.connect(self.addr)
             log("Connection established")
-            
-            # Wait for initial data
-            log("Waiting for initial data from server...")
-            data = self.client.recv(2048)
-            
-            if not data:
-                log("ERROR: Received empty data during connection")
-                return None
-                
-            # Try to unpickle the player ID
-            log(f"Received {len(data)} bytes of data")
-            try:
-                player_id = pickle.loads(data)
-                log(f"Successfully unpickled data: player_id = {player_id}")
-                return player_id
-            except Exception as e:
-                log(f"ERROR: Failed to unpickle data: {e}")
-                log(f"First 100 bytes of raw data: {data[:100]}")
-                return None
+            return self.join()
                 
         except socket.timeout:
             log("ERROR: Connection attempt timed out")
@@ -94,35 +139,255 @@ class Network:
             log(traceback.format_exc())
             return None
 
+    def join(self):
+        """Ask the server for a slot on the connected socket and return our player ID"""
+        try:
+            self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            
+            # Introduce ourselves and wait for a player ID
+            log("Waiting for initial data from server...")
+            welcome = self.handshake(("join", self.name) if self.name else ("join",))
+            if welcome is None:
+                return None
+            
+            _, player_id, self.token, resumed = welcome
+            log(f"Successfully unpickled data: player_id = {player_id}")
+            self.record(eventlog.OPEN, player_id)
+            
+            # From now on the server pushes snapshots several times a second,
+            # so a long silence means the link dropped
+            self.client.settimeout(self.RESPONSE_TIMEOUT)
+            self.last_snapshot = time.monotonic()
+            return player_id
+        
+        except socket.timeout:
+            log("ERROR: Timed out waiting for the server's welcome")
+            return None
+        except Exception as e:
+            log(f"ERROR: Unexpected error during handshake: {e}")
+            log(traceback.format_exc())
+            return None
+
+    def handshake(self, hello):
+        """Send our hello on a freshly connected socket and return the welcome"""
+        message = encode_message(hello)
+        self.client.sendall(message)
+        self.record(eventlog.SEND, len(message))
+        try:
+            welcome = recv_message(self.client, self.inbox)
+        except OSError:
+            raise  # Network errors are up to the caller
+        except Exception as e:
+            log(f"ERROR: Failed to unpickle data: {e}")
+            return None
+        return self.check_welcome(welcome)
+    
+    def check_welcome(self, welcome):
+        """The server's reply to a hello if it's a welcome, else None (logging why)"""
+        if welcome is None:
+            log("ERROR: Received empty data during connection")
+            return None
+        if welcome == "SERVER_FULL":
+            log("ERROR: Server is full")
+            return None
+        if not (isinstance(welcome, tuple) and len(welcome) == 4 and welcome[0] == "welcome"):
+            log(f"ERROR: Unexpected handshake reply: {welcome!r}")
+            return None
+        return welcome
+    
+    def reconnect(self):
+        """Start getting our old slot back on a new socket after the connection dropped
+        
+        Returns False if there's no session to resume. The resume itself
+        never blocks: each send() moves it one step along (see
+        resume_step()) and returns None meanwhile, for up to
+        RECONNECT_WINDOW seconds, so the game keeps drawing and handling
+        events. reconnecting() tells the game that's what the None means.
+        """
+        if self.token is None:
+            return False
+        log("Connection lost - trying to resume session")
+        self.resume_deadline = time.monotonic() + self.RECONNECT_WINDOW
+        self.start_resume_attempt()
+        return True
+    
+    def reconnecting(self):
+        """Whether a resume is under way (send() returns None until it's done)"""
+        return self.resume_deadline is not None
+    
+    def start_resume_attempt(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+        log(f"Resuming session with {self.addr}")
+        self.client = socket.socket(self.family, socket.SOCK_STREAM)
+        self.client.setblocking(False)
+        self.inbox = MessageBuffer()
+        self.resume_stage = "connecting"
+        self.resume_attempt_started = time.monotonic()
+        try:
+            self.client.connect_ex(self.addr)
+        except OSError as e:
+            self.resume_failed(e)
+    
+    def resume_failed(self, error):
+        """Try again in a moment, or give up once the window has run out"""
+        log(f"Resume attempt failed: {error}")
+        self.resume_stage = "retrying"
+        self.resume_attempt_started = time.monotonic()
+        if self.resume_attempt_started + self.RESUME_RETRY_DELAY >= self.resume_deadline:
+            log("ERROR: Could not resume session before the grace window ran out")
+            self.resume_deadline = None
+    
+    def resume_step(self):
+        """Move the resume along without blocking; True once our session is back"""
+        now = time.monotonic()
+        try:
+            if self.resume_stage == "retrying":
+                if now - self.resume_attempt_started >= self.RESUME_RETRY_DELAY:
+                    self.start_resume_attempt()
+                return False
+            
+            if now - self.resume_attempt_started > self.RESPONSE_TIMEOUT:
+                raise socket.timeout("timed out")
+            
+            if self.resume_stage == "connecting":
+                if not select.select([], [self.client], [], 0)[1]:
+                    return False
+                error = self.client.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    raise OSError(error, os.strerror(error))
+                self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                # A fresh socket's send buffer has room for this
+                message = encode_message(("resume", self.token))
+                self.client.sendall(message)
+                self.record(eventlog.SEND, len(message))
+                self.resume_stage = "waiting"
+            
+            data = self.client.recv(65536)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            self.inbox.feed(data)
+            # Only the welcome; snapshots right behind it stay in the inbox
+            welcome = next(iter(self.inbox.messages()), None)
+        except (BlockingIOError, InterruptedError):
+            return False
+        except OSError as e:
+            self.resume_failed(e)
+            return False
+        except Exception as e:
+            log(f"ERROR: Failed to unpickle data: {e}")
+            self.resume_deadline = None
+            return False
+        
+        if welcome is None:
+            return False  # Only part of it so far
+        self.resume_deadline = None
+        welcome = self.check_welcome(welcome)
+        if welcome is None:
+            return False
+        _, player_id, token, resumed = welcome
+        if resumed and player_id == self.player_id:
+            log(f"Session resumed as Player {player_id}")
+            self.record(eventlog.OPEN, player_id)
+            self.client.settimeout(self.RESPONSE_TIMEOUT)
+            # Ticks acked on the old socket mean nothing to the new one
+            self.snapshot_tick = None
+            # The old connection's server side let go of our segment
+            self.close_shm()
+            self.last_snapshot = time.monotonic()
+            return True
+        
+        # Our slot is gone (e.g. we were away too long), don't take a new one
+        log("Session expired - the match is over")
+        self.disconnect()
+        return False
+
     def send(self, data):
-        """Send data to server and get response"""
+        """Send data to server and get the latest game state
+        
+        If the link dropped this starts resuming the session and returns
+        None until it's back; the first call after that sends data again.
+        """
+        if self.reconnecting() and not self.resume_step():
+            return None
+        response = self.exchange(data)
+        if response is None and self.reconnect():
+            self.resume_step()
+        return response
+
+    def send_input(self, buttons):
+        """Send this tick's paddle buttons (game_state.INPUT_UP/INPUT_DOWN bits)
+        
+        Returns the latest game state like send().
+        """
+        self.input_tick += 1
+        self.recent_inputs.append(buttons)
+        self.unapplied_inputs.append((self.input_tick, buttons))
+        return self.send(encode_inputs(self.input_tick, self.recent_inputs))
+    
+    def predicted_paddle_y(self):
+        """Our paddle as the server will have it once it applies our pending inputs
+        
+        Drawing this instead of the server's position hides the round trip
+        from the player. When the server disagrees (e.g. it dropped inputs)
+        the prediction snaps to the server's position on the next snapshot.
+        """
+        state = self.game_state
+        paddle_y = state.left_paddle_y if self.player_id == 0 else state.right_paddle_y
+        for tick, buttons in self.unapplied_inputs:
+            paddle_y = state.step_paddle(paddle_y, buttons)
+        return paddle_y
+    
+    def exchange(self, data):
+        """Send data to server and return the newest game state it pushed
+        
+        The server streams snapshots at a rate that suits our link instead
+        of answering each message, so this only waits when we have no state
+        at all yet. Every message acks the newest snapshot we got, which is
+        how the server measures our round trip time.
+        """
         if not hasattr(self, 'client') or self.client is None:
             log("ERROR: Cannot send data - client socket is not initialized")
             return None
             
         try:
             log(f"Sending data to server: {data}")
-            pickled_data = pickle.dumps(data)
-            log(f"Pickled data size: {len(pickled_data)} bytes")
+            ack = None
+            if self.snapshot_tick is not None:
+                ack = (self.snapshot_tick, time.monotonic() - self.last_snapshot)
+            message = encode_message((ack, data))
+            log(f"Pickled data size: {len(message)} bytes")
             
-            self.client.send(pickled_data)
-            log("Data sent, waiting for response...")
+            # Control messages ride along in the same write
+            now = time.monotonic()
+            for ping, received_at in self.pings_to_answer:
+                message += encode_message(LinkEstimator.pong(ping, received_at))
+            self.pings_to_answer = []
+            if self.link.ping_due(now):
+                message += encode_message(self.link.ping(now))
             
-            received_data = self.client.recv(2048)
-            if not received_data:
-                log("ERROR: Received empty data from server")
-                return None
-                
-            log(f"Received {len(received_data)} bytes from server")
+            # Through shared memory once the server took it, the socket otherwise
+            # (or when the ring is full; the inputs are numbered, so arriving out of order is fine)
+            if not (self.shm_active and self.shm.send(message)):
+                if self.shm is None and not self.shm_declined and self.game_state is not None:
+                    message += self.offer_shm()
+                self.client.sendall(message)
+            self.record(eventlog.SEND, len(message))
             
             try:
-                parsed_data = pickle.loads(received_data)
-                log("Successfully unpickled server response")
-                return parsed_data
+                self.receive_snapshots(wait=self.game_state is None)
+            except socket.error:
+                raise
             except Exception as e:
                 log(f"ERROR: Error unpickling data: {e}")
-                log(f"First 100 bytes of raw response: {received_data[:100]}")
                 return None
+            
+            if time.monotonic() - self.last_snapshot > self.RESPONSE_TIMEOUT:
+                log(f"ERROR: No game state from the server for {self.RESPONSE_TIMEOUT} seconds")
+                return None
+            return self.game_state
                 
         except socket.timeout:
             log("ERROR: Socket timeout while sending/receiving data")
@@ -134,13 +399,241 @@ class Network:
             log(f"ERROR: Unexpected error during send/receive: {e}")
             log(traceback.format_exc())
             return None
+    
+    def receive_snapshots(self, wait=False):
+        """Read every snapshot that has arrived and keep the newest
+        
+        With wait=True, block (up to the socket timeout) until there is one.
+        """
+        while wait and self.game_state is None:
+            message = recv_message(self.client, self.inbox)
+            if message is None:
+                raise ConnectionError("Server closed the connection")
+            self.handle_push(message)
+        
+        if self.shm is not None:
+            received = self.shm.receive()
+            if received:
+                self.record(eventlog.RECV, received)
+                for message in self.shm.inbox.messages():
+                    self.handle_push(message)
+        
+        self.client.setblocking(False)
+        try:
+            while True:
+                for message in self.inbox.messages():
+                    self.handle_push(message)
+                try:
+                    data = self.client.recv(65536)
+                except (BlockingIOError, InterruptedError):
+                    return
+                if not data:
+                    raise ConnectionError("Server closed the connection")
+                self.record(eventlog.RECV, len(data))
+                self.inbox.feed(data)
+        finally:
+            self.client.settimeout(self.RESPONSE_TIMEOUT)
+    
+    def handle_push(self, message):
+        if not isinstance(message, tuple):
+            return
+        if len(message) == 4 and message[0] == "state":
+            _, self.snapshot_tick, self.game_state, applied = message
+            self.last_snapshot = time.monotonic()
+            if self.player_id is not None:
+                while self.unapplied_inputs and self.unapplied_inputs[0][0] <= applied[self.player_id]:
+                    self.unapplied_inputs.popleft()
+        elif message[:1] == ("ping",):
+            self.pings_to_answer.append((message, time.monotonic()))
+        elif message[:1] == ("pong",):
+            self.link.on_pong(message, time.monotonic())
+        elif len(message) == 2 and message[0] == "shm" and self.shm is not None:
+            if message[1]:
+                log(f"Server accepted shared memory {self.shm.name}")
+                self.shm_active = True
+            else:
+                log("Server declined shared memory - staying on the socket")
+                self.shm_declined = True
+                self.close_shm()
+    
+    def offer_shm(self):
+        """Create a shared memory segment and return the message offering it to the server
+        
+        Only a server on this machine can attach, so a remote one declines.
+        """
+        if not shmlink.same_host(self.client):
+            self.shm_declined = True
+            return b""
+        try:
+            self.shm = shmlink.SharedMemoryLink()
+        except OSError as e:
+            log(f"Could not create shared memory: {e}")
+            self.shm_declined = True
+            return b""
+        return encode_message(("shm", self.shm.name))
+    
+    def close_shm(self):
+        """Go back to the socket and remove our segment"""
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+        self.shm_active = False
+    
+    def record(self, code, value=0):
+        """Add an event to the event log, if there is one"""
+        if EVENT_LOG is not None:
+            EVENT_LOG.record(code, self.session, value)
+    
+    def server_time(self):
+        """The server's time.monotonic() right now, as far as we can tell"""
+        return self.link.peer_time()
 
     def disconnect(self):
         """Close the connection"""
         try:
             log("Disconnecting from server")
+            self.resume_deadline = None
+            if self.token is not None:
+                # Tell the server we left on purpose so it frees our slot now
+                self.token = None
+                try:
+                    self.client.sendall(encode_message("leave"))
+                    # Closing with pushed snapshots still unread would reset
+                    # the connection and could discard the leave, so let the
+                    # server close first
+                    self.client.shutdown(socket.SHUT_WR)
+                    self.client.settimeout(0.5)
+                    while self.client.recv(65536):
+                        pass
+                except socket.error:
+                    pass
             self.client.close()
+            self.close_shm()
+            self.record(eventlog.CLOSE)
             log("Disconnected")
         except Exception as e:
             log(f"ERROR: Error during disconnect: {e}")
-            pass
\ No newline at end of file
+            pass
+class ConnectAttempt:
+    """Connects to a server in the background so the UI can keep running
+    
+    Every candidate address (what the server name resolves to, plus any
+    addresses LAN discovery saw the server answer from) gets a non-blocking
+    connect, started ATTEMPT_DELAY apart, happy-eyeballs style. The first
+    socket that connects does the join handshake. If that fails the next
+    connected socket gets a turn. Only the winner ever sends a hello, so
+    the server never seats us twice.
+    """
+    ATTEMPT_DELAY = 0.25  # Seconds before racing the next candidate address
+    TIMEOUT = 10  # Seconds before giving up on every address
+    JOIN_TIMEOUT = 5  # Seconds to wait for the welcome on a connected socket
+    
+    def __init__(self, server="localhost", port=5555, extra_addresses=(), name=None):
+        self.server = server
+        self.port = port
+        self.extra_addresses = list(extra_addresses)
+        self.name = name
+        
+        # Read by the UI thread
+        self.status = f"Looking up {server}..."
+        self.network = None
+        self.done = False
+        self.cancelled = False
+        
+        self.thread = threading.Thread(target=self.run, name="Connect", daemon=True)
+        self.thread.start()
+    
+    def cancel(self):
+        """Stop trying; the background thread closes its sockets and exits"""
+        self.cancelled = True
+    
+    def candidates(self):
+        """Addresses to race, in the order they get a head start"""
+        addresses = []
+        for address in [self.server] + self.extra_addresses:
+            try:
+                # Resolving can block on DNS, which is fine on this thread
+                for family, kind, proto, name, sockaddr in socket.getaddrinfo(
+                        address, self.port, type=socket.SOCK_STREAM):
+                    if (family, sockaddr) not in addresses:
+                        addresses.append((family, sockaddr))
+            except socket.gaierror as e:
+                log(f"Could not resolve {address}: {e}")
+        return addresses
+    
+    def run(self):
+        try:
+            network = self.race(self.candidates())
+            if network is not None and self.cancelled:
+                network.disconnect()  # The player gave up while we were joining
+                network = None
+            self.network = network
+        except Exception as e:
+            log(f"ERROR: Unexpected connection error: {e}")
+            log(traceback.format_exc())
+        finally:
+            self.done = True
+    
+    def race(self, candidates):
+        if not candidates:
+            self.status = f"Could not find {self.server}"
+            return None
+        log(f"Racing connections to {[sockaddr for family, sockaddr in candidates]}")
+        
+        selector = selectors.DefaultSelector()
+        waiting = list(candidates)
+        connected = []
+        deadline = time.monotonic() + self.TIMEOUT
+        next_start = time.monotonic()
+        
+        try:
+            while not self.cancelled and time.monotonic() < deadline:
+                # Start the next candidate when it's due, or right away once
+                # every attempt in flight has failed
+                now = time.monotonic()
+                if waiting and (now >= next_start or not selector.get_map()):
+                    family, sockaddr = waiting.pop(0)
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    sock.connect_ex(sockaddr)
+                    selector.register(sock, selectors.EVENT_WRITE, sockaddr)
+                    next_start = now + self.ATTEMPT_DELAY
+                    self.status = f"Trying {len(candidates) - len(waiting)} of {len(candidates)} addresses..."
+                
+                if not waiting and not selector.get_map() and not connected:
+                    break  # Every address failed
+                
+                for key, mask in selector.select(0.05):
+                    selector.unregister(key.fileobj)
+                    error = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if error:
+                        log(f"Connection to {key.data} failed: {os.strerror(error)}")
+                        key.fileobj.close()
+                    else:
+                        log(f"Connection to {key.data} established")
+                        connected.append((key.fileobj, key.data))
+                
+                # Handshake on the first socket that connected
+                while connected and not self.cancelled:
+                    sock, sockaddr = connected.pop(0)
+                    self.status = f"Joining {sockaddr[0]}..."
+                    network = Network(self.server, self.port, connect=False, name=self.name)
+                    network.client.close()
+                    sock.setblocking(True)
+                    sock.settimeout(self.JOIN_TIMEOUT)
+                    network.client = sock
+                    network.family = sock.family
+                    network.addr = sockaddr[:2]
+                    network.player_id = network.join()
+                    if network.player_id is not None:
+                        return network
+                    sock.close()
+            
+            self.status = "Cancelled" if self.cancelled else f"Could not connect to {self.server}"
+            return None
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            for sock, sockaddr in connected:
+                sock.close()
+            selector.close()
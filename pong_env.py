@@ -0,0 +1,163 @@
+import random
+
+from ai import Bot
+from game_state import GameState, INPUT_UP, INPUT_DOWN
+
+# Training environments on the game's own physics, with the reset()/step()
+# interface of OpenAI Gym (the classic four-value step). Pure Python, so it
+# needs neither gym nor numpy nor a display.
+
+# Actions an agent can take each step
+NOOP = 0
+UP = 1
+DOWN = 2
+ACTION_BUTTONS = (0, INPUT_UP, INPUT_DOWN)
+
+OBSERVATION_SIZE = 6
+
+class PongEnv:
+    """One match against an ai.py opponent
+
+    The agent plays the right paddle by default. Observations are six
+    floats, roughly in [-1, 1]: ball x, ball y, ball x speed, ball y speed,
+    agent paddle y, opponent paddle y. With side="left" they are mirrored so
+    a policy always sees itself on the right. Rewards are +1 when the agent
+    scores and -1 when the opponent does. An episode is one match (first to
+    8 points) or max_steps steps, whichever comes first; two good players
+    can rally forever.
+
+    Each step repeats the action for frame_skip game ticks. With
+    pixels=True, observations are instead a grayscale bytes image of the
+    field, pixel_scale times smaller than the 800x600 screen (row major,
+    0 = background, 255 = paddle or ball).
+    """
+    def __init__(self, opponent="hard", side="right", frame_skip=4, max_steps=5000,
+                 pixels=False, pixel_scale=10, seed=None):
+        self.opponent_difficulty = opponent
+        self.side = side
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.pixels = pixels
+        self.pixel_scale = pixel_scale
+
+        self.rng = random.Random(seed)
+        self.agent_id = 1 if side == "right" else 0
+        self.opponent_id = 1 - self.agent_id
+        self.opponent = Bot(opponent, self.rng)
+
+        self.state = None
+        self.steps = 0
+
+        # Offscreen frame buffer, reused between steps
+        self.pixel_width = 800 // pixel_scale
+        self.pixel_height = 600 // pixel_scale
+        self.frame = bytearray(self.pixel_width * self.pixel_height)
+
+    def reset(self, seed=None):
+        """Start a new match and return the first observation"""
+        if seed is not None:
+            self.rng.seed(seed)
+        self.state = GameState(self.rng)
+        self.state.start_game()
+        self.steps = 0
+        return self.observe()
+
+    def step(self, action):
+        """Play action for frame_skip ticks; returns (observation, reward, done, info)"""
+        state = self.state
+        buttons = ACTION_BUTTONS[action]
+        left_score, right_score = state.left_score, state.right_score
+        for _ in range(self.frame_skip):
+            state.move_paddle(self.agent_id, buttons)
+            self.opponent.move(state, self.opponent_id)
+            state.update_ball()
+            if not state.game_active:
+                break
+
+        reward = (state.right_score - right_score) - (state.left_score - left_score)
+        if self.agent_id == 0:
+            reward = -reward
+
+        self.steps += 1
+        done = not state.game_active or (self.max_steps is not None and self.steps >= self.max_steps)
+        info = {"left_score": state.left_score, "right_score": state.right_score, "steps": self.steps}
+        return self.observe(), reward, done, info
+
+    def observe(self):
+        if self.pixels:
+            return self.render_pixels()
+        state = self.state
+        ball_x = (state.ball_x + state.ball_size / 2) / state.width
+        ball_speed_x = state.ball_speed_x / 10
+        if self.agent_id == 0:
+            # Mirror so the agent is always on the right
+            ball_x = 1 - ball_x
+            ball_speed_x = -ball_speed_x
+        return [
+            ball_x,
+            (state.ball_y + state.ball_size / 2) / state.height,
+            ball_speed_x,
+            state.ball_speed_y / 10,
+            (state.paddle_y(self.agent_id) + state.paddle_height / 2) / state.height,
+            (state.paddle_y(self.opponent_id) + state.paddle_height / 2) / state.height,
+        ]
+
+    def render_pixels(self):
+        """Draw the paddles and ball into the offscreen frame and return a copy"""
+        state = self.state
+        frame = self.frame
+        frame[:] = bytes(len(frame))
+        self.fill_rect(50, state.left_paddle_y, state.paddle_width, state.paddle_height)
+        self.fill_rect(state.width - 50 - state.paddle_width, state.right_paddle_y,
+                       state.paddle_width, state.paddle_height)
+        self.fill_rect(state.ball_x, state.ball_y, state.ball_size, state.ball_size)
+        return bytes(frame)
+
+    def fill_rect(self, x, y, w, h):
+        scale = self.pixel_scale
+        x0 = max(0, int(x) // scale)
+        x1 = min(self.pixel_width, max(x0 + 1, int(x + w) // scale))
+        y0 = max(0, int(y) // scale)
+        y1 = min(self.pixel_height, max(y0 + 1, int(y + h) // scale))
+        if x0 >= x1:
+            return
+        row = b"\xff" * (x1 - x0)
+        for py in range(y0, y1):
+            start = py * self.pixel_width + x0
+            self.frame[start:start + len(row)] = row
+
+class VectorPongEnv:
+    """num_envs PongEnvs stepped together, resetting each one when its episode ends
+
+    step() takes one action per environment and returns lists of
+    observations, rewards, done flags and infos. The observation returned
+    for a finished environment is already the first one of its next
+    episode; the last one of the finished episode is in its info under
+    "final_observation".
+    """
+    def __init__(self, num_envs, seed=None, **kwargs):
+        seeds = random.Random(seed)
+        self.envs = [PongEnv(seed=seeds.getrandbits(32), **kwargs) for _ in range(num_envs)]
+
+    @property
+    def num_envs(self):
+        return len(self.envs)
+
+    def reset(self):
+        return [env.reset() for env in self.envs]
+
+    def step(self, actions):
+        observations = []
+        rewards = []
+        dones = []
+        infos = []
+        for env, action in zip(self.envs, actions):
+            observation, reward, done, info = env.step(action)
+            if done:
+                info["final_observation"] = observation
+                observation = env.reset()
+            observations.append(observation)
+            rewards.append(reward)
+            dones.append(done)
+            infos.append(info)
+        return observations, rewards, dones, infos
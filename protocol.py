@@ -0,0 +1,78 @@
+import pickle
+import struct
+
+# Every message on the wire is a 4-byte big-endian length followed by a pickle.
+# The length prefix lets non-blocking readers split a byte stream into messages
+# no matter how TCP chunks it.
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 64 * 1024  # Anything bigger is a broken or hostile peer
+
+# Player input is sent as raw bytes rather than a pickled object: the
+# client tick of the newest input, then one byte of buttons per tick for the
+# last few ticks, oldest first. Repeating recent inputs lets any one packet
+# fill the gaps left by ones that never arrived.
+INPUT_HEADER = struct.Struct("!I")
+MAX_INPUTS = 32
+
+def encode_message(data):
+    """Pickle data and prefix it with its length"""
+    payload = pickle.dumps(data)
+    return HEADER.pack(len(payload)) + payload
+
+def encode_payload(payload):
+    """Frame an already-pickled payload (e.g. a shared game state snapshot)"""
+    return HEADER.pack(len(payload)) + payload
+
+def encode_inputs(tick, inputs):
+    """Pack the inputs for the ticks up to and including tick"""
+    return INPUT_HEADER.pack(tick) + bytes(inputs)
+
+def decode_inputs(data):
+    """Unpack encode_inputs() into [(tick, buttons), ...], oldest first"""
+    if not INPUT_HEADER.size < len(data) <= INPUT_HEADER.size + MAX_INPUTS:
+        raise ValueError(f"Input packet of {len(data)} bytes")
+    (tick,) = INPUT_HEADER.unpack_from(data)
+    inputs = data[INPUT_HEADER.size:]
+    first = tick - len(inputs) + 1
+    return [(first + i, buttons) for i, buttons in enumerate(inputs)]
+
+class MessageBuffer:
+    """Collects received bytes and yields complete messages"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+    def messages(self):
+        """Yield every complete message currently buffered"""
+        offset = 0
+        buffered = len(self.buffer)
+        try:
+            while buffered - offset >= HEADER.size:
+                (size,) = HEADER.unpack_from(self.buffer, offset)
+                if size > MAX_MESSAGE_SIZE:
+                    raise ValueError(f"Message of {size} bytes exceeds limit of {MAX_MESSAGE_SIZE}")
+                end = offset + HEADER.size + size
+                if end > buffered:
+                    break
+                payload = bytes(self.buffer[offset + HEADER.size:end])
+                offset = end
+                yield pickle.loads(payload)
+        finally:
+            # Drop consumed bytes in one go rather than once per message
+            del self.buffer[:offset]
+
+def recv_message(sock, buffer):
+    """Block until one complete message arrives on sock
+
+    Returns None if the peer closed the connection.
+    """
+    while True:
+        for message in buffer.messages():
+            return message
+        data = sock.recv(4096)
+        if not data:
+            return None
+        buffer.feed(data)
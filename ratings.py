@@ -0,0 +1,203 @@
+import random
+
+# Player ratings, updated one match at a time, and a leaderboard kept in
+# rating order as they change. Neither ever needs the match history: a
+# rating moves by the result of each match as it's reported, and the
+# leaderboard only moves the two players involved.
+
+DEFAULT_RATING = 1500.0
+K_FACTOR = 20  # Most a settled rating moves in one match
+PROVISIONAL_K_FACTOR = 40  # Same for a player's first matches, so they find their level fast
+PROVISIONAL_MATCHES = 20
+
+def expected_score(rating, opponent_rating):
+    """Chance that a player rated rating beats one rated opponent_rating (Elo)"""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+class SkipNode:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        # How many places along the bottom level each link skips
+        self.width = [1] * levels
+
+class Leaderboard:
+    """Names in rating order, highest first, as an indexable skip list
+
+    update(), remove() and rank() take O(log n) expected time; top(n)
+    walks n nodes. Ties are broken by name so the order is stable.
+    """
+    MAX_LEVELS = 24  # Enough for 2**24 players at the usual 1/2 promotion rate
+
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+        self.tail = SkipNode(None, 0)
+        self.head = SkipNode(None, self.MAX_LEVELS)
+        self.head.next = [self.tail] * self.MAX_LEVELS
+        self.keys = {}  # Name -> its (-rating, name) key in the list
+
+    def __len__(self):
+        return len(self.keys)
+
+    def path_to(self, key):
+        """The last node before key on every level, and their bottom-level positions"""
+        chain = [None] * self.MAX_LEVELS
+        positions = [0] * self.MAX_LEVELS
+        node = self.head
+        position = 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not self.tail and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def update(self, name, rating):
+        """Add name with rating, or move it to its new place"""
+        if name in self.keys:
+            self.remove(name)
+        key = (-rating, name)
+        self.keys[name] = key
+
+        levels = 1
+        while levels < self.MAX_LEVELS and self.rng.random() < 0.5:
+            levels += 1
+        chain, positions = self.path_to(key)
+        node = SkipNode(key, levels)
+        position = positions[0] + 1  # Where the new node lands
+        for level in range(levels):
+            before = chain[level]
+            node.next[level] = before.next[level]
+            before.next[level] = node
+            skipped = position - positions[level]
+            node.width[level] = before.width[level] - skipped + 1
+            before.width[level] = skipped
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def remove(self, name):
+        key = self.keys.pop(name)
+        chain, positions = self.path_to(key)
+        node = chain[0].next[0]
+        for level in range(len(node.next)):
+            before = chain[level]
+            before.width[level] += node.width[level] - 1
+            before.next[level] = node.next[level]
+        for level in range(len(node.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+    def rank(self, name):
+        """1 for the top player, None if name isn't on the board"""
+        key = self.keys.get(name)
+        if key is None:
+            return None
+        chain, positions = self.path_to(key)
+        return positions[0] + 1
+
+    def top(self, count):
+        """[(name, rating)] of the count best players"""
+        players = []
+        node = self.head.next[0]
+        while node is not self.tail and len(players) < count:
+            players.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return players
+
+class Ratings:
+    """Every player's Elo rating, kept current match by match, with a leaderboard
+
+    With report_changes set, every change is also appended to changes
+    until the owner clears it (a worker process passes them on to its
+    supervisor, whose own Ratings apply() them).
+    """
+    def __init__(self, report_changes=False):
+        self.players = {}  # Name -> [rating, matches, wins]
+        self.leaderboard = Leaderboard()
+        self.report_changes = report_changes
+        self.changes = []
+
+    def load(self, rows):
+        """Start from saved (name, rating, matches, wins) rows"""
+        for name, rating, matches, wins in rows:
+            self.players[name] = [rating, matches, wins]
+            self.leaderboard.update(name, rating)
+
+    def rating(self, name):
+        player = self.players.get(name)
+        return DEFAULT_RATING if player is None else player[0]
+
+    def k_factor(self, name):
+        player = self.players.get(name)
+        provisional = player is None or player[1] < PROVISIONAL_MATCHES
+        return PROVISIONAL_K_FACTOR if provisional else K_FACTOR
+
+    def record_match(self, winner, loser):
+        """Rate a match between two names; returns the [(name, rating change, won)]"""
+        surprise = 1 - expected_score(self.rating(winner), self.rating(loser))
+        changes = [(winner, self.k_factor(winner) * surprise, 1),
+                   (loser, -self.k_factor(loser) * surprise, 0)]
+        self.apply(changes)
+        if self.report_changes:
+            self.changes += changes
+        return changes
+
+    def apply(self, changes):
+        """Apply rating changes worked out elsewhere"""
+        for name, delta, won in changes:
+            player = self.players.get(name)
+            if player is None:
+                player = self.players[name] = [DEFAULT_RATING, 0, 0]
+            player[0] += delta
+            player[1] += 1
+            player[2] += won
+            self.leaderboard.update(name, player[0])
+
+    def top(self, count=10):
+        """[(rank, name, rating, matches, wins)] of the count best players"""
+        return [(rank, name, round(rating), self.players[name][1], self.players[name][2])
+                for rank, (name, rating) in enumerate(self.leaderboard.top(count), 1)]
+
+    def rank(self, name):
+        return self.leaderboard.rank(name)
+
+def fetch_leaderboard(host, port=5555, count=10, timeout=5):
+    """Ask a running server for its top players: [(rank, name, rating, matches, wins)]"""
+    import socket
+    from protocol import MessageBuffer, encode_message, recv_message
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(encode_message(("leaderboard", count)))
+        reply = recv_message(sock, MessageBuffer())
+    if not (isinstance(reply, tuple) and len(reply) == 2 and reply[0] == "leaderboard"):
+        raise ValueError(f"Unexpected reply {reply!r}")
+    return reply[1]
+
+def main(argv=None, prog=None):
+    """Print the leaderboard of a running server, or of the local results database"""
+    import argparse
+    import os
+    import results
+    parser = argparse.ArgumentParser(prog=prog, description="Show the top rated players")
+    parser.add_argument("--server", metavar="HOST[:PORT]", help="ask this server (default: read the local database)")
+    parser.add_argument("--db", default=results.DEFAULT_PATH, help="results database")
+    parser.add_argument("--top", type=int, default=10, help="players to list")
+    args = parser.parse_args(argv)
+
+    if args.server:
+        host, _, port = args.server.partition(":")
+        rows = fetch_leaderboard(host, int(port or 5555), args.top)
+    elif os.path.exists(args.db):
+        ratings = Ratings()
+        ratings.load(results.load_ratings(results.connect(args.db)))
+        rows = ratings.top(args.top)
+    else:
+        rows = []
+    if not rows:
+        print("No rated players yet")
+    for rank, name, rating, matches, wins in rows:
+        print(f"{rank:4}. {name:20} {rating:5}  ({wins} wins in {matches} matches)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import pygame
+
+# Gameplay drawing, one batch per frame. Drawing every paddle and ball with
+# its own pygame.draw.rect() and rendering the scores anew every frame is
+# fine for three objects, but chaos mode has hundreds. Here each distinct
+# shape and string is rendered once, converted to the display's pixel
+# format (so blitting it is a plain copy), and a frame is a list of
+# (surface, position) pairs handed to Surface.blits() in one call.
+
+class SpriteBatch:
+    """Collects a frame's sprites and text and draws them with one Surface.blits()
+
+    Only use it once the display mode is set: cached surfaces are
+    converted to its format. Colors with an alpha value get per-pixel
+    alpha (convert_alpha()), others are opaque (convert()).
+    """
+    MAX_TEXTS = 256  # Rendered strings kept; the oldest goes first
+
+    def __init__(self):
+        self.sprites = {}  # (width, height, color) -> Surface
+        self.texts = {}  # (font, text, color) -> Surface
+        self.batch = []
+
+    def __len__(self):
+        return len(self.batch)
+
+    def sprite(self, width, height, color):
+        """A width x height rectangle of color, rendered once"""
+        key = (width, height, color)
+        surface = self.sprites.get(key)
+        if surface is None:
+            if len(color) == 4:
+                surface = pygame.Surface((width, height), pygame.SRCALPHA)
+                surface.fill(color)
+                surface = surface.convert_alpha()
+            else:
+                surface = pygame.Surface((width, height))
+                surface.fill(color)
+                surface = surface.convert()
+            self.sprites[key] = surface
+        return surface
+
+    def text(self, font, text, color):
+        """text rendered in font, rendered again only when it changes"""
+        key = (font, text, color)
+        surface = self.texts.get(key)
+        if surface is None:
+            if len(self.texts) >= self.MAX_TEXTS:
+                del self.texts[next(iter(self.texts))]
+            surface = self.texts[key] = font.render(text, True, color).convert_alpha()
+        return surface
+
+    def rect(self, color, x, y, width, height):
+        """Queue a filled rectangle"""
+        self.batch.append((self.sprite(width, height, color), (x, y)))
+
+    def rects(self, color, positions, width, height):
+        """Queue a rectangle of the same size and color at each (x, y)"""
+        surface = self.sprite(width, height, color)
+        self.batch += [(surface, position) for position in positions]
+
+    def blit(self, surface, position):
+        self.batch.append((surface, position))
+
+    def draw_text(self, font, text, color, x, y):
+        """Queue text at (x, y), or centered on the screen's width with x None; returns its Surface"""
+        surface = self.text(font, text, color)
+        if x is None:
+            x = pygame.display.get_surface().get_width() // 2 - surface.get_width() // 2
+        self.batch.append((surface, (x, y)))
+        return surface
+
+    def draw(self, screen):
+        """Blit everything queued, in order, and start the next frame"""
+        screen.blits(self.batch, doreturn=False)
+        self.batch.clear()
@@ -0,0 +1,261 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from ratings import DEFAULT_RATING
+
+# Match results and statistics in an SQLite database. Games hand finished
+# matches to a ResultsStore, whose background thread batches them into
+# transactions, so a tick never waits on the disk. The database is in WAL
+# mode, so readers (e.g. `python results.py`) never block the writers, and
+# several server processes can share one file.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    finished_at REAL NOT NULL,      -- Unix time
+    source TEXT NOT NULL,           -- "server" or "local"
+    room INTEGER,                   -- Server room, NULL for local games
+    duration REAL NOT NULL,         -- Seconds
+    left_score INTEGER NOT NULL,
+    right_score INTEGER NOT NULL,
+    winner INTEGER NOT NULL,        -- 0 = left, 1 = right
+    forfeit INTEGER NOT NULL,       -- 1 if the loser left before the end
+    rallies INTEGER NOT NULL,       -- Points played
+    longest_rally INTEGER NOT NULL, -- Paddle hits in the longest rally
+    average_rally REAL NOT NULL,
+    max_ball_speed REAL NOT NULL    -- Pixels per tick
+);
+CREATE TABLE IF NOT EXISTS match_players (
+    match_id INTEGER NOT NULL REFERENCES matches(id),
+    side INTEGER NOT NULL,          -- 0 = left, 1 = right
+    name TEXT NOT NULL,
+    bot TEXT,                       -- AI difficulty, NULL for humans
+    points INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    PRIMARY KEY (match_id, side)
+);
+CREATE INDEX IF NOT EXISTS match_players_by_name ON match_players(name);
+CREATE TABLE IF NOT EXISTS ratings (
+    name TEXT PRIMARY KEY,
+    rating REAL NOT NULL,           -- Elo, see ratings.py
+    matches INTEGER NOT NULL,
+    wins INTEGER NOT NULL
+);
+"""
+
+def connect(path=DEFAULT_PATH):
+    """Open (creating if need be) a results database"""
+    db = sqlite3.connect(path, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only risks the last transactions on power loss, never corruption
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+class MatchStats:
+    """Hits, rallies and top ball speed of one match, counted while it's played
+
+    Games with their own physics call on_hit(), on_point() and
+    on_ball_speed(); for a GameState, calling observe() once per tick
+    works it out from the state.
+    """
+    def __init__(self):
+        self.started_at = time.time()
+        self.hits = [0, 0]
+        self.points = [0, 0]
+        self.rally = 0  # Hits in the rally being played
+        self.rally_hits = 0  # Hits in every finished rally
+        self.longest_rally = 0
+        self.max_ball_speed = 0.0
+
+        # What observe() saw last tick
+        self.last_direction = None
+        self.last_scores = None
+
+    def on_hit(self, side):
+        self.hits[side] += 1
+        self.rally += 1
+
+    def on_point(self, side):
+        """side scored"""
+        self.points[side] += 1
+        self.rally_hits += self.rally
+        self.longest_rally = max(self.longest_rally, self.rally)
+        self.rally = 0
+
+    def on_ball_speed(self, speed_x, speed_y):
+        speed = (speed_x * speed_x + speed_y * speed_y) ** 0.5
+        if speed > self.max_ball_speed:
+            self.max_ball_speed = speed
+
+    def observe(self, state):
+        """Update from a GameState after its tick"""
+        scores = (state.left_score, state.right_score)
+        direction = state.ball_speed_x > 0
+        if self.last_scores is not None:
+            if scores != self.last_scores:
+                self.on_point(0 if scores[0] > self.last_scores[0] else 1)
+            elif direction != self.last_direction:
+                # The ball turned around: whoever it now moves away from hit it
+                self.on_hit(0 if direction else 1)
+        self.last_scores = scores
+        self.last_direction = direction
+        self.on_ball_speed(state.ball_speed_x, state.ball_speed_y)
+
+    def rallies(self):
+        return self.points[0] + self.points[1]
+
+    def result(self, names, winner, source, room=None, forfeit=False, bots=(None, None), rating_changes=()):
+        """The row ResultsStore.record() takes
+
+        names are the (left, right) players, winner is 0 (left) or 1
+        (right), and bots gives the AI difficulty of a side a bot played.
+        rating_changes are what ratings.Ratings.record_match() returned.
+        """
+        rallies = self.rallies()
+        return (time.time(), source, room, time.time() - self.started_at, self.points[0], self.points[1],
+                winner, int(forfeit), rallies, self.longest_rally,
+                self.rally_hits / rallies if rallies else 0.0, self.max_ball_speed,
+                tuple(names), tuple(bots), tuple(self.hits), tuple(rating_changes))
+
+class ResultsStore:
+    """Writes match results on a background thread, in batches
+
+    record() only puts the result on a queue. The writer takes everything
+    queued (up to BATCH_SIZE) once the oldest result has waited
+    BATCH_DELAY seconds and writes it in one transaction, so a busy server
+    pays for one commit per batch rather than one per match. close(),
+    which also runs at exit, writes whatever is still queued.
+    """
+    BATCH_SIZE = 1000
+    BATCH_DELAY = 0.5  # Seconds a result waits for others to share its commit
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.written = 0
+        self.batches = 0
+        self.closed = False
+        # Open here so a bad path fails in the caller, not silently on the thread
+        connect(path).close()
+        self.thread = threading.Thread(target=self.run, name="Results writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, result):
+        """Queue a MatchStats.result() for writing; never blocks"""
+        if not self.closed:
+            self.queue.put(result)
+
+    def run(self):
+        db = connect(self.path)
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.BATCH_DELAY
+            while len(batch) < self.BATCH_SIZE and batch[-1] is not None:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:  # close() was called
+                running = False
+                batch.pop()
+            if batch:
+                self.write(db, batch)
+        db.close()
+
+    def write(self, db, batch):
+        try:
+            with db:  # One transaction
+                for (finished_at, source, room, duration, left_score, right_score, winner, forfeit,
+                     rallies, longest_rally, average_rally, max_ball_speed, names, bots, hits,
+                     rating_changes) in batch:
+                    match_id = db.execute(
+                        "INSERT INTO matches (finished_at, source, room, duration, left_score, right_score, "
+                        "winner, forfeit, rallies, longest_rally, average_rally, max_ball_speed) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (finished_at, source, room, duration, left_score, right_score, winner, forfeit,
+                         rallies, longest_rally, average_rally, max_ball_speed)).lastrowid
+                    db.executemany(
+                        "INSERT INTO match_players (match_id, side, name, bot, points, hits, won) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(match_id, side, names[side], bots[side], (left_score, right_score)[side],
+                          hits[side], int(winner == side)) for side in (0, 1)])
+                    # Changes rather than new values, so processes sharing the
+                    # database never overwrite each other's updates
+                    db.executemany(
+                        "INSERT INTO ratings (name, rating, matches, wins) VALUES (?, ? + ?, 1, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET rating = rating + ?, "
+                        "matches = matches + 1, wins = wins + ?",
+                        [(name, DEFAULT_RATING, delta, won, delta, won) for name, delta, won in rating_changes])
+            self.written += len(batch)
+            self.batches += 1
+        except sqlite3.Error as e:
+            print(f"ERROR: Could not save {len(batch)} match results to {self.path}: {e}")
+
+    def close(self, timeout=10):
+        """Write what's queued and stop the writer"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+def load_ratings(db):
+    """Every player's (name, rating, matches, wins), for ratings.Ratings.load()"""
+    return db.execute("SELECT name, rating, matches, wins FROM ratings").fetchall()
+
+def recent_matches(db, limit=10):
+    return db.execute(
+        "SELECT m.finished_at, m.source, l.name, r.name, m.left_score, m.right_score, m.forfeit, "
+        "m.rallies, m.longest_rally, m.max_ball_speed "
+        "FROM matches m JOIN match_players l ON l.match_id = m.id AND l.side = 0 "
+        "JOIN match_players r ON r.match_id = m.id AND r.side = 1 "
+        "ORDER BY m.id DESC LIMIT ?", (limit,)).fetchall()
+
+def player_totals(db, limit=20):
+    """(name, matches, wins, points, hits, longest rally) of the most active players"""
+    return db.execute(
+        "SELECT p.name, COUNT(*), SUM(p.won), SUM(p.points), SUM(p.hits), MAX(m.longest_rally) "
+        "FROM match_players p JOIN matches m ON m.id = p.match_id "
+        "GROUP BY p.name ORDER BY COUNT(*) DESC LIMIT ?", (limit,)).fetchall()
+
+def main(argv=None, prog=None):
+    """Print recent matches and player totals from the command line"""
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog, description="Show saved match results")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="results database")
+    parser.add_argument("--recent", type=int, default=10, help="recent matches to list")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"No results yet ({args.db} doesn't exist)")
+        return
+    db = connect(args.db)
+    total, = db.execute("SELECT COUNT(*) FROM matches").fetchone()
+    print(f"{total:,} matches in {args.db}\n")
+
+    print("Recent matches:")
+    for (finished_at, source, left, right, left_score, right_score, forfeit,
+         rallies, longest_rally, max_ball_speed) in recent_matches(db, args.recent):
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(finished_at))
+        print(f"  {when} {source:6} {left:>16} {left_score:2} - {right_score:<2} {right:16} "
+              f"{rallies} rallies, longest {longest_rally} hits, top speed {max_ball_speed:.1f}"
+              + (" (forfeit)" if forfeit else ""))
+
+    print("\nPlayers:")
+    for name, matches, wins, points, hits, longest_rally in player_totals(db):
+        print(f"  {name:>16} {matches:5} matches, {wins:5} wins, {points:6} points, {hits:7} hits, "
+              f"longest rally {longest_rally}")
+
+if __name__ == "__main__":
+    main()
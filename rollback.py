@@ -0,0 +1,543 @@
+import random
+import socket
+import struct
+import time
+import zlib
+
+from game_state import DEFAULT_CONFIG, INPUT_UP, INPUT_DOWN, PADDLE_SPEED, xorshift32
+from latency import LinkEstimator
+from protocol import MAX_INPUTS, encode_inputs, decode_inputs
+
+# Peer-to-peer matches without a server, GGPO style. Both peers run the
+# same deterministic simulation (FixedGame) and only send each other
+# their inputs, so what one player does is one network hop from the
+# other's screen instead of two. Each peer plays its own input a few
+# frames late (the input delay, which hides most of the trip) and guesses
+# the other's by repeating the last one it has. When a real input turns
+# out different from the guess, the peer restores the state saved before
+# that frame and replays the frames since with the right inputs, all
+# before the next frame is drawn.
+#
+# Every HASH_INTERVAL frames, once both players' inputs up to there are
+# final, each peer sends a checksum of its state at that frame. If they
+# differ the simulations have drifted apart (a bug, or a float sneaking
+# into the physics), and the host sends its state at that checkpoint for
+# the joining peer to restore and replay from, so only the frames since
+# the checkpoint are redone instead of the match being lost.
+
+P2P_PORT = 5557
+INPUT_DELAY = 2  # Default frames a local input waits before it's played
+INPUT_RESTART = 4  # Input bit: start a new match once one is over
+HASH_INTERVAL = 30  # Frames between state checksums
+RESYNC_WINDOW = 6 * HASH_INTERVAL  # Oldest checkpoint, in frames, that can still be resynced to
+
+SUBPIXELS = 256  # FixedGame positions and speeds are integers, in 1/256 pixels
+
+class FixedGame:
+    """GameState's rules in integer arithmetic, so every machine plays the same match
+
+    Positions and speeds are in SUBPIXELS and serves come from the state's
+    own seeded generator (xorshift32), so where the match is after any
+    sequence of inputs depends only on the seed and those inputs. The
+    whole state is a few ints: save() is one tuple, restore() puts it back.
+    """
+    STATE = struct.Struct("!10q")  # save() on the wire, and what checksum() hashes
+
+    __slots__ = ("config", "left_paddle_y", "right_paddle_y", "ball_x", "ball_y", "ball_speed_x",
+                 "ball_speed_y", "left_score", "right_score", "winner", "rng_state")
+
+    def __init__(self, seed, config=DEFAULT_CONFIG):
+        self.config = config
+        self.rng_state = (seed & 0xFFFFFFFF) or 1  # xorshift never leaves 0
+        self.left_paddle_y = (config.height // 2 - config.paddle_height // 2) * SUBPIXELS
+        self.right_paddle_y = self.left_paddle_y
+        self.start_game()
+
+    def random(self, n):
+        """Next number from 0 to n - 1"""
+        self.rng_state = xorshift32(self.rng_state)
+        return self.rng_state % n
+
+    def save(self):
+        return (self.left_paddle_y, self.right_paddle_y, self.ball_x, self.ball_y, self.ball_speed_x,
+                self.ball_speed_y, self.left_score, self.right_score, self.winner, self.rng_state)
+
+    def restore(self, saved):
+        (self.left_paddle_y, self.right_paddle_y, self.ball_x, self.ball_y, self.ball_speed_x,
+         self.ball_speed_y, self.left_score, self.right_score, self.winner, self.rng_state) = saved
+
+    @classmethod
+    def checksum(cls, saved):
+        """CRC-32 of a save(), the same on every machine for the same state"""
+        return zlib.crc32(cls.STATE.pack(*saved))
+
+    def start_game(self):
+        self.left_score = 0
+        self.right_score = 0
+        self.winner = 0  # 1 = left, 2 = right
+        self.reset_ball()
+
+    def reset_ball(self):
+        config = self.config
+        self.ball_x = (config.width // 2 - config.ball_size // 2) * SUBPIXELS
+        self.ball_y = (config.height // 2 - config.ball_size // 2) * SUBPIXELS
+        self.ball_speed_x = 5 * SUBPIXELS * (1 if self.random(2) else -1)
+        self.ball_speed_y = (self.random(11) - 5) * SUBPIXELS
+
+    def step_paddle(self, paddle_y, buttons):
+        if buttons & INPUT_UP:
+            paddle_y -= PADDLE_SPEED * SUBPIXELS
+        if buttons & INPUT_DOWN:
+            paddle_y += PADDLE_SPEED * SUBPIXELS
+        return max(0, min((self.config.height - self.config.paddle_height) * SUBPIXELS, paddle_y))
+
+    def step(self, left_buttons, right_buttons):
+        """Advance one frame with both players' buttons"""
+        self.left_paddle_y = self.step_paddle(self.left_paddle_y, left_buttons)
+        self.right_paddle_y = self.step_paddle(self.right_paddle_y, right_buttons)
+        if not self.winner:
+            self.update_ball()
+        elif (left_buttons | right_buttons) & INPUT_RESTART:
+            self.start_game()
+
+    def update_ball(self):
+        config = self.config
+        width = config.width * SUBPIXELS
+        height = config.height * SUBPIXELS
+        paddle_width = config.paddle_width * SUBPIXELS
+        paddle_height = config.paddle_height * SUBPIXELS
+        ball_size = config.ball_size * SUBPIXELS
+        margin = 50 * SUBPIXELS
+
+        # Move the ball
+        self.ball_x += self.ball_speed_x
+        self.ball_y += self.ball_speed_y
+
+        # Ball collision with top and bottom walls
+        if self.ball_y <= 0:
+            self.ball_y = 0
+            self.ball_speed_y = -self.ball_speed_y
+        elif self.ball_y + ball_size >= height:
+            self.ball_y = height - ball_size
+            self.ball_speed_y = -self.ball_speed_y
+
+        # Paddle collisions. As in GameState, the return angle is up to 5
+        # pixels per tick by how far off center the ball meets the paddle,
+        # here rounded down to a subpixel.
+        if (self.ball_x <= margin + paddle_width and self.ball_x + ball_size >= margin and
+                self.ball_y + ball_size >= self.left_paddle_y and
+                self.ball_y <= self.left_paddle_y + paddle_height):
+            self.ball_speed_y = (5 * SUBPIXELS * (2 * self.ball_y + ball_size - 2 * self.left_paddle_y - paddle_height)
+                                 // paddle_height)
+            self.ball_speed_x = -self.ball_speed_x
+            self.ball_x = margin + paddle_width + SUBPIXELS
+
+        if (self.ball_x + ball_size >= width - margin - paddle_width and self.ball_x <= width - margin and
+                self.ball_y + ball_size >= self.right_paddle_y and
+                self.ball_y <= self.right_paddle_y + paddle_height):
+            self.ball_speed_y = (5 * SUBPIXELS * (2 * self.ball_y + ball_size - 2 * self.right_paddle_y - paddle_height)
+                                 // paddle_height)
+            self.ball_speed_x = -self.ball_speed_x
+            self.ball_x = width - margin - paddle_width - ball_size - SUBPIXELS
+
+        # Scoring
+        if self.ball_x <= 0:
+            self.right_score += 1
+            self.reset_ball()
+        elif self.ball_x + ball_size >= width:
+            self.left_score += 1
+            self.reset_ball()
+
+        # Check win condition
+        if self.left_score > 7:
+            self.winner = 1
+        elif self.right_score > 7:
+            self.winner = 2
+
+# Datagrams start with one byte saying what they are
+HELLO = 1  # Joining peer -> host, until a WELCOME comes back
+WELCOME = 2  # Host -> joining peer: seed, input delay
+INPUTS = 3  # Either way, every frame: see RollbackSession.send_inputs()
+BYE = 4  # The peer quit
+SYNC = 5  # Host -> joining peer after a checksum mismatch: its state at a checkpoint
+KIND = struct.Struct("!B")
+WELCOME_BODY = struct.Struct("!IB")
+# Sender's frame, newest frame it has every input up to (-1 for none), and
+# for round trip times its clock (ms), the last clock value it got from us
+# (0 for none) and how long it held that one before this send (ms), then
+# its newest checkpoint frame (-1 for none) and that state's checksum
+INPUTS_BODY = struct.Struct("!IiIIHiI")
+SYNC_FRAME = struct.Struct("!I")  # Followed by the FixedGame.STATE at that frame
+
+def clock_ms():
+    # Never 0, which means "nothing to echo"
+    return (int(time.monotonic() * 1000) & 0xFFFFFFFF) or 1
+
+class P2PHandshake:
+    """Finds the other peer; call poll() every frame until it returns a RollbackSession
+
+    The host waits on port for a HELLO. The joining peer sends one to
+    join_host every HELLO_INTERVAL until the WELCOME comes back, with the
+    seed and input delay both peers play with. The host plays the left
+    paddle.
+    """
+    HELLO_INTERVAL = 0.25
+    TIMEOUT = 30  # Seconds the joining peer tries before giving up
+
+    def __init__(self, join_host=None, port=P2P_PORT, input_delay=INPUT_DELAY):
+        self.port = port
+        self.input_delay = input_delay
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.failed = False
+        self.next_hello = 0
+        self.deadline = time.monotonic() + self.TIMEOUT
+        if join_host is None:
+            self.peer = None
+            self.seed = random.getrandbits(32)
+            self.sock.bind(("", port))
+            self.status = f"Waiting for a peer on UDP port {port}..."
+        else:
+            self.peer = socket.getaddrinfo(join_host, port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+            self.seed = None
+            self.sock.bind(("", 0))
+            self.status = f"Contacting {join_host}:{port}..."
+
+    def hosting(self):
+        return self.seed is not None
+
+    def poll(self):
+        """The session once the peers have found each other, else None"""
+        if self.failed:
+            return None
+        now = time.monotonic()
+        if not self.hosting():
+            if now >= self.deadline:
+                self.failed = True
+                self.status = "No answer from the other peer"
+                self.sock.close()
+                return None
+            if now >= self.next_hello:
+                self.next_hello = now + self.HELLO_INTERVAL
+                try:
+                    self.sock.sendto(KIND.pack(HELLO), self.peer)
+                except OSError as e:
+                    self.status = f"Send failed: {e}"
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return None
+            except OSError:
+                continue  # e.g. ICMP port unreachable while the host isn't up yet
+            if not data:
+                continue
+            kind = data[0]
+            if self.hosting() and kind == HELLO:
+                welcome = KIND.pack(WELCOME) + WELCOME_BODY.pack(self.seed, self.input_delay)
+                self.sock.sendto(welcome, addr)
+                return RollbackSession(self.sock, addr, 0, self.seed, self.input_delay, welcome)
+            if not self.hosting() and kind == WELCOME and addr == self.peer:
+                seed, input_delay = WELCOME_BODY.unpack_from(data, KIND.size)
+                return RollbackSession(self.sock, addr, 1, seed, input_delay)
+
+    def cancel(self):
+        self.failed = True
+        self.sock.close()
+
+class RollbackSession:
+    """One P2P match: this peer's FixedGame, kept in step with the other peer's
+
+    Call advance() once per frame with the local buttons. It reads the
+    peer's inputs, rolls back and replays if a guess was wrong, then plays
+    the frame, unless this peer has got MAX_ROLLBACK frames ahead of the
+    inputs it has, or is ahead of the peer's clock (see time_sync_wait()),
+    in which case it waits a frame.
+
+    It also compares checksums of the state at every HASH_INTERVAL frames
+    with the peer's (see record_checkpoints()); after a mismatch the host
+    sends its state and the joining peer resyncs to it (see resync()).
+    """
+    MAX_ROLLBACK = 8  # Most frames played on guessed inputs
+    SYNC_INTERVAL = 10  # Fewest frames between two waits that let a slower peer catch up
+    TIMEOUT = 5.0  # Seconds without a datagram before the peer counts as gone
+    FRAME_RATE = 60
+
+    def __init__(self, sock, peer, side, seed, input_delay=INPUT_DELAY, welcome=None):
+        self.sock = sock
+        self.peer = peer
+        self.side = side  # 0 = left (the host), 1 = right
+        self.input_delay = input_delay
+        self.welcome = welcome  # Sent again if the peer's HELLOs keep coming
+        self.game = FixedGame(seed)
+
+        # The next frame to play
+        self.frame = 0
+
+        # Our inputs by frame, kept until the peer has them and they're too
+        # old to replay. The first input_delay frames have no input.
+        self.local_inputs = {frame: 0 for frame in range(input_delay)}
+        self.local_oldest = 0
+        self.local_newest = input_delay - 1
+
+        # The peer's inputs by frame, every one up to remote_confirmed
+        # received, and the guesses frames were played with while theirs
+        # hadn't arrived
+        self.remote_inputs = {-1: 0}
+        self.remote_confirmed = -1
+        self.predicted = {}
+        self.rollback_from = None  # Oldest frame played on a wrong guess
+
+        # Game state before each recent frame, to roll back to, from
+        # saved_oldest on (a resync saves states older than a rollback reaches)
+        self.saved = {}
+        self.saved_oldest = 0
+
+        # Checkpoints: (checksum, state) before every HASH_INTERVAL'th frame
+        # whose inputs are all final, for the last RESYNC_WINDOW frames
+        self.checkpoints = {}
+        self.next_checkpoint = 0
+        self.last_checkpoint = -1
+        self.peer_checkpoint = (-1, 0)  # The peer's newest (frame, checksum)
+        self.compared = -1  # Newest checkpoint compared with the peer's
+        self.pending_sync = None  # (frame, state) from the host to resync to
+
+        # The newest of our inputs the peer has, its latest frame and when we heard
+        self.peer_ack = -1
+        self.peer_frame = 0
+        self.last_heard = time.monotonic()
+        self.disconnected = None  # Why the session ended
+
+        # Round trip time, from clock values echoed in the inputs datagrams
+        self.link = LinkEstimator()
+        self.echo = 0
+        self.echo_received = 0.0
+        self.last_echo = 0
+
+        self.next_sync_wait = 0
+        self.rollbacks = 0
+        self.replayed_frames = 0
+        self.waits = 0
+        self.desyncs = 0
+
+    def advance(self, buttons):
+        """Play one frame with this frame's local buttons; False if waiting for the peer instead"""
+        self.receive()
+        if self.disconnected:
+            return False
+        self.replay()
+        self.resync()
+        self.record_checkpoints()
+        if self.frame - self.remote_confirmed > self.MAX_ROLLBACK or self.time_sync_wait():
+            self.waits += 1
+            self.send_inputs()
+            return False
+
+        self.local_newest = self.frame + self.input_delay
+        self.local_inputs[self.local_newest] = buttons
+        self.send_inputs()
+        self.play(self.frame)
+        self.frame += 1
+        self.forget_old()
+        return True
+
+    def play(self, frame):
+        """Save the state and play frame, guessing the peer's input if it isn't here yet"""
+        self.saved[frame] = self.game.save()
+        local = self.local_inputs[frame]
+        remote = self.remote_inputs.get(frame)
+        if remote is None:
+            remote = self.remote_inputs[self.remote_confirmed]
+            self.predicted[frame] = remote
+        if self.side == 0:
+            self.game.step(local, remote)
+        else:
+            self.game.step(remote, local)
+
+    def replay(self):
+        """Roll back to the first frame played on a wrong guess and play forward again"""
+        if self.rollback_from is None:
+            return
+        first, self.rollback_from = self.rollback_from, None
+        self.game.restore(self.saved[first])
+        for frame in range(first, self.frame):
+            self.play(frame)
+        self.rollbacks += 1
+        self.replayed_frames += self.frame - first
+
+    def forget_old(self):
+        """Drop states no rollback can reach, and inputs no resync can"""
+        while self.saved_oldest < self.frame - self.MAX_ROLLBACK - 1:
+            self.saved.pop(self.saved_oldest, None)
+            self.predicted.pop(self.saved_oldest, None)
+            self.saved_oldest += 1
+        oldest = self.frame - RESYNC_WINDOW
+        self.remote_inputs.pop(oldest - 1, None)
+        while self.local_oldest < min(self.peer_ack + 1, oldest):
+            self.local_inputs.pop(self.local_oldest, None)
+            self.local_oldest += 1
+
+    def record_checkpoints(self):
+        """Checksum every checkpoint whose inputs have all arrived, and compare with the peer's
+
+        A checkpoint is the state before its frame, so it's final once the
+        peer's inputs up to the frame before are in and replayed.
+        """
+        while (self.next_checkpoint < self.frame and self.next_checkpoint <= self.remote_confirmed + 1
+               and self.rollback_from is None):
+            frame = self.next_checkpoint
+            self.next_checkpoint += HASH_INTERVAL
+            state = self.saved.get(frame)
+            if state is None:
+                continue  # Only after a long wait; the next one will do
+            self.checkpoints[frame] = (FixedGame.checksum(state), state)
+            self.checkpoints.pop(frame - RESYNC_WINDOW, None)
+            self.last_checkpoint = frame
+        self.compare_checkpoint()
+
+    def compare_checkpoint(self):
+        frame, checksum = self.peer_checkpoint
+        if frame <= self.compared or frame not in self.checkpoints:
+            return
+        self.compared = frame
+        ours, state = self.checkpoints[frame]
+        if ours == checksum:
+            return
+        self.desyncs += 1
+        if self.side == 0:
+            try:
+                self.sock.sendto(KIND.pack(SYNC) + SYNC_FRAME.pack(frame) + FixedGame.STATE.pack(*state), self.peer)
+            except OSError:
+                pass  # The joining peer's next checkpoint will disagree too, and we send again
+
+    def resync(self):
+        """Restore the host's state from a SYNC and replay every frame since"""
+        if self.pending_sync is None:
+            return
+        (first, state), self.pending_sync = self.pending_sync, None
+        # Older than the inputs we keep, or from a frame we haven't played
+        if not max(self.frame - RESYNC_WINDOW, self.local_oldest) <= first <= self.frame:
+            return
+        self.game.restore(state)
+        for frame in range(first, self.frame):
+            self.play(frame)
+        # Replaying saved every frame since first again; forget_old() drops them
+        self.saved_oldest = min(self.saved_oldest, first)
+        for frame in [frame for frame in self.checkpoints if frame > first]:
+            del self.checkpoints[frame]
+        self.checkpoints[first] = (FixedGame.checksum(state), state)
+        self.last_checkpoint = self.compared = first
+        self.next_checkpoint = first + HASH_INTERVAL
+        self.replayed_frames += self.frame - first
+
+    def time_sync_wait(self):
+        """Whether to wait a frame because we're ahead of where the peer is now
+
+        The peer's frame is as of its last datagram, which is half a round
+        trip old. Running ahead makes the peer roll back more, and it'd
+        have to wait for us, so the peer ahead waits a frame now and then.
+        """
+        if self.link.rtt is None or self.frame < self.next_sync_wait:
+            return False
+        since = time.monotonic() - self.last_heard + self.link.rtt / 2
+        advantage = self.frame - (self.peer_frame + since * self.FRAME_RATE)
+        if advantage < 2:
+            return False
+        self.next_sync_wait = self.frame + self.SYNC_INTERVAL
+        return True
+
+    def send_inputs(self):
+        """Send every input the peer hasn't acked (up to MAX_INPUTS, oldest first)
+
+        Sent every frame, so one datagram that arrives makes up for any
+        lost before it. With nothing unacked the newest input goes again as
+        a keepalive.
+        """
+        inputs = b""
+        if self.local_newest >= 0:
+            first = min(self.peer_ack + 1, self.local_newest)
+            last = min(self.local_newest, first + MAX_INPUTS - 1)
+            inputs = encode_inputs(last, [self.local_inputs[frame] for frame in range(first, last + 1)])
+        held = 0
+        if self.echo:
+            held = min(0xFFFF, int((time.monotonic() - self.echo_received) * 1000))
+        checksum = self.checkpoints[self.last_checkpoint][0] if self.last_checkpoint >= 0 else 0
+        body = INPUTS_BODY.pack(self.frame, self.remote_confirmed, clock_ms(), self.echo, held,
+                                self.last_checkpoint, checksum)
+        try:
+            self.sock.sendto(KIND.pack(INPUTS) + body + inputs, self.peer)
+        except OSError:
+            pass  # The peer may come back; TIMEOUT decides when to give up
+
+    def receive(self):
+        now = time.monotonic()
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                continue
+            if addr != self.peer or not data:
+                continue
+            self.last_heard = now
+            kind = data[0]
+            if kind == HELLO and self.welcome is not None:
+                self.sock.sendto(self.welcome, addr)  # Our WELCOME got lost
+            elif kind == BYE:
+                self.disconnected = "The other player left"
+            elif kind == INPUTS:
+                try:
+                    self.on_inputs(data, now)
+                except (ValueError, struct.error):
+                    continue
+            elif kind == SYNC and self.side == 1:
+                try:
+                    frame, = SYNC_FRAME.unpack_from(data, KIND.size)
+                    self.pending_sync = (frame, FixedGame.STATE.unpack_from(data, KIND.size + SYNC_FRAME.size))
+                except struct.error:
+                    continue
+        if not self.disconnected and now - self.last_heard > self.TIMEOUT:
+            self.disconnected = "Lost contact with the other player"
+
+    def on_inputs(self, data, now):
+        peer_frame, ack, sent, echo, held, checkpoint, checksum = INPUTS_BODY.unpack_from(data, KIND.size)
+        if checkpoint > self.peer_checkpoint[0]:
+            self.peer_checkpoint = (checkpoint, checksum)
+        self.peer_frame = max(self.peer_frame, peer_frame)
+        self.peer_ack = max(self.peer_ack, ack)
+        if echo and echo != self.last_echo:
+            self.last_echo = echo
+            rtt = ((clock_ms() - echo) & 0xFFFFFFFF) - held
+            if rtt >= 0:
+                self.link.add_rtt_sample(rtt / 1000, now)
+        self.echo = sent
+        self.echo_received = now
+
+        inputs = data[KIND.size + INPUTS_BODY.size:]
+        for frame, buttons in decode_inputs(inputs) if inputs else ():
+            if frame <= self.remote_confirmed:
+                continue
+            if frame != self.remote_confirmed + 1:
+                break  # A gap; the peer resends from it next time
+            self.remote_inputs[frame] = buttons
+            self.remote_confirmed = frame
+            guess = self.predicted.pop(frame, None)
+            if guess is not None and guess != buttons:
+                if self.rollback_from is None or frame < self.rollback_from:
+                    self.rollback_from = frame
+
+    def describe(self):
+        average = self.replayed_frames / self.rollbacks if self.rollbacks else 0
+        return (f"P2P {self.link.describe()}, input delay {self.input_delay}, "
+                f"{self.rollbacks} rollbacks ({average:.1f} frames)"
+                + (f", {self.desyncs} desyncs" if self.desyncs else ""))
+
+    def close(self):
+        """Tell the peer we're leaving (a few times, it's UDP) and close the socket"""
+        for _ in range(3):
+            try:
+                self.sock.sendto(KIND.pack(BYE), self.peer)
+            except OSError:
+                break
+        self.sock.close()
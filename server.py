@@ -1,20 +1,49 @@
 import socket
+import selectors
 import pickle
-import threading
-import random
 import time
+import random
 import os
 import traceback
 import platform
+import secrets
+import signal
+import struct
+import sys
+from collections import deque
+
+from protocol import MessageBuffer, encode_message, encode_payload, decode_inputs
+from game_state import GameState, History
+from latency import LinkEstimator
+import discovery
+import eventlog
+import results
+import ratings
+import ai
+import shmlink
 
 # Enable debug logging
 DEBUG_MODE = True
 DEBUG_LOG_PATH = os.path.join(os.path.dirname(__file__), "server_debug.log")
 
+# Set in worker processes so their lines can be told apart in the shared log
+LOG_PREFIX = ""
+
+MAX_NAME_LENGTH = 20
+
+# Linux reports how many bytes are still in a socket's send buffer. Other
+# platforms only get our own outbox as a congestion signal.
+try:
+    import fcntl
+    import termios
+    SIOCOUTQ = termios.TIOCOUTQ if sys.platform.startswith("linux") else None
+except ImportError:
+    SIOCOUTQ = None
+
 def log(message):
     """Log a message to both console and log file"""
     timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    formatted = f"[{timestamp}] {message}"
+    formatted = f"[{timestamp}] {LOG_PREFIX}{message}"
     print(formatted)
     
     if DEBUG_MODE:
@@ -24,107 +53,500 @@ def log(message):
         except:
             pass  # If logging fails, continue anyway
 
-class GameState:
-    def __init__(self):
-        # Screen dimensions
-        self.width = 800
-        self.height = 600
-        
-        # Paddle dimensions
-        self.paddle_width = 20
-        self.paddle_height = 100
-        
-        # Default paddle positions 
-        self.left_paddle_y = self.height // 2 - self.paddle_height // 2
-        self.right_paddle_y = self.height // 2 - self.paddle_height // 2
-        
-        # Ball settings
-        self.ball_size = 20
-        self.ball_x = self.width // 2 - self.ball_size // 2
-        self.ball_y = self.height // 2 - self.ball_size // 2
-        self.ball_speed_x = 5 * random.choice([-1, 1])
-        self.ball_speed_y = random.randint(-5, 5)
-        
-        # Scores
-        self.left_score = 0
-        self.right_score = 0
-        
-        # Game status
-        self.game_active = False
-        self.winner = ""
+def unsent_bytes(sock):
+    """Bytes queued in the kernel's send buffer for sock (0 where unknown)"""
+    if SIOCOUTQ is None:
+        return 0
+    try:
+        return struct.unpack("i", fcntl.ioctl(sock.fileno(), SIOCOUTQ, b"\0\0\0\0"))[0]
+    except OSError:
+        return 0
 
-    def update_ball(self):
-        if not self.game_active:
+class SnapshotRate:
+    """Picks how often one client gets a snapshot, between min_rate and max_rate
+    
+    Additive increase, multiplicative decrease: the rate climbs steadily while
+    the link keeps up and halves when it falls behind. Falling behind means
+    queueing delay, which shows up in two places. The round trip time rises
+    above the lowest one seen recently (link, shared with the connection's
+    ping exchanges, also gets a sample from every snapshot ack), and bytes
+    pile up in our outbox and the
+    kernel's send buffer. TCP hides packet loss from us, but on lossy Wi-Fi
+    the retransmissions show up as exactly that delay.
+    """
+    INCREASE = 10.0  # Hz gained per second while the link keeps up
+    DECREASE = 0.5  # Rate multiplier when the link falls behind
+    QUEUE_DELAY_LIMIT = 0.05  # Seconds of queueing tolerated before backing off
+    MAX_UNACKED = 256  # Send times remembered for snapshots not yet acked
+    
+    def __init__(self, min_rate, max_rate, link):
+        self.link = link
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        # Most links are fine, and backing off is much faster than ramping up
+        self.rate = max_rate
+        
+        self.next_send = 0
+        self.last_update = None
+        self.last_decrease = 0
+        
+        # (tick, time sent) of snapshots the client hasn't acked yet
+        self.unacked = deque()
+        
+        self.snapshots_sent = 0
+        self.snapshots_shed = 0
+    
+    def on_ack(self, tick, held, now):
+        """Take an RTT sample when the client acks a snapshot for the first time
+        
+        The client acks with its next input, up to a frame later, so it also
+        says how long it held the snapshot and that time is left out. Time
+        spent in its receive buffer before it reads can't be, but that
+        averages half a client frame, well under QUEUE_DELAY_LIMIT.
+        """
+        sent_at = None
+        while self.unacked and self.unacked[0][0] <= tick:
+            sent_tick, sent_at = self.unacked.popleft()
+        if sent_at is None or sent_tick != tick:
             return
-            
-        # Move the ball
-        self.ball_x += self.ball_speed_x
-        self.ball_y += self.ball_speed_y
-        
-        # Ball collision with top and bottom walls
-        if self.ball_y <= 0:
-            self.ball_y = 0
-            self.ball_speed_y = -self.ball_speed_y
-        elif self.ball_y + self.ball_size >= self.height:
-            self.ball_y = self.height - self.ball_size
-            self.ball_speed_y = -self.ball_speed_y
-            
-        # Check for paddle collisions
-        # Left paddle collision
-        if (self.ball_x <= 50 + self.paddle_width and 
-            self.ball_x + self.ball_size >= 50 and 
-            self.ball_y + self.ball_size >= self.left_paddle_y and 
-            self.ball_y <= self.left_paddle_y + self.paddle_height):
-            
-            hit_pos = (self.ball_y + self.ball_size/2 - (self.left_paddle_y + self.paddle_height/2)) / (self.paddle_height/2)
-            self.ball_speed_y = hit_pos * 5
-            self.ball_speed_x = -self.ball_speed_x
-            self.ball_x = 50 + self.paddle_width + 1
-            
-        # Right paddle collision
-        if (self.ball_x + self.ball_size >= self.width - 50 - self.paddle_width and 
-            self.ball_x <= self.width - 50 and
-            self.ball_y + self.ball_size >= self.right_paddle_y and 
-            self.ball_y <= self.right_paddle_y + self.paddle_height):
-            
-            hit_pos = (self.ball_y + self.ball_size/2 - (self.right_paddle_y + self.paddle_height/2)) / (self.paddle_height/2)
-            self.ball_speed_y = hit_pos * 5
-            self.ball_speed_x = -self.ball_speed_x
-            self.ball_x = self.width - 50 - self.paddle_width - self.ball_size - 1
-            
-        # Scoring
-        if self.ball_x <= 0:
-            self.right_score += 1
-            self.reset_ball()
-        elif self.ball_x + self.ball_size >= self.width:
-            self.left_score += 1
-            self.reset_ball()
-            
-        # Check win condition
-        if self.left_score > 7:
-            self.winner = "Player 1 Wins!"
-            self.game_active = False
-        elif self.right_score > 7:
-            self.winner = "Player 2 Wins!"
-            self.game_active = False
+        
+        self.link.add_rtt_sample(max(0, now - sent_at - held), now)
+    
+    def due(self, now):
+        return now >= self.next_send
+    
+    def update(self, now, backlog_seconds):
+        """Adjust the rate; backlog_seconds is how long queued bytes take to send
+        
+        Returns True if the link is congested.
+        """
+        elapsed = 0 if self.last_update is None else now - self.last_update
+        self.last_update = now
+        
+        # Bytes in flight normally take about one round trip to clear
+        congested = (self.link.queueing_delay() > self.QUEUE_DELAY_LIMIT or
+                     backlog_seconds - (self.link.min_rtt or 0) > self.QUEUE_DELAY_LIMIT)
+        if congested:
+            # Back off at most once per round trip, the time it takes to see
+            # whether the last decrease helped
+            if now - self.last_decrease >= max(self.link.rtt or 0, 0.1):
+                self.rate = max(self.min_rate, self.rate * self.DECREASE)
+                self.last_decrease = now
+        else:
+            self.rate = min(self.max_rate, self.rate + self.INCREASE * elapsed)
+        return congested
+    
+    def schedule(self, now):
+        """Move the next send one period on, without bursting to catch up"""
+        period = 1 / self.rate
+        self.next_send = max(self.next_send + period, now - period)
+    
+    def on_send(self, tick, now):
+        self.snapshots_sent += 1
+        self.unacked.append((tick, now))
+        if len(self.unacked) > self.MAX_UNACKED:
+            self.unacked.popleft()
+        self.schedule(now)
+    
+    def on_shed(self, now):
+        self.snapshots_shed += 1
+        self.schedule(now)
 
-    def reset_ball(self):
-        self.ball_x = self.width // 2 - self.ball_size // 2
-        self.ball_y = self.height // 2 - self.ball_size // 2
-        self.ball_speed_x = 5 * random.choice([-1, 1])
-        self.ball_speed_y = random.randint(-5, 5)
+class Connection:
+    """A client socket owned by the server's event loop"""
+    def __init__(self, sock, addr, min_snapshot_rate, max_snapshot_rate):
+        self.sock = sock
+        self.addr = addr
+        
+        # Round trip time, jitter and clock offset of the client, kept up to
+        # date by ping exchanges and snapshot acks
+        self.link = LinkEstimator()
+        
+        # Decides when this client gets its next snapshot
+        self.snapshot_rate = SnapshotRate(min_snapshot_rate, max_snapshot_rate, self.link)
+        
+        # Set once the connection is seated in a room
+        self.room = None
+        self.player_id = None
+        self.token = None
+        
+        # Bytes received but not yet split into messages
+        self.inbox = MessageBuffer()
+        
+        # Bytes waiting for the socket to become writable
+        self.outbox = bytearray()
+        
+        # Close once the outbox drains, logging this reason (e.g. after a rejection)
+        self.close_when_flushed = None
+        
+        # Name the client gave in its hello, None if it didn't
+        self.name = None
+        
+        # Number of this connection in the server's event log, if it keeps one
+        self.session = None
+        
+        # shmlink.SharedMemoryLink once a client on this machine offered one;
+        # snapshots and inputs go through it instead of the socket
+        self.shm = None
+
+class Room:
+    """One match: two player slots and the game state they share"""
+    MAX_BUFFERED_INPUTS = 8  # Ticks of input a player may get ahead (~133 ms)
+    MAX_REWIND_TICKS = 12  # Default furthest a hit is judged in the past (200 ms)
 
-    def start_game(self):
-        self.left_score = 0
-        self.right_score = 0
-        self.reset_ball()
-        self.winner = ""
-        self.game_active = True
+    def __init__(self, room_id, max_rewind_ticks=MAX_REWIND_TICKS):
+        self.room_id = room_id
+        self.connections = {}
+        self.players_ready = set()
+        self.game_state = GameState()
+        self.game_running = False
+        
+        # Each match replays from its seed: the serves and the bots' random
+        # moves all come from the state's own MatchRandom, reseeded at the start
+        self.match_seed = None
+        self.next_player = 0
+        
+        # Slots whose player dropped without saying goodbye, mapped to the time
+        # their seat is given up. The match pauses until they resume or forfeit.
+        self.held_slots = {}
+        
+        # Session token and name (None if they gave none) of each seated player
+        self.tokens = {}
+        self.names = {}
+        
+        # Client messages never touch the game state directly. They become
+        # timestamped (time, player_id, command, value) tuples on this queue and
+        # tick() applies them at the start of each tick, which makes the tick
+        # the only writer of the game state.
+        self.commands = deque()
+        
+        # Each player's inputs, (client tick, buttons) not yet applied, the
+        # newest client tick received and the newest one applied. One input
+        # is applied per tick, so paddles move at the same speed however fast
+        # a client sends. Snapshots carry the applied ticks so clients can
+        # tell which of their inputs are already in the state.
+        self.inputs = {0: deque(), 1: deque()}
+        self.input_received = {0: -1, 1: -1}
+        self.input_applied = {0: -1, 1: -1}
+        
+        # AI players (ai.Bot) in slots no human has, by player ID. A human who joins
+        # takes a bot's slot over, mid-match if need be.
+        self.bots = {}
+        
+        # When the only human here started waiting for an opponent
+        self.alone_since = None
+        
+        # Load-testing rooms stay open (and refill with bots) without humans
+        self.persistent = False
+        
+        # Where finished matches are saved (a results.ResultsStore) and who
+        # gets rated for them (ratings.Ratings), both set by the server, and
+        # the statistics of the match being played
+        self.results = None
+        self.ratings = None
+        self.match_stats = None
+        
+        # The state at the end of each of the last ticks, so a paddle hit can be
+        # judged against the ball its player saw (see seen_balls()). 0 turns
+        # that off.
+        self.max_rewind_ticks = max_rewind_ticks
+        self.history = History(max_rewind_ticks + 1)
+        
+        # Latest serialized ("state", tick, game_state), built once per tick so
+        # every client gets the same consistent snapshot. Clients ack the tick.
+        self.tick_count = 0
+        self.snapshot = self.build_snapshot()
+    
+    def seats_taken(self):
+        """Slots held by humans (bots give theirs up to anyone who joins)"""
+        return len(self.connections) + len(self.held_slots)
+    
+    def is_full(self):
+        return self.seats_taken() >= 2
+    
+    def is_empty(self):
+        return self.seats_taken() == 0
+    
+    def add_player(self, connection):
+        """Seat a connection in a free slot and return its player ID"""
+        # If player ID is already in use, find an available ID
+        player_id = self.next_player
+        if player_id in self.connections or player_id in self.held_slots:
+            log(f"Room {self.room_id}: Player ID {player_id} already in use, switching to the other ID")
+            player_id = 0 if player_id == 1 else 1
+        self.next_player = (player_id + 1) % 2
+        self.reset_inputs(player_id)
+        if self.bots.pop(player_id, None) is not None:
+            log(f"Room {self.room_id}: New player takes over Player {player_id}'s slot from the bot")
+        
+        self.connections[player_id] = connection
+        self.names[player_id] = connection.name
+        connection.room = self
+        connection.player_id = player_id
+        return player_id
+    
+    def resume_player(self, connection, player_id):
+        """Give a held (or half-open) slot to a reconnected client"""
+        self.held_slots.pop(player_id, None)
+        self.connections[player_id] = connection
+        connection.room = self
+        connection.player_id = player_id
+    
+    def hold_slot(self, connection, grace_period):
+        """Keep a dropped player's seat and ready state for a while"""
+        player_id = connection.player_id
+        if self.connections.get(player_id) is connection:
+            del self.connections[player_id]
+            self.held_slots[player_id] = time.monotonic() + grace_period
+            log(f"Room {self.room_id}: Holding Player {player_id}'s slot for {grace_period}s")
+    
+    def remove_player(self, player_id):
+        """Free a player's slot and return their session token"""
+        if player_id in self.players_ready:
+            self.players_ready.remove(player_id)
+            log(f"Room {self.room_id}: Removed Player {player_id} from ready players")
+        
+        if player_id in self.connections:
+            del self.connections[player_id]
+            log(f"Room {self.room_id}: Removed Player {player_id} from active connections")
+        self.held_slots.pop(player_id, None)
+        self.names.pop(player_id, None)
+        self.reset_inputs(player_id)
+        return self.tokens.pop(player_id, None)
+    
+    def forfeit(self, player_id):
+        """End the match in progress as a loss for player_id, who is leaving for good
+        
+        Called from the event loop between ticks, before the player's seat
+        is released, so the saved result and ratings still know who they were.
+        """
+        if self.game_state.game_active:
+            log(f"Room {self.room_id}: Player {player_id} forfeits the match")
+            self.game_state.winner = f"Player {2 if player_id == 0 else 1} Wins!"
+            self.game_state.game_active = False
+            self.finish_match(1 - player_id, forfeit=True)
+        self.game_running = False
+        self.players_ready.clear()
+    
+    def reset_inputs(self, player_id):
+        """Forget a slot's inputs; a new client counts its ticks from zero"""
+        self.inputs[player_id].clear()
+        self.input_received[player_id] = -1
+        self.input_applied[player_id] = -1
+    
+    def add_bot(self, difficulty):
+        """Seat a bot in a free slot and return its player ID"""
+        player_id = next(player_id for player_id in (0, 1) if player_id not in self.connections
+                         and player_id not in self.held_slots and player_id not in self.bots)
+        self.bots[player_id] = ai.Bot(difficulty, self.game_state.rng)
+        self.reset_inputs(player_id)
+        
+        # Bots are always ready
+        self.players_ready.add(player_id)
+        if len(self.players_ready) == 2 and not self.game_running:
+            self.commands.append((time.time(), player_id, "restart", None))
+            self.game_running = True
+        return player_id
+    
+    def expired_slots(self, now):
+        return [player_id for player_id, deadline in self.held_slots.items() if now >= deadline]
+    
+    def handle_message(self, player_id, data):
+        """Turn one client message into queued commands"""
+        if data == "ready":
+            log(f"Room {self.room_id}: Player {player_id} is ready")
+            self.players_ready.add(player_id)
+            log(f"Room {self.room_id}: Ready players: {self.players_ready}")
+            # If both players are ready, start the game
+            if len(self.players_ready) == 2 and not self.game_running:
+                log(f"Room {self.room_id}: Both players ready! Starting game...")
+                self.commands.append((time.time(), player_id, "restart", None))
+                self.game_running = True
+        
+        elif data == "restart":
+            log(f"Room {self.room_id}: Player {player_id} requested game restart")
+            self.commands.append((time.time(), player_id, "restart", None))
+            self.game_running = True
+        
+        elif isinstance(data, bytes):  # Paddle input
+            self.queue_inputs(player_id, decode_inputs(data))
+        
+        else:
+            raise ValueError(f"Unexpected message {data!r}")
+    
+    def queue_inputs(self, player_id, inputs):
+        """Buffer the inputs we haven't seen yet, dropping the oldest if a client gets too far ahead"""
+        queue = self.inputs[player_id]
+        for client_tick, buttons in inputs:
+            if client_tick > self.input_received[player_id]:
+                queue.append((client_tick, buttons))
+                self.input_received[player_id] = client_tick
+        while len(queue) > self.MAX_BUFFERED_INPUTS:
+            queue.popleft()
+    
+    def apply_commands(self):
+        """Apply queued client commands to the game state (tick only)"""
+        # Only drain what is queued right now so a flood of input can't stall a tick
+        for _ in range(len(self.commands)):
+            timestamp, player_id, command, value = self.commands.popleft()
+            if command == "restart":
+                self.match_seed = random.getrandbits(32)
+                log(f"Room {self.room_id}: Applying restart requested by Player {player_id} (seed {self.match_seed})")
+                self.game_state.rng.seed(self.match_seed)
+                self.game_state.start_game()
+                self.match_stats = results.MatchStats()
+    
+    def tick(self, tick_count):
+        """Advance the match by one step"""
+        self.tick_count = tick_count
+        
+        # Nobody is going to press restart in a bot-only room
+        if len(self.bots) == 2 and not self.game_running:
+            self.players_ready.update(self.bots)
+            self.commands.append((time.time(), None, "restart", None))
+            self.game_running = True
+        
+        self.apply_commands()
+        self.apply_inputs()
+        for player_id, bot in self.bots.items():
+            bot.move(self.game_state, player_id)
+        
+        if self.game_running:
+            # Check if we have two players connected
+            if len(self.connections) + len(self.bots) < 2:
+                if tick_count % Server.TICK_RATE == 0:  # Log once a second
+                    log(f"Room {self.room_id}: Game paused: waiting for two players")
+            else:
+                self.game_state.update_ball(self.seen_balls() if self.max_rewind_ticks else None)
+                if self.match_stats is not None:
+                    self.match_stats.observe(self.game_state)
+                
+                # If game is over, stop ticking until someone restarts
+                if not self.game_state.game_active:
+                    log(f"Room {self.room_id}: Game is no longer active - clearing ready players")
+                    self.finish_match(0 if self.game_state.left_score > self.game_state.right_score else 1)
+                    self.game_running = False
+                    self.players_ready.clear()
+        
+        self.history.save(tick_count, self.game_state)
+        self.snapshot = self.build_snapshot()
+    
+    def seen_balls(self):
+        """Each side's (ball_x, ball_y) as its player saw it, for GameState.update_ball()
+        
+        A player reacts to a snapshot that took half a round trip to reach
+        them, and their input takes the other half to come back and then
+        waits its turn in the input buffer. By the time it moves their
+        paddle the ball has moved on, so hits are also checked against the
+        ball that many ticks ago (at most max_rewind_ticks, and never before
+        the last point). Sides without a measured RTT, and bots, get None.
+        """
+        seen = [None, None]
+        state = self.game_state
+        for player_id, connection in self.connections.items():
+            rtt = connection.link.rtt
+            if rtt is None:
+                continue
+            lag = min(self.max_rewind_ticks, round(rtt * Server.TICK_RATE) + len(self.inputs[player_id]))
+            if lag <= 0:
+                continue
+            past = self.history.get(self.tick_count - lag)
+            if past is None:
+                continue
+            _, _, ball_x, ball_y, _, _, left_score, right_score, active = past
+            if active and left_score == state.left_score and right_score == state.right_score:
+                seen[player_id] = (ball_x, ball_y)
+        return seen
+    
+    def player_name(self, player_id):
+        """Who plays in a slot: a bot, a named player, or None for a player who gave no name"""
+        bot = self.bots.get(player_id)
+        if bot is not None:
+            return f"{bot.difficulty} bot"
+        return self.names.get(player_id)
+    
+    def finish_match(self, winner, forfeit=False):
+        """Rate and save the match that just ended, won by player winner"""
+        stats, self.match_stats = self.match_stats, None
+        if stats is None:
+            return
+        names = [self.player_name(player_id) for player_id in (0, 1)]
+        
+        # Only players with a name have a rating
+        changes = ()
+        if self.ratings is not None and None not in names and names[0] != names[1]:
+            changes = self.ratings.record_match(names[winner], names[1 - winner])
+        
+        if self.results is not None:
+            bots = [self.bots[player_id].difficulty if player_id in self.bots else None for player_id in (0, 1)]
+            names = [name or f"Player {player_id + 1}" for player_id, name in enumerate(names)]
+            self.results.record(stats.result(names, winner, "server", self.room_id, forfeit, bots, changes))
+    
+    def apply_inputs(self):
+        """Move each paddle by its player's next input (tick only)"""
+        for player_id, queue in self.inputs.items():
+            if queue:
+                client_tick, buttons = queue.popleft()
+                self.game_state.move_paddle(player_id, buttons)
+                self.input_applied[player_id] = client_tick
+    
+    def build_snapshot(self):
+        """Serialize ("state", tick, game_state, (left applied input, right applied input))"""
+        applied = (self.input_applied[0], self.input_applied[1])
+        return encode_payload(pickle.dumps(("state", self.tick_count, self.game_state, applied)))
 
 class Server:
-    def __init__(self, host='', port=5555):
-        # Clear any existing log file
-        if DEBUG_MODE:
+    TICK_RATE = 60  # Game updates per second
+    STATS_INTERVAL = 1.0  # Seconds between stats reports to the supervisor
+    RECONNECT_GRACE = 15.0  # Seconds a dropped player has to resume before forfeiting
+    MIN_SNAPSHOT_RATE = 10  # Default lowest snapshots per second for a struggling client
+    BOT_AFTER = 5.0  # Default seconds a lone player waits before getting a bot opponent
+    MAX_REPORTED_CHANGES = 500  # Rating changes per stats report (which must fit one datagram)
+    MAX_REWIND = 0.2  # Default seconds of latency paddle hits are compensated for
+    
+    def __init__(self, host='', port=5555, max_rooms=1, channel=None, worker_index=0,
+                 discovery_port=discovery.DISCOVERY_PORT,
+                 min_snapshot_rate=MIN_SNAPSHOT_RATE, max_snapshot_rate=TICK_RATE,
+                 bot_difficulty=None, bot_after=BOT_AFTER, bot_rooms=0, event_log=None,
+                 results_path=None, max_rewind=MAX_REWIND, shared_memory=True):
+        """Create a game server
+        
+        max_rooms is how many simultaneous matches this process hosts. When
+        channel is given the server is a supervisor's worker: it doesn't bind a
+        port but receives accepted client sockets over channel instead.
+        worker_index prefixes session tokens so the supervisor can route a
+        reconnecting client back to this worker. Unless discovery_port is None
+        the server answers LAN discovery probes on it (workers never do, their
+        supervisor answers for them).
+        
+        Each client gets snapshots pushed at its own rate, between
+        min_snapshot_rate and max_snapshot_rate per second, depending on
+        how well its link keeps up (see SnapshotRate).
+        
+        With bot_difficulty set, a player who has waited bot_after seconds
+        for an opponent gets a bot of that difficulty instead. bot_rooms
+        opens that many bot-vs-bot rooms up front, which keep playing
+        forever, for load testing without client processes.
+        
+        With event_log set, every connection's traffic and RTT samples are
+        written to that file in eventlog.py's binary format (a worker
+        writes to its own file, see eventlog.worker_path()).
+        
+        With results_path set, finished matches and their statistics are
+        saved to that SQLite database (see results.py) off the event loop.
+        Named players are rated (see ratings.py) as each match ends; the
+        ratings are loaded from that database at startup.
+        
+        Paddle hits are lag compensated: a player whose paddle meets the
+        ball as they saw it, up to max_rewind seconds ago, returns it even
+        if the server's ball had already gone past (see Room.seen_balls()).
+        0 turns that off.
+        
+        Clients on this machine that offer a shared memory segment are
+        switched to it (see shmlink.py) unless shared_memory is False.
+        """
+        # Clear any existing log file (workers share the supervisor's log)
+        if DEBUG_MODE and channel is None:
             try:
                 with open(DEBUG_LOG_PATH, "w") as f:
                     f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Server debug log started\n")
@@ -133,284 +555,580 @@ class Server:
             except Exception as e:
                 print(f"Failed to initialize log file: {e}")
     
-        log(f"Initializing server with host='{host}', port={port}")
-        
-        # Create socket with IPv4 addressing and TCP
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
-        # Set timeout to prevent blocking indefinitely
-        self.server.settimeout(600)  # 10 minutes timeout
+        log(f"Initializing server with host='{host}', port={port}, max_rooms={max_rooms}")
         
         self.host = host
         self.port = port
+        self.max_rooms = max_rooms
+        self.channel = channel
+        self.worker_index = worker_index
+        # Snapshots only change once per tick, so there's no point sending more
+        self.max_snapshot_rate = min(max_snapshot_rate, self.TICK_RATE)
+        self.min_snapshot_rate = min(min_snapshot_rate, self.max_snapshot_rate)
+        self.bot_difficulty = bot_difficulty
+        self.bot_after = bot_after
+        self.max_rewind_ticks = round(max_rewind * self.TICK_RATE)
         
-        try:
-            self.server.bind((self.host, self.port))
-            log(f"Socket successfully bound to {self.host if self.host else '*'}:{self.port}")
-        except socket.error as e:
-            log(f"CRITICAL ERROR: Socket binding failed: {e}")
-            log(traceback.format_exc())
-            raise  # Re-raise the exception to stop execution
+        # One thread owns the listening socket, every client socket and the tick
+        # timer. selectors picks epoll on Linux and kqueue on macOS.
+        self.selector = selectors.DefaultSelector()
+        
+        if channel is None:
+            # Create socket with IPv4 addressing and TCP
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             
-        self.server.listen(2)
-        log(f"Server listening on port {self.port}, waiting for connections...")
+            try:
+                self.server.bind((self.host, self.port))
+                log(f"Socket successfully bound to {self.host if self.host else '*'}:{self.port}")
+            except socket.error as e:
+                log(f"CRITICAL ERROR: Socket binding failed: {e}")
+                log(traceback.format_exc())
+                raise  # Re-raise the exception to stop execution
+                
+            self.server.listen(64)
+            self.server.setblocking(False)
+            self.selector.register(self.server, selectors.EVENT_READ, None)
+            log(f"Server listening on port {self.port}, waiting for connections...")
+        else:
+            self.server = None
+            self.channel.setblocking(False)
+            self.selector.register(self.channel, selectors.EVENT_READ, self.channel)
         
-        self.connections = {}
-        self.players_ready = set()
-        self.game_state = GameState()
-        self.game_thread = None
-        self.game_running = False
-
-    def handle_client(self, conn, player_id):
-        log(f"New client handler started for Player {player_id}")
+        self.discovery = None
+        self.server_id = secrets.token_hex(4)
+        if channel is None and discovery_port is not None:
+            try:
+                self.discovery = discovery.open_responder(discovery_port)
+                self.selector.register(self.discovery, selectors.EVENT_READ, self.discovery)
+                log(f"Answering LAN discovery probes on UDP port {discovery_port}")
+            except OSError as e:
+                log(f"WARNING: LAN discovery disabled, could not bind UDP port {discovery_port}: {e}")
+        
+        self.rooms = {}
+        self.next_room_id = 0
+        
+        # Session token -> (room, player_id) for every seated or held player
+        self.sessions = {}
+        
+        # Connections with a shared memory link, polled every loop iteration
+        self.shared_memory = shared_memory
+        self.shm_connections = set()
+        
+        self.connections_received = 0
+        self.messages_handled = 0
+        self.snapshots_sent = 0
+        self.snapshots_shed = 0
+        
+        self.events = None
+        if event_log is not None:
+            if channel is not None:
+                event_log = eventlog.worker_path(event_log, worker_index)
+            self.events = eventlog.EventLog(event_log)
+            log(f"Writing network events to {event_log}")
+        
+        self.results = None
+        self.ratings = ratings.Ratings(report_changes=channel is not None)
+        if results_path is not None:
+            self.results = results.ResultsStore(results_path)
+            self.ratings.load(results.load_ratings(results.connect(results_path)))
+            log(f"Saving match results to {results_path} ({len(self.ratings.players)} rated players)")
+        
+        for _ in range(min(bot_rooms, max_rooms)):
+            room = self.open_room()
+            room.persistent = True
+            room.add_bot(bot_difficulty or "medium")
+            room.add_bot(bot_difficulty or "medium")
+        if bot_rooms:
+            log(f"Opened {len(self.rooms)} bot-vs-bot rooms")
         
-        # Set connection timeout to prevent blocking indefinitely
-        conn.settimeout(30)  # 30 second timeout
+    def accept_connections(self):
+        """Accept every pending connection on the listening socket"""
+        while True:
+            try:
+                conn, addr = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            self.add_connection(conn, addr)
+    
+    def receive_connections(self):
+        """Adopt client sockets handed over by the supervisor"""
+        while True:
+            try:
+                # One datagram per socket, carrying the bytes the supervisor
+                # already read from it (the client's hello)
+                msg, fds, flags, addr = socket.recv_fds(self.channel, 65536, 1)
+            except (BlockingIOError, InterruptedError):
+                return
+            for fd in fds:
+                conn = socket.socket(fileno=fd)
+                try:
+                    addr = conn.getpeername()
+                except OSError:
+                    addr = None
+                kind, initial_data = pickle.loads(msg)
+                self.add_connection(conn, addr, initial_data)
+    
+    def add_connection(self, conn, addr, initial_data=b""):
+        """Start serving a client; it is seated once its hello arrives"""
+        log(f"New connection from: {addr}")
+        self.connections_received += 1
         
-        # Send initial player ID
+        # Set socket options for better reliability
         try:
-            player_id_data = pickle.dumps(player_id)
-            log(f"Sending player_id={player_id} to client ({len(player_id_data)} bytes)")
-            conn.send(player_id_data)
+            conn.setblocking(False)
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         except Exception as e:
-            log(f"ERROR: Failed to send initial player ID to client: {e}")
-            log(traceback.format_exc())
+            log(f"WARNING: Could not set socket options: {e}")
+        
+        connection = Connection(conn, addr, self.min_snapshot_rate, self.max_snapshot_rate)
+        if self.events is not None:
+            connection.session = self.events.new_session()
+            connection.link.on_sample = lambda rtt: self.record(connection, eventlog.RTT, rtt * 1e6)
+            self.record(connection, eventlog.OPEN, eventlog.NOT_SEATED)
+        self.selector.register(conn, selectors.EVENT_READ, connection)
+        if initial_data:
+            connection.inbox.feed(initial_data)
+            self.handle_messages(connection)
+    
+    def handle_hello(self, connection, data):
+        """Seat a new client, or give a reconnecting one its old slot back
+        
+        Clients open with ("join", name) (name is optional) or ("resume",
+        token) and get ("welcome", player_id, token, resumed) back. A
+        ("leaderboard", count) hello gets ("leaderboard", rows) back (see
+        ratings.Ratings.top()) and is then closed.
+        """
+        if isinstance(data, tuple) and len(data) == 2 and data[0] == "leaderboard":
+            count = data[1] if isinstance(data[1], int) else 10
+            connection.close_when_flushed = "answered leaderboard query"
+            self.send(connection, encode_message(("leaderboard", self.ratings.top(max(0, min(count, 100))))))
             return
+        if isinstance(data, tuple) and len(data) == 2 and data[0] == "join":
+            connection.name = clean_name(data[1])
         
-        log(f"Player {player_id} initialized successfully")
+        if isinstance(data, tuple) and len(data) == 2 and data[0] == "resume":
+            session = self.sessions.get(data[1])
+            if session is not None:
+                room, player_id = session
+                old_connection = room.connections.get(player_id)
+                if old_connection is not None:
+                    # The old socket is half-open (e.g. a Wi-Fi blip the server
+                    # hasn't noticed yet), so drop it without releasing the slot
+                    old_connection.room = None
+                    self.close_connection(old_connection, "replaced by resumed session")
+                room.resume_player(connection, player_id)
+                connection.token = data[1]
+                log(f"Player {player_id} resumed their session in room {room.room_id}")
+                self.send(connection, encode_message(("welcome", player_id, connection.token, True)))
+                return
+            log(f"Unknown or expired session token from {connection.addr} - joining as a new player")
         
-        try:
-            while True:
-                try:
-                    # Receive paddle position from client
-                    log(f"Waiting for data from Player {player_id}...")
-                    data = conn.recv(2048)
-                    
-                    if not data:  # Connection closed
-                        log(f"No data received from Player {player_id} - connection closed")
-                        break
-                    
-                    log(f"Received {len(data)} bytes from Player {player_id}")    
-                    
-                    try:
-                        data = pickle.loads(data)
-                        log(f"Player {player_id} sent: {data}")
-                    except Exception as e:
-                        log(f"ERROR: Failed to unpickle data from Player {player_id}: {e}")
-                        log(f"First 100 bytes of raw data: {data[:100]}")
-                        continue
-                    
-                    if data == "ready":
-                        log(f"Player {player_id} is ready")
-                        self.players_ready.add(player_id)
-                        log(f"Ready players: {self.players_ready}")
-                        # If both players are ready, start the game
-                        if len(self.players_ready) == 2 and not self.game_running:
-                            log("Both players ready! Starting game...")
-                            self.start_game_thread()
-                    
-                    elif data == "restart":
-                        log(f"Player {player_id} requested game restart")
-                        # Restart the game and make sure game_running is true
-                        self.game_state.start_game()
-                        
-                        # If game thread is not running, restart it
-                        if not self.game_running:
-                            log("Restarting game thread after restart request")
-                            self.start_game_thread()
-                    
-                    elif data is not None:  # Regular paddle update
-                        # Update paddle position based on player
-                        if player_id == 0:  # Player 1 (left paddle)
-                            self.game_state.left_paddle_y = data
-                        else:  # Player 2 (right paddle)
-                            self.game_state.right_paddle_y = data
-                    
-                    # Send current game state to the client
-                    try:
-                        game_state_data = pickle.dumps(self.game_state)
-                        log(f"Sending game state to Player {player_id} ({len(game_state_data)} bytes)")
-                        conn.send(game_state_data)
-                    except Exception as e:
-                        log(f"ERROR: Failed to send game state to Player {player_id}: {e}")
-                        break
-                    
-                except socket.timeout:
-                    log(f"WARNING: Connection with Player {player_id} timed out waiting for data")
-                    # Don't break - just continue and try again
-                    continue
-                except ConnectionResetError:
-                    log(f"ERROR: Connection reset by Player {player_id}")
-                    break
-                except Exception as e:
-                    log(f"ERROR: Unexpected error in client handler for Player {player_id}: {e}")
-                    log(traceback.format_exc())
-                    break
-                    
-        finally:
-            log(f"Player {player_id} disconnected - cleaning up resources")
-            if player_id in self.players_ready:
-                self.players_ready.remove(player_id)
-                log(f"Removed Player {player_id} from ready players")
-            
-            if player_id in self.connections and self.connections[player_id] == conn:
-                del self.connections[player_id]
-                log(f"Removed Player {player_id} from active connections")
-            
+        room = self.find_room()
+        if room is None:
+            log(f"Rejected connection from {connection.addr}: server full ({self.max_rooms} rooms in use)")
+            # Send a friendly rejection message before closing
+            connection.close_when_flushed = "rejected"
+            self.send(connection, encode_message("SERVER_FULL"))
+            return
+        
+        player_id = room.add_player(connection)
+        connection.token = f"{self.worker_index}.{secrets.token_hex(16)}"
+        room.tokens[player_id] = connection.token
+        self.sessions[connection.token] = (room, player_id)
+        log(f"Assigning player ID {player_id} in room {room.room_id} to connection from {connection.addr}")
+        self.send(connection, encode_message(("welcome", player_id, connection.token, False)))
+    
+    def find_room(self):
+        """Pick a room with a waiting player, or one where a bot gives up its seat, or open a new one"""
+        open_rooms = [room for room in self.rooms.values() if not room.is_full()]
+        if open_rooms:
+            return max(open_rooms, key=Room.seats_taken)
+        if len(self.rooms) >= self.max_rooms:
+            return None
+        return self.open_room()
+    
+    def open_room(self):
+        room = Room(self.next_room_id, self.max_rewind_ticks)
+        room.results = self.results
+        room.ratings = self.ratings
+        self.next_room_id += 1
+        self.rooms[room.room_id] = room
+        log(f"Opened room {room.room_id}")
+        return room
+    
+    def read_from(self, connection):
+        """Read everything available from a client and handle its messages"""
+        while True:
             try:
-                conn.close()
-                log(f"Closed socket connection for Player {player_id}")
-            except Exception as e:
-                log(f"ERROR: Failed to close connection for Player {player_id}: {e}")
-                pass
+                data = connection.sock.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                self.close_connection(connection, "connection reset")
+                return
+            except OSError as e:
+                self.close_connection(connection, f"socket error: {e}")
+                return
             
-    def start_game_thread(self):
-        log("Starting game thread - setting game_active to True")
-        self.game_running = True
-        self.game_state.start_game()
-        log(f"Game state is now: active={self.game_state.game_active}, ball_pos=({self.game_state.ball_x}, {self.game_state.ball_y})")
+            if not data:  # Connection closed
+                # Handle what it sent before hanging up (e.g. "leave") first
+                self.handle_messages(connection)
+                if connection.sock.fileno() != -1:
+                    self.close_connection(connection, "connection closed")
+                return
+            self.record(connection, eventlog.RECV, len(data))
+            connection.inbox.feed(data)
         
+        self.handle_messages(connection)
+    
+    def handle_messages(self, connection, inbox=None):
+        """Handle every complete message buffered for a client (in inbox, the socket's by default)"""
         try:
-            self.game_thread = threading.Thread(target=self.game_loop)
-            self.game_thread.daemon = True
-            self.game_thread.start()
-            log("Game thread started successfully")
+            for message in (inbox or connection.inbox).messages():
+                if connection.sock.fileno() == -1:
+                    return  # Closed by an earlier message
+                self.handle_message(connection, message)
         except Exception as e:
-            log(f"ERROR: Failed to start game thread: {e}")
-            log(traceback.format_exc())
-            self.game_running = False
+            log(f"ERROR: Bad data from Player {connection.player_id}: {e}")
+            self.close_connection(connection, "protocol error")
+    
+    def handle_message(self, connection, data):
+        """Handle one message from a client
+        
+        After the hello, clients send (ack, data). ack is None or (tick,
+        held): the newest snapshot they have and how many seconds ago it
+        arrived. Snapshots aren't replies, they are pushed by publish().
+        Either side may also send a ping, which is answered right away.
+        """
+        if connection.close_when_flushed:
+            return  # Rejected or answered, just waiting for it to close
+        
+        room = connection.room
+        if room is None:
+            self.handle_hello(connection, data)
+            return
+        
+        if data == "leave":
+            self.close_connection(connection, "left the game", hold_slot=False)
+            return
+        
+        if isinstance(data, tuple) and data[:1] == ("ping",):
+            self.send(connection, encode_message(LinkEstimator.pong(data, time.monotonic())))
+            return
+        if isinstance(data, tuple) and data[:1] == ("pong",):
+            connection.link.on_pong(data, time.monotonic())
+            return
+        if isinstance(data, tuple) and len(data) == 2 and data[0] == "shm":
+            self.attach_shm(connection, data[1])
+            return
+        if not (isinstance(data, tuple) and len(data) == 2):
+            raise ValueError(f"Unexpected message {data!r}")
+        ack, data = data
+        if ack is not None:
+            tick, held = ack
+            connection.snapshot_rate.on_ack(tick, held, time.monotonic())
+        
+        self.messages_handled += 1
+        room.handle_message(connection.player_id, data)
+    
+    def attach_shm(self, connection, name):
+        """Switch a client to the shared memory segment it offered, if it's on this machine
         
-    def game_loop(self):
-        log("Game loop started")
-        last_time = time.time()
-        loop_count = 0
+        The answer goes over the socket either way; after a yes, send()
+        writes to the segment and the loop polls it for the client's inputs.
+        """
+        accepted = False
+        if (self.shared_memory and connection.shm is None and shmlink.supported()
+                and shmlink.same_host(connection.sock)):
+            try:
+                connection.shm = shmlink.SharedMemoryLink(name)
+                self.shm_connections.add(connection)
+                accepted = True
+                log(f"Player {connection.player_id} switched to shared memory {name}")
+            except (OSError, ValueError) as e:
+                log(f"Player {connection.player_id} offered unusable shared memory: {e}")
+        self.send(connection, encode_message(("shm", accepted)))
+    
+    def read_shm(self):
+        """Handle whatever every shared memory client wrote since the last look"""
+        for connection in list(self.shm_connections):
+            received = connection.shm.receive()
+            if received:
+                self.record(connection, eventlog.RECV, received)
+                self.handle_messages(connection, connection.shm.inbox)
+    
+    def publish(self, room, now):
+        """Push the room's latest snapshot (and a ping) to every client that is due one
         
+        A client whose previous snapshot is still stuck in its outbox gets
+        this one skipped: a newer one is never far behind, and queueing old
+        states would only make the lag worse.
+        """
+        for connection in list(room.connections.values()):
+            if connection.link.ping_due(now):
+                self.send(connection, encode_message(connection.link.ping(now)))
+                if connection.sock.fileno() == -1:
+                    continue  # The send failed and closed it
+            
+            rate = connection.snapshot_rate
+            if not rate.due(now):
+                continue
+            backlog = len(connection.outbox) + unsent_bytes(connection.sock)
+            if connection.shm is not None:
+                backlog += connection.shm.backlog()
+            rate.update(now, backlog / (len(room.snapshot) * rate.rate))
+            # A full ring is shed too rather than sent over the socket, where
+            # it could overtake the older snapshots still in the ring
+            if connection.outbox or (connection.shm is not None and
+                                     connection.shm.backlog() + len(room.snapshot) > shmlink.RING_SIZE):
+                rate.on_shed(now)
+                self.snapshots_shed += 1
+                self.record(connection, eventlog.SHED, len(room.snapshot))
+                continue
+            rate.on_send(room.tick_count, now)
+            self.snapshots_sent += 1
+            self.send(connection, room.snapshot)
+    
+    def send(self, connection, data):
+        """Queue framed bytes for a client and try to send them right away
+        
+        A client on shared memory gets them written straight into its ring,
+        unless it's full or the socket still has bytes queued.
+        """
+        self.record(connection, eventlog.SEND, len(data))
+        if connection.shm is not None and not connection.outbox and connection.shm.send(data):
+            return
+        connection.outbox += data
+        self.flush(connection)
+    
+    def record(self, connection, code, value=0):
+        """Add an event for a connection to the event log, if there is one"""
+        if self.events is not None:
+            self.events.record(code, connection.session, value)
+    
+    def flush(self, connection):
+        """Write as much of the outbox as the socket accepts without blocking"""
         try:
-            while self.game_running:
-                loop_count += 1
-                if loop_count % 60 == 0:  # Log every second (assuming 60 FPS)
-                    log(f"Game loop running. Ball position: ({self.game_state.ball_x}, {self.game_state.ball_y})")
-                
-                # Check if we have two players connected
-                if len(self.connections) < 2:
-                    log("Game paused: waiting for two players")
-                    time.sleep(1)  # Check every second
-                    continue
-                    
-                # Control game speed (60 FPS)
-                current_time = time.time()
-                dt = current_time - last_time
-                if dt < 1/60:
-                    time.sleep(1/60 - dt)
-                    
-                self.game_state.update_ball()
-                last_time = time.time()
-                
-                # If game is over, stop the game loop
-                if not self.game_state.game_active:
-                    log("Game is no longer active - ending game loop")
-                    self.game_running = False
-                    
-        except Exception as e:
-            log(f"ERROR: Unexpected error in game loop: {e}")
-            log(traceback.format_exc())
-            self.game_running = False
+            while connection.outbox:
+                sent = connection.sock.send(connection.outbox)
+                del connection.outbox[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            self.close_connection(connection, f"send failed: {e}")
+            return
         
-        log("Game loop ended - clearing ready players")
-        self.players_ready.clear()
+        if not connection.outbox and connection.close_when_flushed:
+            self.close_connection(connection, connection.close_when_flushed)
+            return
+        
+        # Only ask for write events while there is something left to send
+        events = selectors.EVENT_READ
+        if connection.outbox:
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(connection.sock).events != events:
+            self.selector.modify(connection.sock, events, connection)
+    
+    def close_connection(self, connection, reason, hold_slot=True):
+        """Close a client socket
+        
+        Unless the client left on purpose its slot is held for
+        RECONNECT_GRACE seconds so it can resume with its session token.
+        """
+        log(f"Player {connection.player_id} disconnected ({reason}) - cleaning up resources")
+        self.record(connection, eventlog.CLOSE)
+        if connection.link.rtt is not None:
+            log(f"Player {connection.player_id} link: {connection.link.describe()}, "
+                f"{connection.snapshot_rate.rate:.0f} snapshots/s")
+        if connection.shm is not None:
+            self.shm_connections.discard(connection)
+            connection.shm.close()
+            connection.shm = None
+        room = connection.room
+        if room is not None and room.connections.get(connection.player_id) is connection:
+            if hold_slot:
+                room.hold_slot(connection, self.RECONNECT_GRACE)
+            else:
+                # Leaving mid-match loses it, rather than leaving the other
+                # player paused for whoever joins next
+                if room.game_state.game_active:
+                    room.forfeit(connection.player_id)
+                self.release_slot(room, connection.player_id)
         
+        try:
+            self.selector.unregister(connection.sock)
+        except (KeyError, ValueError):
+            pass  # Already unregistered
+        try:
+            connection.sock.close()
+        except Exception as e:
+            log(f"ERROR: Failed to close connection for Player {connection.player_id}: {e}")
+    
+    def release_slot(self, room, player_id):
+        """Give up a player's seat for good and close the room once it's empty"""
+        token = room.remove_player(player_id)
+        self.sessions.pop(token, None)
+        if room.persistent:
+            room.add_bot(self.bot_difficulty or "medium")
+        elif room.is_empty() and room.room_id in self.rooms:
+            del self.rooms[room.room_id]
+            log(f"Closed empty room {room.room_id}")
+    
+    def expire_held_slots(self):
+        """Forfeit players who didn't come back within the grace period"""
+        now = time.monotonic()
+        for room in list(self.rooms.values()):
+            for player_id in room.expired_slots(now):
+                log(f"Room {room.room_id}: Player {player_id} did not reconnect in time")
+                room.forfeit(player_id)
+                self.release_slot(room, player_id)
+    
+    def seat_bots(self, now):
+        """Give every player who has waited bot_after seconds alone a bot opponent"""
+        if self.bot_difficulty is None:
+            return
+        for room in self.rooms.values():
+            if room.seats_taken() != 1 or room.bots:
+                room.alone_since = None
+            elif room.alone_since is None:
+                room.alone_since = now
+            elif now - room.alone_since >= self.bot_after:
+                player_id = room.add_bot(self.bot_difficulty)
+                log(f"Room {room.room_id}: Seated a {self.bot_difficulty} bot as Player {player_id}")
+    
+    def discovery_info(self):
+        """What LAN discovery replies say about this server"""
+        stats = self.stats()
+        return {
+            "id": self.server_id,
+            "name": socket.gethostname(),
+            "port": self.port,
+            "rooms": stats["rooms"],
+            "max_rooms": self.max_rooms,
+            "players": stats["players"],
+            "load": stats["players"] / (2 * self.max_rooms),
+        }
+    
+    def stats(self):
+        """Counters reported to the supervisor"""
+        return {
+            "rooms": len(self.rooms),
+            "waiting": sum(1 for room in self.rooms.values() if not room.is_full()),
+            "players": sum(room.seats_taken() for room in self.rooms.values()),
+            "bots": sum(len(room.bots) for room in self.rooms.values()),
+            "max_rooms": self.max_rooms,
+            "connections": self.connections_received,
+            "messages": self.messages_handled,
+            "snapshots": self.snapshots_sent,
+            "shed": self.snapshots_shed,
+        }
+    
     def start(self):
-        current_player = 0
+        log(f"Server starting event loop on port {self.port}")
         
-        log(f"Server starting main accept loop on port {self.port}")
+        tick_interval = 1 / self.TICK_RATE
+        next_tick = time.monotonic()
+        next_stats = next_tick
+        tick_count = 0
         
         while True:
             try:
-                # Wait for a new connection
-                log("Waiting for a new connection...")
-                conn, addr = self.server.accept()
-                log(f"New connection from: {addr}")
+                # Sleep in select until a socket is ready or the next tick is due
+                timeout = max(0, next_tick - time.monotonic())
+                if self.shm_connections:
+                    # Shared memory has no file descriptor to wake us, so
+                    # look at the rings at least every SHM_POLL_INTERVAL
+                    timeout = min(timeout, shmlink.SHM_POLL_INTERVAL)
+                for key, mask in self.selector.select(timeout):
+                    connection = key.data
+                    if connection is None:
+                        self.accept_connections()
+                        continue
+                    if connection is self.channel:
+                        self.receive_connections()
+                        continue
+                    if connection is self.discovery:
+                        discovery.answer_probes(self.discovery, self.discovery_info())
+                        continue
+                    if connection.sock.fileno() == -1:
+                        continue  # Closed earlier in this batch
+                    if mask & selectors.EVENT_READ:
+                        self.read_from(connection)
+                    if mask & selectors.EVENT_WRITE and connection.sock.fileno() != -1:
+                        self.flush(connection)
+                self.read_shm()
                 
-                # Set socket options for better reliability
-                try:
-                    # Set TCP keepalive
-                    conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                    
-                    # Set timeout to prevent blocking indefinitely
-                    conn.settimeout(30)
-                    log(f"Socket options set for connection from {addr}")
-                except Exception as e:
-                    log(f"WARNING: Could not set socket options: {e}")
+                now = time.monotonic()
+                if now >= next_tick:
+                    tick_count += 1
+                    for room in list(self.rooms.values()):
+                        room.tick(tick_count)
+                        self.publish(room, now)
+                    if tick_count % self.TICK_RATE == 0:
+                        self.expire_held_slots()
+                        self.seat_bots(now)
+                    next_tick += tick_interval
+                    # If we fell far behind, don't try to catch up with a burst of ticks
+                    if now - next_tick > 0.25:
+                        next_tick = now + tick_interval
                 
-                # Only accept two players
-                if len(self.connections) < 2:
-                    # If player ID is already in use, find an available ID
-                    if current_player in self.connections:
-                        log(f"Player ID {current_player} already in use, switching to the other ID")
-                        current_player = 0 if current_player == 1 else 1
-                    
-                    # Store connection and start client handler thread
-                    log(f"Assigning player ID {current_player} to connection from {addr}")
-                    self.connections[current_player] = conn
-                    
-                    # Create and start a new thread to handle this client
-                    client_thread = threading.Thread(
-                        target=self.handle_client, 
-                        args=(conn, current_player),
-                        name=f"Player-{current_player}-Handler"
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                    log(f"Started handler thread for Player {current_player}")
-                    
-                    # Prepare for next connection
-                    current_player = (current_player + 1) % 2
-                else:
-                    log(f"Rejected connection from {addr}: server full (2 players already connected)")
+                if self.channel is not None and now >= next_stats:
+                    next_stats = now + self.STATS_INTERVAL
+                    # Rating changes ride along so the supervisor's leaderboard
+                    # stays current; they are kept until a report gets through
+                    stats = self.stats()
+                    stats["rating_changes"] = self.ratings.changes[:self.MAX_REPORTED_CHANGES]
                     try:
-                        # Send a friendly rejection message before closing
-                        rejection_msg = pickle.dumps("SERVER_FULL")
-                        conn.send(rejection_msg)
-                    except:
-                        pass  # Ignore errors in sending rejection
-                    finally:
-                        conn.close()
-                        log(f"Closed rejected connection from {addr}")
+                        self.channel.send(pickle.dumps(("stats", stats)))
+                        del self.ratings.changes[:len(stats["rating_changes"])]
+                    except (BlockingIOError, InterruptedError):
+                        pass  # Supervisor is busy, it gets the next report
+                    except ConnectionRefusedError:
+                        log("Supervisor is gone - shutting down worker")
+                        raise SystemExit(0)
             
-            except socket.timeout:
-                log("Accept timed out - continuing to accept loop")
-                continue
+            except (SystemExit, KeyboardInterrupt):
+                # Workers leave with os._exit(), which skips atexit handlers
+                if self.events is not None:
+                    self.events.close()
+                if self.results is not None:
+                    self.results.close()
+                raise
             except Exception as e:
-                log(f"ERROR: Unexpected error in accept loop: {e}")
+                log(f"ERROR: Unexpected error in event loop: {e}")
                 log(traceback.format_exc())
                 # Sleep briefly to avoid tight loop in case of persistent errors
                 time.sleep(1)
 
-if __name__ == "__main__":
-    # Get host's IP address to display for clients
+def clean_name(name):
+    """A player's name as given in their hello, or None if it isn't usable"""
+    if not isinstance(name, str):
+        return None
+    name = "".join(char for char in name if char.isprintable()).strip()[:MAX_NAME_LENGTH]
+    return name or None
+
+def log_network_interfaces():
+    """Log every address clients could use to reach this machine
+    
+    Only needed when LAN discovery can't help (different subnets, port
+    forwarding over the internet). Resolving the hostname may block on DNS.
+    """
     try:
-        log("Starting server - detecting network interfaces...")
-        
-        # Always clear firewall warning
-        log("\n" + "="*80)
-        log("IMPORTANT: Make sure your firewall allows incoming connections on port 5555")
-        log("If clients can't connect, you may need to add a firewall exception")
-        log("="*80 + "\n")
-        
         hostname = socket.gethostname()
         local_ip = socket.gethostbyname(hostname)
         log(f"Simple hostname resolution: {local_ip}")
-        
+    
         log("\nALL AVAILABLE NETWORK INTERFACES:")
-        
+    
         # Track all IPs for a summary
         all_detected_ips = []
-        
+    
         # Try the netifaces method first (most reliable)
         try:
             import netifaces
-            
+        
             log("Network interfaces detected:")
             for interface in netifaces.interfaces():
                 addresses = netifaces.ifaddresses(interface)
@@ -420,10 +1138,10 @@ if __name__ == "__main__":
                         if not ip.startswith('127.'):  # Skip localhost
                             all_detected_ips.append(ip)
                         log(f"  {interface}: {ip}")
-        
+    
         except ImportError:
             log("netifaces module not installed. Using alternative method.")
-            
+        
             # Fallback method using socket
             s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             try:
@@ -437,7 +1155,7 @@ if __name__ == "__main__":
                 log(f"  Socket method failed: {e}")
             finally:
                 s.close()
-                
+            
         # Try socket.getaddrinfo as well
         try:
             host_info = socket.getaddrinfo(
@@ -449,7 +1167,7 @@ if __name__ == "__main__":
                     log(f"  Additional IP from getaddrinfo: {ip}")
         except Exception as e:
             log(f"getaddrinfo method failed: {e}")
-        
+    
         # Display clear connection instructions
         log("\n" + "="*80)
         if all_detected_ips:
@@ -458,7 +1176,7 @@ if __name__ == "__main__":
             log("For clients on your network, try these IP addresses:")
             for i, ip in enumerate(all_detected_ips):
                 log(f"  {i+1}. {ip}")
-            
+        
             # Pick the most likely candidate
             best_ip = all_detected_ips[0]
             log(f"\nRECOMMENDED CONNECTION ADDRESS: {best_ip}")
@@ -471,15 +1189,108 @@ if __name__ == "__main__":
     except Exception as e:
         log(f"ERROR: Could not determine network interfaces: {e}")
         log(traceback.format_exc())
+
+def exit_on_sigterm():
+    """Make SIGTERM leave the event loop the way Ctrl+C does
     
+    Through SystemExit, so Server.start() still closes the event log and
+    writes the results queued for the background writer. A supervisor
+    stops its workers with SIGTERM, and so do service managers.
+    """
+    def handle_sigterm(signum, frame):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # Once is enough, let the cleanup finish
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+def main(argv=None, prog=None):
+    """Run the dedicated server with command line arguments"""
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog, description="Ping Pong dedicated server (no display needed)")
+    parser.add_argument("--port", type=int, default=5555, help="TCP port to listen on")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes to spread matches over (0 = one per CPU core)")
+    parser.add_argument("--rooms", type=int, default=None,
+                        help="matches hosted per process (default: 1, or 64 per worker)")
+    parser.add_argument("--min-rate", type=float, default=Server.MIN_SNAPSHOT_RATE,
+                        help="lowest snapshots per second sent to a client on a bad link")
+    parser.add_argument("--max-rate", type=float, default=Server.TICK_RATE,
+                        help=f"highest snapshots per second sent to a client (at most {Server.TICK_RATE})")
+    parser.add_argument("--bots", choices=ai.DIFFICULTIES, default=None,
+                        help="give a player left waiting for an opponent a bot of this difficulty")
+    parser.add_argument("--bot-after", type=float, default=Server.BOT_AFTER,
+                        help="seconds a player waits before getting a bot opponent")
+    parser.add_argument("--bot-rooms", type=int, default=0,
+                        help="open this many bot-vs-bot rooms per process, for load testing")
+    parser.add_argument("--event-log", metavar="PATH", default=None,
+                        help="write a binary log of network events for eventlog.py to analyze "
+                             "(worker processes write PATH with .workerN added)")
+    parser.add_argument("--results", metavar="PATH", default=results.DEFAULT_PATH,
+                        help="SQLite database to save match results in (default: results.db next to server.py)")
+    parser.add_argument("--no-results", action="store_true", help="don't save match results")
+    parser.add_argument("--max-rewind", type=float, default=Server.MAX_REWIND,
+                        help="seconds of player latency paddle hits are compensated for (0 = off)")
+    parser.add_argument("--no-shm", action="store_true",
+                        help="keep clients on this machine on TCP instead of shared memory "
+                             "(needed behind --impair's proxy, which shared memory would bypass)")
+    parser.add_argument("--show-interfaces", action="store_true",
+                        help="list this machine's addresses for clients that can't use LAN discovery")
+    args = parser.parse_args(argv)
+    if not 0 < args.min_rate <= args.max_rate:
+        parser.error("need 0 < --min-rate <= --max-rate")
+    if args.max_rewind < 0:
+        parser.error("--max-rewind can't be negative")
+    if args.bots == "expert" and ai.policy_table() is None:
+        parser.error("--bots expert needs the AI table; build it with: python ai_table.py")
+    results_path = None if args.no_results else args.results
+
+    # Always clear firewall warning
+    log("\n" + "="*80)
+    log(f"IMPORTANT: Make sure your firewall allows incoming connections on TCP port {args.port}")
+    log(f"and UDP port {discovery.DISCOVERY_PORT} (LAN discovery)")
+    log("If clients can't connect, you may need to add a firewall exception")
+    log("="*80 + "\n")
+    log("Clients on this network will find the server in the Multiplayer menu automatically")
+    log("Run with --show-interfaces to list addresses for clients on other networks")
+
+    if args.show_interfaces:
+        log("Starting server - detecting network interfaces...")
+        log_network_interfaces()
+
     # Start the server
     try:
         log("\nInitializing game server...")
+        use_workers = args.workers != 1
+        if use_workers:
+            import supervisor
+            if not supervisor.supported():
+                log("WARNING: Worker processes are not supported on this platform - running a single process")
+                use_workers = False
+    
         # Explicitly bind to all network interfaces (0.0.0.0)
-        server = Server(host='0.0.0.0')
-        log("Server initialized, starting accept loop...")
+        if use_workers:
+            server = supervisor.Supervisor(host='0.0.0.0', port=args.port,
+                                           workers=args.workers or None,
+                                           rooms_per_worker=args.rooms or (64 + args.bot_rooms),
+                                           min_snapshot_rate=args.min_rate,
+                                           max_snapshot_rate=args.max_rate,
+                                           bot_difficulty=args.bots, bot_after=args.bot_after,
+                                           bot_rooms=args.bot_rooms, event_log=args.event_log,
+                                           results_path=results_path, max_rewind=args.max_rewind,
+                                           shared_memory=not args.no_shm)
+            log("Supervisor initialized, starting workers...")
+        else:
+            server = Server(host='0.0.0.0', port=args.port, max_rooms=args.rooms or (1 + args.bot_rooms),
+                            min_snapshot_rate=args.min_rate, max_snapshot_rate=args.max_rate,
+                            bot_difficulty=args.bots, bot_after=args.bot_after, bot_rooms=args.bot_rooms,
+                            event_log=args.event_log, results_path=results_path,
+                            max_rewind=args.max_rewind, shared_memory=not args.no_shm)
+            log("Server initialized, starting accept loop...")
+        exit_on_sigterm()
         server.start()
     except Exception as e:
         log(f"CRITICAL ERROR: Server failed to start: {e}")
         log(traceback.format_exc())
-        input("Press Enter to exit...")
\ No newline at end of file
+        input("Press Enter to exit...")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import secrets
+import struct
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Platforms without shared memory (e.g. Android, WebAssembly)
+    shared_memory = None
+
+from protocol import MessageBuffer
+
+# A transport for a client and server on the same machine: after the TCP
+# handshake the client creates a shared memory segment and offers it to
+# the server, which attaches and from then on writes snapshots into it
+# instead of the socket, while the client writes its inputs into it. The
+# TCP connection stays open for whatever doesn't fit and to notice the
+# other side going away, and everything falls back to it if the server
+# can't attach (it's on another machine, or the platform has no shared
+# memory).
+#
+# The segment holds two rings of bytes, one each way, each with a single
+# writer and a single reader. The bytes are the same length-prefixed
+# messages as on the socket, so MessageBuffer splits them and nothing
+# above the transport changes. Each ring has two counters, in separate
+# cache lines: the total bytes ever written, which is also the doorbell
+# (a reader that sees it unchanged has nothing to do, one 8-byte read),
+# and the total ever read. The writer copies the message in before it
+# moves the written counter, and only the reader moves the read counter,
+# so neither side ever needs a lock. Readers poll the doorbell: the client
+# once a frame and the server every SHM_POLL_INTERVAL, instead of going
+# through the kernel at all.
+
+NAME_PREFIX = "pingpong_"
+MAGIC = b"PPSM"
+RING_SIZE = 256 * 1024  # Bytes each way, hundreds of snapshots
+HEADER = struct.Struct("<4sI")  # Magic, ring size
+COUNTER = struct.Struct("<Q")
+CACHE_LINE = 64
+SHM_POLL_INTERVAL = 0.001  # Most seconds the server sleeps while it has shared memory clients
+
+def supported():
+    return shared_memory is not None
+
+def same_host(sock):
+    """Whether the other end of a connected socket is on this machine"""
+    try:
+        return sock.getsockname()[0] == sock.getpeername()[0]
+    except OSError:
+        return False
+
+class Ring:
+    """One direction of a segment: size bytes of data after the two counters"""
+
+    def __init__(self, buf, offset, size):
+        self.buf = buf
+        self.written_at = offset
+        self.read_at = offset + CACHE_LINE
+        self.data = offset + 2 * CACHE_LINE
+        self.size = size
+
+    @staticmethod
+    def span(size):
+        """Bytes of segment a ring of size takes"""
+        return 2 * CACHE_LINE + size
+
+    def counters(self):
+        return COUNTER.unpack_from(self.buf, self.written_at)[0], COUNTER.unpack_from(self.buf, self.read_at)[0]
+
+    def backlog(self):
+        """Bytes written but not read yet"""
+        written, read = self.counters()
+        return written - read
+
+    def write(self, data):
+        """Append data, or return False if the reader is too far behind for it to fit"""
+        written, read = self.counters()
+        if written - read + len(data) > self.size:
+            return False
+        start = written % self.size
+        first = min(len(data), self.size - start)
+        self.buf[self.data + start:self.data + start + first] = data[:first]
+        if first < len(data):
+            self.buf[self.data:self.data + len(data) - first] = data[first:]
+        # Ring the doorbell only once the bytes are in place
+        COUNTER.pack_into(self.buf, self.written_at, written + len(data))
+        return True
+
+    def read(self):
+        """Everything written since the last read (b"" if the doorbell hasn't moved)"""
+        written, read = self.counters()
+        if written == read:
+            return b""
+        start = read % self.size
+        end = start + (written - read)
+        if end <= self.size:
+            data = bytes(self.buf[self.data + start:self.data + end])
+        else:
+            data = bytes(self.buf[self.data + start:self.data + self.size]) + bytes(
+                self.buf[self.data:self.data + end - self.size])
+        COUNTER.pack_into(self.buf, self.read_at, written)
+        return data
+
+class SharedMemoryLink:
+    """A client's segment: the client creates it (name None), the server attaches by name
+
+    send() writes to the other side's ring and receive() reads ours,
+    whichever side this is. Raises OSError or ValueError if the segment
+    can't be created or isn't one of ours.
+    """
+
+    def __init__(self, name=None, ring_size=RING_SIZE):
+        self.created = name is None
+        if self.created:
+            name = NAME_PREFIX + secrets.token_hex(8)
+            self.memory = shared_memory.SharedMemory(name, create=True, size=HEADER.size + 2 * Ring.span(ring_size))
+            HEADER.pack_into(self.memory.buf, 0, MAGIC, ring_size)
+        else:
+            if not (isinstance(name, str) and name.startswith(NAME_PREFIX)):
+                raise ValueError(f"Not a shared memory link: {name!r}")
+            self.memory = attach(name)
+            magic, ring_size = HEADER.unpack_from(self.memory.buf)
+            if magic != MAGIC or self.memory.size < HEADER.size + 2 * Ring.span(ring_size):
+                self.memory.close()
+                raise ValueError(f"Not a shared memory link: {name!r}")
+        self.name = name
+
+        # The client writes up, the server writes down
+        up = Ring(self.memory.buf, HEADER.size, ring_size)
+        down = Ring(self.memory.buf, HEADER.size + Ring.span(ring_size), ring_size)
+        self.outgoing, self.incoming = (up, down) if self.created else (down, up)
+
+        # Received bytes that haven't formed a complete message yet, kept
+        # apart from the socket's since either may stop mid-message
+        self.inbox = MessageBuffer()
+
+    def send(self, data):
+        """Write framed bytes; False if they don't fit (send them another way)"""
+        return self.outgoing.write(data)
+
+    def backlog(self):
+        """Bytes we sent that the other side hasn't read yet"""
+        return self.outgoing.backlog()
+
+    def receive(self):
+        """Feed what was sent to us since the last call into inbox; returns how many bytes"""
+        data = self.incoming.read()
+        if data:
+            self.inbox.feed(data)
+        return len(data)
+
+    def close(self):
+        """Detach; the client's close also removes the segment"""
+        if self.memory is None:
+            return
+        self.incoming = self.outgoing = None
+        try:
+            self.memory.close()
+        except BufferError:
+            pass  # A memoryview of it is still alive somewhere; it goes with the process
+        if self.created:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
+        self.memory = None
+
+def attach(name):
+    """Open an existing segment without making it this process's to clean up
+
+    Before Python 3.13 attaching registers the segment with the resource
+    tracker, which would remove it (and warn about a leak) when this
+    process exits, even though the client that created it owns it.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name)
+        try:
+            resource_tracker.unregister(memory._name, "shared_memory")
+        except Exception:
+            pass
+        return memory
@@ -0,0 +1,396 @@
+import os
+import pickle
+import secrets
+import signal
+import socket
+import selectors
+import time
+import traceback
+
+import server
+import discovery
+import results
+import ratings
+from server import Server, log
+from protocol import MessageBuffer, encode_message
+
+class PendingConnection:
+    """An accepted socket whose hello hasn't fully arrived yet"""
+    def __init__(self, sock, addr, deadline):
+        self.sock = sock
+        self.addr = addr
+        self.deadline = deadline
+        
+        # Everything read so far; it is forwarded to the worker untouched
+        self.data = bytearray()
+
+class Worker:
+    """Supervisor-side handle for one forked server process"""
+    def __init__(self, index):
+        self.index = index
+        self.pid = None
+        self.channel = None
+
+        # Latest counters reported by the worker
+        self.stats = {}
+
+        # Connections handed to this worker since it was (re)started
+        self.sent = 0
+
+        # When to respawn after a crash
+        self.restart_at = None
+        self.restarts = 0
+
+    def estimated_players(self):
+        """Players seated in the worker, including hand-offs it hasn't reported yet"""
+        in_flight = self.sent - self.stats.get("connections", 0)
+        return self.stats.get("players", 0) + max(0, in_flight)
+
+class Supervisor:
+    STATS_LOG_INTERVAL = 10  # Seconds between aggregated stats log lines
+    RESTART_DELAY = 1.0  # Seconds to wait before respawning a crashed worker
+    HELLO_TIMEOUT = 5.0  # Seconds a new client has to send its hello
+    SHUTDOWN_TIMEOUT = 15.0  # Seconds workers get to save their results when stopped
+
+    def __init__(self, host='', port=5555, workers=None, rooms_per_worker=64,
+                 min_snapshot_rate=Server.MIN_SNAPSHOT_RATE, max_snapshot_rate=Server.TICK_RATE,
+                 bot_difficulty=None, bot_after=Server.BOT_AFTER, bot_rooms=0, event_log=None,
+                 results_path=None, max_rewind=Server.MAX_REWIND, shared_memory=True):
+        """Accept connections on one port and spread matches over worker processes
+
+        workers defaults to one per CPU core. The supervisor only accepts
+        sockets and hands them to workers, so the per-frame traffic and the
+        simulation run in parallel in the workers. Workers report the
+        rating changes of the matches they finish, so the supervisor keeps
+        the server-wide leaderboard and answers leaderboard queries itself.
+        """
+        self.host = host
+        self.port = port
+        self.rooms_per_worker = rooms_per_worker
+        self.min_snapshot_rate = min_snapshot_rate
+        self.max_snapshot_rate = max_snapshot_rate
+        self.bot_difficulty = bot_difficulty
+        self.bot_after = bot_after
+        self.bot_rooms = bot_rooms
+        self.event_log = event_log
+        self.results_path = results_path
+        self.max_rewind = max_rewind
+        self.shared_memory = shared_memory
+        self.workers = [Worker(i) for i in range(workers or os.cpu_count() or 1)]
+        self.ratings = ratings.Ratings()
+        if results_path is not None and os.path.exists(results_path):
+            self.ratings.load(results.load_ratings(results.connect(results_path)))
+
+        log(f"Initializing supervisor with host='{host}', port={port}, workers={len(self.workers)}")
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.server.bind((self.host, self.port))
+            log(f"Socket successfully bound to {self.host if self.host else '*'}:{self.port}")
+        except socket.error as e:
+            log(f"CRITICAL ERROR: Socket binding failed: {e}")
+            log(traceback.format_exc())
+            raise
+        self.server.listen(128)
+        self.server.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ, None)
+        self.pending = {}
+        
+        # The supervisor answers LAN discovery for all of its workers
+        self.discovery = None
+        self.server_id = secrets.token_hex(4)
+        try:
+            self.discovery = discovery.open_responder()
+            self.selector.register(self.discovery, selectors.EVENT_READ, self.discovery)
+            log(f"Answering LAN discovery probes on UDP port {discovery.DISCOVERY_PORT}")
+        except OSError as e:
+            log(f"WARNING: LAN discovery disabled, could not bind UDP port {discovery.DISCOVERY_PORT}: {e}")
+
+    def spawn(self, worker):
+        """Fork a worker process running a Server fed over a socket pair
+        
+        The pair is datagram based so every hand-off (one socket plus the
+        bytes already read from it) and every stats report stays one message.
+        """
+        parent_channel, child_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                # The worker only needs its own end of its own channel
+                parent_channel.close()
+                self.server.close()
+                self.selector.close()
+                for other in self.workers:
+                    if other.channel is not None:
+                        other.channel.close()
+                for pending in self.pending.values():
+                    pending.sock.close()
+                if self.discovery is not None:
+                    self.discovery.close()
+                server.LOG_PREFIX = f"[worker {worker.index}] "
+                # The supervisor stops us with SIGTERM; save the queued results first
+                server.exit_on_sigterm()
+                Server(self.host, self.port, max_rooms=self.rooms_per_worker,
+                       channel=child_channel, worker_index=worker.index,
+                       min_snapshot_rate=self.min_snapshot_rate,
+                       max_snapshot_rate=self.max_snapshot_rate,
+                       bot_difficulty=self.bot_difficulty, bot_after=self.bot_after,
+                       bot_rooms=self.bot_rooms, event_log=self.event_log,
+                       results_path=self.results_path, max_rewind=self.max_rewind,
+                       shared_memory=self.shared_memory).start()
+            except (SystemExit, KeyboardInterrupt):
+                pass
+            except BaseException as e:
+                log(f"CRITICAL ERROR: Worker crashed: {e}")
+                log(traceback.format_exc())
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        child_channel.close()
+        parent_channel.setblocking(False)
+        worker.pid = pid
+        worker.channel = parent_channel
+        worker.stats = {}
+        worker.sent = 0
+        worker.restart_at = None
+        self.selector.register(parent_channel, selectors.EVENT_READ, worker)
+        log(f"Started worker {worker.index} (pid {pid})")
+
+    def choose_worker(self, hello):
+        """Pick the worker for a new connection
+        
+        A resuming client goes back to the worker named in its session token.
+
+        A worker with an odd number of players has someone waiting for an
+        opponent, so it gets the connection. Otherwise the least loaded worker
+        does, which then becomes the odd one that receives the next player.
+        """
+        alive = [worker for worker in self.workers if worker.channel is not None]
+        if isinstance(hello, tuple) and len(hello) == 2 and hello[0] == "resume":
+            try:
+                worker = self.workers[int(str(hello[1]).split(".", 1)[0])]
+                if worker.channel is not None:
+                    return worker
+            except (ValueError, IndexError):
+                pass  # Not one of our tokens, treat it as a new player
+        for worker in alive:
+            if worker.estimated_players() % 2 == 1:
+                return worker
+        capacity = 2 * self.rooms_per_worker
+        open_workers = [worker for worker in alive if worker.estimated_players() < capacity]
+        if not open_workers:
+            return None
+        return min(open_workers, key=Worker.estimated_players)
+
+    def accept_connections(self):
+        while True:
+            try:
+                conn, addr = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            
+            # Wait for the hello before picking a worker
+            conn.setblocking(False)
+            pending = PendingConnection(conn, addr, time.monotonic() + self.HELLO_TIMEOUT)
+            self.pending[conn] = pending
+            self.selector.register(conn, selectors.EVENT_READ, pending)
+    
+    def read_hello(self, pending):
+        try:
+            data = pending.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.drop_pending(pending)
+            return
+        pending.data += data
+        
+        # Peek at the first message without consuming the forwarded bytes
+        buffer = MessageBuffer()
+        buffer.feed(pending.data)
+        try:
+            hello = next(buffer.messages(), None)
+        except Exception as e:
+            log(f"ERROR: Bad hello from {pending.addr}: {e}")
+            self.drop_pending(pending)
+            return
+        if hello is not None:
+            self.dispatch(pending, hello)
+    
+    def dispatch(self, pending, hello):
+        """Hand a client socket and its buffered bytes to a worker"""
+        self.selector.unregister(pending.sock)
+        del self.pending[pending.sock]
+        conn = pending.sock
+        try:
+            if isinstance(hello, tuple) and len(hello) == 2 and hello[0] == "leaderboard":
+                count = hello[1] if isinstance(hello[1], int) else 10
+                conn.sendall(encode_message(("leaderboard", self.ratings.top(max(0, min(count, 100))))))
+                return
+            worker = self.choose_worker(hello)
+            if worker is None:
+                log(f"Rejected connection from {pending.addr}: all workers full")
+                conn.sendall(encode_message("SERVER_FULL"))
+                return
+            message = pickle.dumps(("connection", bytes(pending.data)))
+            socket.send_fds(worker.channel, [message], [conn.fileno()])
+            worker.sent += 1
+            log(f"Handed connection from {pending.addr} to worker {worker.index}")
+        except OSError as e:
+            log(f"ERROR: Failed to hand off connection from {pending.addr}: {e}")
+        finally:
+            # The worker holds its own copy of the descriptor
+            conn.close()
+    
+    def drop_pending(self, pending):
+        self.selector.unregister(pending.sock)
+        del self.pending[pending.sock]
+        pending.sock.close()
+    
+    def read_stats(self, worker):
+        while True:
+            try:
+                message = worker.channel.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return  # reap_workers notices the exit
+            kind, stats = pickle.loads(message)
+            if kind == "stats":
+                self.ratings.apply(stats.pop("rating_changes", ()))
+                worker.stats = stats
+
+    def worker_exited(self, worker):
+        """Forget a dead worker and schedule its replacement"""
+        if worker.channel is None:
+            return
+        self.selector.unregister(worker.channel)
+        worker.channel.close()
+        worker.channel = None
+        worker.restarts += 1
+        worker.restart_at = time.monotonic() + self.RESTART_DELAY
+        log(f"WARNING: Worker {worker.index} (pid {worker.pid}) exited - restarting in {self.RESTART_DELAY}s")
+
+    def reap_workers(self):
+        """Collect exited worker processes without blocking"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for worker in self.workers:
+                if worker.pid == pid:
+                    log(f"Worker {worker.index} (pid {pid}) exited with status {status}")
+                    self.worker_exited(worker)
+
+    def discovery_info(self):
+        """What LAN discovery replies say about this host"""
+        totals = self.aggregate_stats()
+        max_rooms = self.rooms_per_worker * len(self.workers)
+        return {
+            "id": self.server_id,
+            "name": socket.gethostname(),
+            "port": self.port,
+            "rooms": totals["rooms"],
+            "max_rooms": max_rooms,
+            "players": totals["players"],
+            "load": totals["players"] / (2 * max_rooms),
+        }
+
+    def aggregate_stats(self):
+        """Sum the latest counters of every worker"""
+        totals = {"workers": 0, "rooms": 0, "waiting": 0, "players": 0, "bots": 0, "messages": 0,
+                  "snapshots": 0, "shed": 0, "restarts": 0}
+        for worker in self.workers:
+            totals["restarts"] += worker.restarts
+            if worker.channel is None:
+                continue
+            totals["workers"] += 1
+            for key in ("rooms", "waiting", "players", "bots", "messages", "snapshots", "shed"):
+                totals[key] += worker.stats.get(key, 0)
+        return totals
+
+    def start(self):
+        for worker in self.workers:
+            self.spawn(worker)
+
+        next_stats_log = time.monotonic() + self.STATS_LOG_INTERVAL
+        last_messages = 0
+        last_snapshots = 0
+        last_shed = 0
+        try:
+            while True:
+                for key, mask in self.selector.select(1.0):
+                    if key.data is None:
+                        self.accept_connections()
+                    elif isinstance(key.data, PendingConnection):
+                        self.read_hello(key.data)
+                    elif key.data is self.discovery:
+                        discovery.answer_probes(self.discovery, self.discovery_info())
+                    else:
+                        self.read_stats(key.data)
+
+                self.reap_workers()
+                now = time.monotonic()
+                for pending in list(self.pending.values()):
+                    if now >= pending.deadline:
+                        log(f"Dropped connection from {pending.addr}: no hello within {self.HELLO_TIMEOUT}s")
+                        self.drop_pending(pending)
+                for worker in self.workers:
+                    if worker.channel is None and worker.restart_at is not None and now >= worker.restart_at:
+                        self.spawn(worker)
+
+                if now >= next_stats_log:
+                    totals = self.aggregate_stats()
+                    rate = max(0, totals["messages"] - last_messages) / self.STATS_LOG_INTERVAL
+                    last_messages = totals["messages"]
+                    snapshot_rate = max(0, totals["snapshots"] - last_snapshots) / self.STATS_LOG_INTERVAL
+                    last_snapshots = totals["snapshots"]
+                    shed_rate = max(0, totals["shed"] - last_shed) / self.STATS_LOG_INTERVAL
+                    last_shed = totals["shed"]
+                    log(f"Stats: {totals['workers']} workers, {totals['rooms']} rooms, "
+                        f"{totals['players']} players, {totals['bots']} bots, {rate:.0f} msg/s, "
+                        f"{snapshot_rate:.0f} snapshots/s ({shed_rate:.0f}/s shed), {totals['restarts']} restarts")
+                    next_stats_log = now + self.STATS_LOG_INTERVAL
+        finally:
+            self.stop_workers()
+
+    def stop_workers(self):
+        """SIGTERM every worker and wait for them to save their results, up to SHUTDOWN_TIMEOUT"""
+        running = set()
+        for worker in self.workers:
+            if worker.channel is not None:
+                try:
+                    os.kill(worker.pid, signal.SIGTERM)
+                    running.add(worker.pid)
+                except OSError:
+                    pass
+        deadline = time.monotonic() + self.SHUTDOWN_TIMEOUT
+        while running and time.monotonic() < deadline:
+            for pid in list(running):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0] == 0:
+                        continue
+                except ChildProcessError:
+                    pass
+                running.discard(pid)
+            time.sleep(0.05)
+        for pid in running:
+            log(f"Worker pid {pid} did not stop within {self.SHUTDOWN_TIMEOUT}s - killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+def supported():
+    """Worker mode needs fork() and descriptor passing (not available on Windows)"""
+    return hasattr(os, "fork") and hasattr(socket, "send_fds")
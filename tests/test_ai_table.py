@@ -0,0 +1,36 @@
+import pytest
+
+import ai
+import ai_table
+
+@pytest.fixture(scope="module")
+def table_bytes(tmp_path_factory):
+    path = tmp_path_factory.mktemp("table") / "ai_table.bin"
+    ai_table.build(str(path), cell_size=40, slope_cells=5)
+    return path.read_bytes()
+
+def test_a_built_table_loads(table_bytes, tmp_path):
+    path = tmp_path / "ai_table.bin"
+    path.write_bytes(table_bytes)
+    table = ai_table.PolicyTable(str(path))
+    assert len(table.targets) == table.x_cells * table.y_cells * table.slope_cells
+    assert 0 <= table.target_y("right", 400, 300, 5, 2) <= 500
+    table.close()
+    assert not list(tmp_path.glob("*.partial"))
+
+@pytest.mark.parametrize("keep", [0, 5, ai_table.HEADER.size, -1, -2])
+def test_a_truncated_table_is_refused(table_bytes, tmp_path, keep):
+    path = tmp_path / "ai_table.bin"
+    path.write_bytes(table_bytes[:keep] if keep >= 0 else table_bytes[:len(table_bytes) + keep])
+    with pytest.raises(ValueError):
+        ai_table.PolicyTable(str(path))
+
+def test_the_expert_plays_like_hard_without_a_usable_table(table_bytes, tmp_path, monkeypatch):
+    path = tmp_path / "ai_table.bin"
+    path.write_bytes(table_bytes[:-1])
+    monkeypatch.setattr(ai_table.PolicyTable.__init__, "__defaults__", (str(path),))
+    monkeypatch.setattr(ai, "policy_table_loaded", False)
+    monkeypatch.setattr(ai, "policy_table_cache", None)
+    assert ai.policy_table() is None
+    args = (700, 200, 5, 3)
+    assert ai.paddle_move("expert", "right", 250, *args) == ai.paddle_move("hard", "right", 250, *args)
@@ -0,0 +1,38 @@
+import pytest
+
+from chaos import ChaosGame
+
+def touching(game, pairs):
+    size = game.ball_size
+    return {(min(i, j), max(i, j)) for i, j in pairs
+            if (game.xs[i] - game.xs[j]) ** 2 + (game.ys[i] - game.ys[j]) ** 2 < size * size}
+
+@pytest.mark.parametrize("count", [2, 50, 400])
+def test_broadphase_finds_every_touching_pair(count):
+    game = ChaosGame(count, seed=count, win_score=0)
+    for _ in range(30):
+        game.step(0, 0)
+        pairs = game.grid_pairs()
+        assert len(pairs) == len({(min(i, j), max(i, j)) for i, j in pairs})  # Each pair once
+        assert touching(game, pairs) == touching(game, game.all_pairs())
+
+def test_broadphase_tests_far_fewer_pairs_than_all_of_them():
+    game = ChaosGame(1000, seed=1, win_score=0)
+    assert len(game.grid_pairs()) < 1000 * 999 / 2 / 20
+
+def test_collisions_keep_momentum():
+    game = ChaosGame(300, seed=2, win_score=0)
+    before = (sum(game.speed_xs), sum(game.speed_ys))
+    game.collide(game.grid_pairs())
+    assert game.collisions
+    after = (sum(game.speed_xs), sum(game.speed_ys))
+    assert after == pytest.approx(before)
+
+def test_same_seed_same_match():
+    first = ChaosGame(100, seed=3)
+    second = ChaosGame(100, seed=3)
+    for _ in range(100):
+        first.step(first.ai_buttons(0), first.ai_buttons(1))
+        second.step(second.ai_buttons(0), second.ai_buttons(1))
+    assert (first.xs, first.ys, first.left_score, first.right_score) == \
+        (second.xs, second.ys, second.left_score, second.right_score)
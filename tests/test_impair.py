@@ -0,0 +1,108 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import impair
+from impair import Impairment, ImpairmentProxy
+
+DELAY = 0.05  # Each way
+
+@pytest.fixture
+def echo_server():
+    """A TCP and a UDP echo server on the same port"""
+    tcp = socket.socket()
+    tcp.bind(("127.0.0.1", 0))
+    tcp.listen()
+    port = tcp.getsockname()[1]
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(("127.0.0.1", port))
+    
+    def echo_tcp():
+        try:
+            while True:
+                sock, addr = tcp.accept()
+                with sock:
+                    while data := sock.recv(65536):
+                        sock.sendall(data)
+        except OSError:
+            pass
+    
+    def echo_udp():
+        try:
+            while True:
+                data, addr = udp.recvfrom(65536)
+                udp.sendto(data, addr)
+        except OSError:
+            pass
+    
+    for target in (echo_tcp, echo_udp):
+        threading.Thread(target=target, daemon=True).start()
+    yield port
+    tcp.close()
+    udp.close()
+
+@pytest.fixture
+def proxy(echo_server):
+    proxy = ImpairmentProxy("127.0.0.1", echo_server, profile=[(None, Impairment(delay=DELAY))]).start()
+    yield proxy
+    proxy.close()
+
+def round_trips(send, receive, count=5):
+    times = []
+    for n in range(count):
+        start = time.perf_counter()
+        send(b"ping %d" % n)
+        assert receive() == b"ping %d" % n
+        times.append(time.perf_counter() - start)
+    return times
+
+def test_tcp_through_the_proxy_is_delayed(proxy):
+    with socket.create_connection(("127.0.0.1", proxy.port), timeout=5) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        times = round_trips(sock.sendall, lambda: sock.recv(65536))
+    assert min(times) >= 2 * DELAY
+
+def test_udp_through_the_proxy_is_delayed(proxy):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(5)
+        sock.connect(("127.0.0.1", proxy.port))
+        times = round_trips(sock.send, lambda: sock.recv(65536))
+    assert min(times) >= 2 * DELAY
+
+def test_a_target_that_does_not_answer_holds_up_no_other_link(monkeypatch):
+    # A target that stops accepting once its one connection is in: with its
+    # backlog full, later connection attempts get no answer
+    monkeypatch.setattr(impair, "CONNECT_TIMEOUT", 1)
+    target = socket.socket()
+    target.bind(("127.0.0.1", 0))
+    target.listen(0)
+    proxy = ImpairmentProxy(*target.getsockname(), profile=[(None, Impairment(delay=DELAY))]).start()
+    stuck = []
+    try:
+        first = socket.create_connection(("127.0.0.1", proxy.port), timeout=5)
+        server_end, addr = target.accept()
+        server_end.settimeout(5)
+        for _ in range(4):
+            sock = socket.socket()
+            sock.setblocking(False)
+            sock.connect_ex(target.getsockname())
+            stuck.append(sock)
+        stuck.append(socket.create_connection(("127.0.0.1", proxy.port)))  # Its connect hangs
+        time.sleep(0.1)
+        
+        start = time.perf_counter()
+        first.sendall(b"ping")
+        assert server_end.recv(64) == b"ping"
+        server_end.sendall(b"pong")
+        assert first.recv(64) == b"pong"
+        assert time.perf_counter() - start < 1
+        # The proxy gives up on the hanging one in the end
+        stuck[-1].settimeout(5)
+        assert stuck[-1].recv(64) == b""
+    finally:
+        proxy.close()
+        for sock in stuck:
+            sock.close()
+        target.close()
@@ -0,0 +1,59 @@
+import pytest
+
+import server
+from game_state import INPUT_DOWN, INPUT_UP, PADDLE_SPEED
+from protocol import MAX_INPUTS, decode_inputs, encode_inputs
+
+@pytest.fixture
+def room(monkeypatch):
+    monkeypatch.setattr(server, "DEBUG_MODE", False)
+    return server.Room(0)
+
+def packets(presses, redundancy=8):
+    """The input packets a client sends for presses, one per tick, each repeating the last few"""
+    return [encode_inputs(tick, presses[max(0, tick + 1 - redundancy):tick + 1]) for tick in range(len(presses))]
+
+def test_inputs_round_trip():
+    assert decode_inputs(encode_inputs(10, [0, INPUT_UP, INPUT_DOWN])) == [(8, 0), (9, INPUT_UP), (10, INPUT_DOWN)]
+
+@pytest.mark.parametrize("data", [encode_inputs(5, []), encode_inputs(40, [0] * (MAX_INPUTS + 1)), b"\x00"])
+def test_malformed_input_packets_are_rejected(data):
+    with pytest.raises(ValueError):
+        decode_inputs(data)
+
+def test_repeated_inputs_are_queued_once(room):
+    presses = [INPUT_UP, 0, INPUT_DOWN, INPUT_DOWN, 0, INPUT_UP]
+    for packet in packets(presses):
+        room.handle_message(0, packet)
+    assert list(room.inputs[0]) == list(enumerate(presses))
+    assert room.input_received[0] == len(presses) - 1
+
+def test_lost_packets_are_filled_in_by_later_ones(room):
+    presses = [INPUT_UP, INPUT_UP, INPUT_DOWN, 0, INPUT_DOWN]
+    sent = packets(presses, redundancy=3)
+    for tick in (0, 3, 4):  # 1 and 2 never arrive
+        room.handle_message(0, sent[tick])
+    assert list(room.inputs[0]) == list(enumerate(presses))
+
+def test_late_packets_change_nothing(room):
+    presses = [INPUT_UP, INPUT_DOWN, 0, INPUT_UP]
+    sent = packets(presses)
+    room.handle_message(0, sent[3])
+    room.handle_message(0, sent[1])  # Reordered on the way
+    assert list(room.inputs[0]) == list(enumerate(presses))
+
+def test_each_input_is_applied_once_per_tick(room):
+    start = room.game_state.left_paddle_y
+    for packet in packets([INPUT_DOWN] * 3):
+        room.handle_message(0, packet)
+        room.handle_message(0, packet)  # Duplicated on the way
+    for tick in range(1, 6):
+        room.tick(tick)
+    assert room.game_state.left_paddle_y == start + 3 * PADDLE_SPEED
+    assert room.input_applied[0] == 2
+
+def test_a_client_too_far_ahead_loses_its_oldest_inputs(room):
+    presses = [INPUT_UP] * (room.MAX_BUFFERED_INPUTS + 4)
+    room.handle_message(0, encode_inputs(len(presses) - 1, presses))
+    assert len(room.inputs[0]) == room.MAX_BUFFERED_INPUTS
+    assert room.inputs[0][0][0] == 4
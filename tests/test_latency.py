@@ -0,0 +1,36 @@
+import random
+
+from latency import LinkEstimator
+
+def test_min_rtt_is_the_lowest_sample_in_the_window():
+    link = LinkEstimator()
+    rng = random.Random(1)
+    history = []
+    for step in range(2000):
+        now = step * 0.05
+        rtt = rng.uniform(0.02, 0.2)
+        history.append((now, rtt))
+        link.add_rtt_sample(rtt, now)
+        assert link.min_rtt == min(sample for at, sample in history if at >= now - link.MIN_RTT_WINDOW)
+    assert len(link.min_rtt_samples) < 50
+
+def test_a_spike_when_the_window_turns_over_keeps_the_baseline():
+    link = LinkEstimator()
+    now = 0.0
+    while now < link.MIN_RTT_WINDOW:
+        link.add_rtt_sample(0.030, now)
+        now += 0.1
+    # Queues build up: every sample from here on is high
+    for _ in range(20):
+        link.add_rtt_sample(0.250, now)
+        now += 0.1
+    assert link.min_rtt == 0.030
+    assert link.queueing_delay() > 0.1
+
+def test_the_baseline_rises_once_the_low_samples_age_out():
+    link = LinkEstimator()
+    link.add_rtt_sample(0.030, 0.0)
+    link.add_rtt_sample(0.080, 1.0)
+    assert link.min_rtt == 0.030
+    link.add_rtt_sample(0.090, 1.0 + link.MIN_RTT_WINDOW)
+    assert link.min_rtt == 0.080
@@ -0,0 +1,69 @@
+import socket
+import time
+
+import pytest
+
+import network
+from game_state import GameState
+from protocol import MessageBuffer, encode_message, recv_message
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+    sock.settimeout(5)
+    yield sock
+    sock.close()
+
+@pytest.fixture
+def joined(listener, monkeypatch):
+    """A Network seated as player 0 on a fake server, and the server's end"""
+    monkeypatch.setattr(network, "DEBUG_MODE", False)
+    client = network.Network(*listener.getsockname(), connect=False, shared_memory=False)
+    client.client.connect(listener.getsockname())
+    server_end, addr = listener.accept()
+    server_end.sendall(encode_message(("welcome", 0, "token", False)))
+    client.player_id = client.join()
+    assert client.player_id == 0
+    yield client, server_end
+    server_end.close()
+    client.disconnect()
+
+def test_resuming_never_blocks_a_frame(joined, listener):
+    client, server_end = joined
+    server_end.close()
+    assert client.reconnect()
+    for _ in range(20):
+        start = time.perf_counter()
+        assert client.send_input(0) is None
+        assert time.perf_counter() - start < 0.05
+        assert client.reconnecting()
+    
+    # The server answers the resume; the next send goes through on the new socket
+    server_end, addr = listener.accept()
+    server_end.settimeout(5)
+    assert recv_message(server_end, MessageBuffer()) == ("resume", "token")
+    server_end.sendall(encode_message(("welcome", 0, "token", True)) +
+                       encode_message(("state", 1, GameState(), (0, 0))))
+    deadline = time.monotonic() + 5
+    state = None
+    while state is None and time.monotonic() < deadline:
+        state = client.send_input(0)
+    assert isinstance(state, GameState)
+    assert not client.reconnecting()
+    server_end.close()
+
+def test_resuming_gives_up_after_the_window(joined, listener, monkeypatch):
+    client, server_end = joined
+    monkeypatch.setattr(client, "RECONNECT_WINDOW", 0.5)
+    monkeypatch.setattr(client, "RESPONSE_TIMEOUT", 0.1)
+    server_end.close()
+    listener.close()  # Nothing to resume with
+    assert client.reconnect()
+    deadline = time.monotonic() + 5
+    while client.reconnecting() and time.monotonic() < deadline:
+        start = time.perf_counter()
+        assert client.send_input(0) is None
+        assert time.perf_counter() - start < 0.05
+    assert not client.reconnecting()
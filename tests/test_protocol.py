@@ -0,0 +1,73 @@
+import pickle
+import socket
+
+import pytest
+
+from protocol import HEADER, MAX_MESSAGE_SIZE, MessageBuffer, encode_message, encode_payload, recv_message
+
+MESSAGES = [("welcome", 0, "token", False), "ready", (None, b"\x00\x00\x00\x01\x02"), {"big": "x" * 5000}]
+
+def stream():
+    return b"".join(encode_message(message) for message in MESSAGES)
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 4096])
+def test_messages_split_across_chunks(chunk_size):
+    data = stream()
+    buffer = MessageBuffer()
+    received = []
+    for start in range(0, len(data), chunk_size):
+        buffer.feed(data[start:start + chunk_size])
+        received += buffer.messages()
+    assert received == MESSAGES
+    assert not buffer.buffer
+
+def test_messages_merged_in_one_chunk():
+    buffer = MessageBuffer()
+    buffer.feed(stream())
+    assert list(buffer.messages()) == MESSAGES
+    assert not buffer.buffer
+
+def test_partial_message_waits_for_the_rest():
+    data = encode_message("ready")
+    buffer = MessageBuffer()
+    buffer.feed(data[:HEADER.size])
+    assert list(buffer.messages()) == []
+    buffer.feed(data[HEADER.size:-1])
+    assert list(buffer.messages()) == []
+    buffer.feed(data[-1:])
+    assert list(buffer.messages()) == ["ready"]
+
+def test_stopping_early_keeps_the_rest_buffered():
+    buffer = MessageBuffer()
+    buffer.feed(stream())
+    for message in buffer.messages():
+        break  # What recv_message() does
+    assert message == MESSAGES[0]
+    assert list(buffer.messages()) == MESSAGES[1:]
+
+def test_encode_payload_frames_a_pickle():
+    buffer = MessageBuffer()
+    buffer.feed(encode_payload(pickle.dumps(("state", 7))))
+    assert list(buffer.messages()) == [("state", 7)]
+
+def test_oversized_message_is_rejected_before_it_arrives():
+    buffer = MessageBuffer()
+    buffer.feed(HEADER.pack(MAX_MESSAGE_SIZE + 1) + b"x")
+    with pytest.raises(ValueError):
+        list(buffer.messages())
+
+def test_largest_allowed_message():
+    payload = pickle.dumps(b"x" * (MAX_MESSAGE_SIZE - 64))
+    assert len(payload) <= MAX_MESSAGE_SIZE
+    buffer = MessageBuffer()
+    buffer.feed(encode_payload(payload))
+    assert list(buffer.messages()) == [b"x" * (MAX_MESSAGE_SIZE - 64)]
+
+def test_recv_message_returns_merged_messages_one_at_a_time():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(stream())
+        left.shutdown(socket.SHUT_WR)
+        buffer = MessageBuffer()
+        assert [recv_message(right, buffer) for _ in MESSAGES] == MESSAGES
+        assert recv_message(right, buffer) is None
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from ratings import DEFAULT_RATING, Leaderboard, Ratings
+
+def expected_order(ratings):
+    return sorted(ratings.items(), key=lambda item: (-item[1], item[0]))
+
+@pytest.mark.parametrize("seed", range(5))
+def test_leaderboard_matches_a_sorted_list_under_random_operations(seed):
+    rng = random.Random(seed)
+    board = Leaderboard(random.Random(seed))
+    ratings = {}
+    for step in range(2000):
+        name = f"player{rng.randrange(200)}"
+        if ratings and rng.random() < 0.1:
+            name = rng.choice(sorted(ratings))
+            board.remove(name)
+            del ratings[name]
+        else:
+            # Few distinct ratings, so ties (broken by name) come up often
+            ratings[name] = rng.choice([1400.0, 1500.0, 1600.0, rng.uniform(1000, 2000)])
+            board.update(name, ratings[name])
+        
+        if step % 100 == 0:
+            order = expected_order(ratings)
+            assert len(board) == len(ratings)
+            assert board.top(len(ratings) + 1) == order
+            for rank, (name, rating) in enumerate(order, 1):
+                assert board.rank(name) == rank
+    
+    order = expected_order(ratings)
+    assert board.top(10) == order[:10]
+    assert board.top(len(order) + 5) == order
+
+def test_rank_of_unknown_player():
+    board = Leaderboard()
+    board.update("alice", 1500)
+    assert board.rank("bob") is None
+
+def test_rated_match_moves_both_players_and_the_board():
+    ratings = Ratings(report_changes=True)
+    changes = ratings.record_match("alice", "bob")
+    (winner, gain, won), (loser, loss, lost) = changes
+    assert (winner, won, loser, lost) == ("alice", 1, "bob", 0)
+    assert gain == -loss > 0
+    assert ratings.rating("alice") == DEFAULT_RATING + gain
+    assert ratings.rank("alice") == 1 and ratings.rank("bob") == 2
+    assert ratings.changes == changes
+    assert ratings.top() == [(1, "alice", round(DEFAULT_RATING + gain), 1, 1),
+                             (2, "bob", round(DEFAULT_RATING + loss), 1, 0)]
+
+def test_applied_changes_match_recorded_ones():
+    worker = Ratings(report_changes=True)
+    supervisor = Ratings()
+    rng = random.Random(1)
+    names = [f"player{i}" for i in range(20)]
+    for _ in range(300):
+        winner, loser = rng.sample(names, 2)
+        worker.record_match(winner, loser)
+    supervisor.apply(worker.changes)
+    assert supervisor.players == worker.players
+    assert supervisor.top(20) == worker.top(20)
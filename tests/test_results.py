@@ -0,0 +1,45 @@
+import pytest
+
+import results
+from results import MatchStats, ResultsStore
+
+def result(names=("alice", "bob"), winner=0, forfeit=False):
+    stats = MatchStats()
+    return stats.result(list(names), winner, "local", forfeit=forfeit)
+
+def test_close_writes_everything_queued(tmp_path):
+    path = str(tmp_path / "results.db")
+    store = ResultsStore(path)
+    for i in range(25):
+        store.record(result((f"player{i}", "bob"), winner=i % 2))
+    store.close()
+    
+    assert store.written == 25
+    db = results.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM matches").fetchone() == (25,)
+    assert db.execute("SELECT COUNT(*) FROM match_players").fetchone() == (50,)
+    assert db.execute("SELECT SUM(won) FROM match_players WHERE name = 'bob'").fetchone() == (12,)
+
+def test_results_after_close_are_ignored(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    store.close()
+    store.record(result())
+    store.close()  # A second close (e.g. at exit) does nothing
+    assert store.written == 0
+
+def test_results_share_transactions(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    for _ in range(10):
+        store.record(result())
+    store.close()
+    assert store.written == 10
+    assert store.batches < 10
+
+def test_rating_changes_add_up_across_writers(tmp_path):
+    path = str(tmp_path / "results.db")
+    for delta in (10.0, -4.0):
+        store = ResultsStore(path)
+        stats = MatchStats()
+        store.record(stats.result(["alice", "bob"], 0, "server", rating_changes=[("alice", delta, 1)]))
+        store.close()
+    assert results.load_ratings(results.connect(path)) == [("alice", results.DEFAULT_RATING + 6.0, 2, 2)]
@@ -0,0 +1,121 @@
+import random
+import socket
+
+import pytest
+
+from game_state import INPUT_DOWN, INPUT_UP
+from rollback import INPUT_RESTART, HASH_INTERVAL, FixedGame, RollbackSession
+
+BUTTONS = (0, INPUT_UP, INPUT_DOWN, INPUT_UP | INPUT_DOWN)
+
+def random_inputs(seed, frames):
+    rng = random.Random(seed)
+    return [(rng.choice(BUTTONS), rng.choice(BUTTONS) | (INPUT_RESTART if rng.random() < 0.01 else 0))
+            for _ in range(frames)]
+
+@pytest.mark.parametrize("seed", [1, 2, 0xDEADBEEF])
+def test_same_seed_and_inputs_play_the_same_match(seed):
+    first = FixedGame(seed)
+    second = FixedGame(seed)
+    for left, right in random_inputs(seed, 3000):
+        first.step(left, right)
+        second.step(left, right)
+        assert first.save() == second.save()
+    assert first.left_score + first.right_score > 0  # Points were actually played
+
+def test_different_seeds_serve_differently():
+    assert FixedGame(1).save() != FixedGame(2).save()
+
+def test_rolling_back_and_replaying_catches_up_with_the_real_match():
+    inputs = random_inputs(7, 2000)
+    truth = FixedGame(7)
+    guessing = FixedGame(7)
+    saved = {}
+    rng = random.Random(7)
+    frame = 0
+    while frame < len(inputs):
+        # Play a few frames on guesses for the right player, then learn the
+        # real inputs, roll back and replay them
+        depth = min(rng.randint(1, RollbackSession.MAX_ROLLBACK), len(inputs) - frame)
+        for ahead in range(depth):
+            saved[frame + ahead] = guessing.save()
+            guessing.step(inputs[frame + ahead][0], rng.choice(BUTTONS))
+        guessing.restore(saved[frame])
+        for left, right in inputs[frame:frame + depth]:
+            guessing.step(left, right)
+            truth.step(left, right)
+        frame += depth
+        assert guessing.save() == truth.save()
+
+def test_checksum_depends_on_every_field():
+    game = FixedGame(3)
+    saved = game.save()
+    for i in range(len(saved)):
+        changed = list(saved)
+        changed[i] += 1
+        assert FixedGame.checksum(tuple(changed)) != FixedGame.checksum(saved)
+
+@pytest.fixture
+def peers():
+    """A host and a joining RollbackSession talking over loopback UDP"""
+    sockets = []
+    for _ in range(2):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.setblocking(False)
+        sockets.append(sock)
+    host = RollbackSession(sockets[0], sockets[1].getsockname(), 0, seed=99)
+    joiner = RollbackSession(sockets[1], sockets[0].getsockname(), 1, seed=99)
+    yield host, joiner
+    for sock in sockets:
+        sock.close()
+
+def play(sessions, frames, seed, burst=3):
+    """Advance the sessions in turns of up to burst frames each, so each plays ahead on guesses"""
+    rng = random.Random(seed)
+    for _ in range(frames // burst):
+        for session in sessions:
+            for _ in range(rng.randint(1, burst)):
+                session.advance(rng.choice(BUTTONS))
+
+def assert_lockstep(host, joiner):
+    # The state before every frame both have final inputs for is the same
+    common = set(host.checkpoints) & set(joiner.checkpoints)
+    assert common
+    for frame in common:
+        assert host.checkpoints[frame] == joiner.checkpoints[frame]
+
+def test_peers_stay_in_lockstep_through_rollbacks(peers):
+    host, joiner = peers
+    play(peers, 600, seed=5)
+    assert host.rollbacks and joiner.rollbacks
+    assert host.desyncs == joiner.desyncs == 0
+    assert_lockstep(host, joiner)
+    assert host.frame > 2 * HASH_INTERVAL and joiner.frame > 2 * HASH_INTERVAL
+
+def test_a_desynced_joiner_resyncs_to_the_host(peers):
+    host, joiner = peers
+    play(peers, 3 * HASH_INTERVAL, seed=8)
+    # Knock the joiner's ball somewhere else, as a bug on one machine would
+    saved = list(joiner.game.save())
+    saved[2] += 1
+    joiner.game.restore(tuple(saved))
+    play(peers, 12 * HASH_INTERVAL, seed=9)
+    assert host.desyncs >= 1
+    # Checkpoints after the resync agree again
+    newest = max(set(host.checkpoints) & set(joiner.checkpoints))
+    assert host.checkpoints[newest] == joiner.checkpoints[newest]
+
+def test_resyncing_does_not_keep_the_replayed_states(peers):
+    host, joiner = peers
+    play(peers, 8 * HASH_INTERVAL, seed=8)
+    # A SYNC from a checkpoint far back, as one arrives over a slow link
+    first = min(frame for frame in joiner.checkpoints if frame >= joiner.local_oldest)
+    assert joiner.frame - first > 2 * HASH_INTERVAL
+    joiner.pending_sync = (first, joiner.checkpoints[first][1])
+    play(peers, 2 * HASH_INTERVAL, seed=9)
+    assert joiner.replayed_frames > 2 * HASH_INTERVAL  # It did replay from first
+    for session in peers:
+        assert len(session.saved) <= RollbackSession.MAX_ROLLBACK + 1
+        assert min(session.saved) >= session.frame - RollbackSession.MAX_ROLLBACK - 1
+        assert all(frame >= session.frame - RollbackSession.MAX_ROLLBACK - 1 for frame in session.predicted)
@@ -0,0 +1,126 @@
+import socket
+
+import pytest
+
+import results
+import server
+from protocol import MessageBuffer, encode_message
+
+@pytest.fixture
+def game_server(monkeypatch):
+    monkeypatch.setattr(server, "DEBUG_MODE", False)
+    game_server = server.Server(host="127.0.0.1", port=0, discovery_port=None)
+    sockets = []
+    yield game_server, sockets
+    for sock in sockets:
+        sock.close()
+    game_server.server.close()
+    game_server.selector.close()
+
+def join(game_server, sockets, name):
+    """Seat a client named name and return its Connection"""
+    ours, theirs = socket.socketpair()
+    sockets += [ours, theirs]
+    game_server.add_connection(ours, ("127.0.0.1", 0), encode_message(("join", name)))
+    return game_server.selector.get_key(ours).data
+
+def start_match(game_server, sockets, names=("alice", "bob")):
+    """Two named players, both ready, one tick into their match"""
+    connections = [join(game_server, sockets, name) for name in names]
+    for connection in connections:
+        game_server.handle_message(connection, (None, "ready"))
+    room = connections[0].room
+    room.tick(1)
+    assert room.game_state.game_active
+    return room, connections
+
+def test_leaving_mid_match_forfeits_it(game_server):
+    game_server, sockets = game_server
+    room, (alice, bob) = start_match(game_server, sockets)
+    game_server.handle_message(alice, "leave")
+    
+    assert not room.game_state.game_active
+    assert room.game_state.winner == "Player 2 Wins!"
+    assert not room.game_running
+    # The next player to join starts a new match instead of taking over this one
+    carol = join(game_server, sockets, "carol")
+    assert carol.room is room and carol.player_id == alice.player_id
+    room.tick(2)
+    assert not room.game_state.game_active
+
+def test_leaving_between_matches_forfeits_nothing(game_server):
+    game_server, sockets = game_server
+    alice = join(game_server, sockets, "alice")
+    bob = join(game_server, sockets, "bob")
+    game_server.handle_message(alice, "leave")
+    assert bob.room.game_state.winner == ""
+
+def time_out(game_server, connection):
+    """Drop a connection and let its grace period run out"""
+    game_server.close_connection(connection, "connection reset")
+    room = connection.room
+    room.held_slots[connection.player_id] = 0
+    game_server.expire_held_slots()
+
+def test_timed_out_player_forfeits_and_is_rated(game_server):
+    game_server, sockets = game_server
+    room, (alice, bob) = start_match(game_server, sockets)
+    time_out(game_server, alice)
+    
+    assert room.game_state.winner == "Player 2 Wins!"
+    assert game_server.ratings.players["bob"][1:] == [1, 1]
+    assert game_server.ratings.players["alice"][1:] == [1, 0]
+    assert game_server.ratings.rank("bob") == 1
+
+def test_timed_out_forfeit_is_saved_under_the_forfeiters_name(game_server, tmp_path):
+    game_server, sockets = game_server
+    store = results.ResultsStore(str(tmp_path / "results.db"))
+    room, (alice, bob) = start_match(game_server, sockets)
+    room.results = store
+    time_out(game_server, alice)
+    store.close()
+    
+    db = results.connect(store.path)
+    assert db.execute("SELECT forfeit, winner FROM matches").fetchall() == [(1, 1)]
+    assert db.execute("SELECT side, name, bot, won FROM match_players ORDER BY side").fetchall() == [
+        (0, "alice", None, 0), (1, "bob", None, 1)]
+
+def test_forfeit_in_a_bot_room_is_saved_before_a_bot_takes_the_seat(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "DEBUG_MODE", False)
+    game_server = server.Server(host="127.0.0.1", port=0, discovery_port=None, bot_difficulty="easy",
+                                bot_rooms=1, results_path=str(tmp_path / "results.db"))
+    sockets = []
+    try:
+        alice = join(game_server, sockets, "alice")
+        room = alice.room
+        assert room.persistent and len(room.bots) == 1
+        game_server.handle_message(alice, (None, "ready"))
+        room.tick(1)
+        assert room.game_state.game_active
+        time_out(game_server, alice)
+        game_server.results.close()
+        
+        # The human lost, and the bot now sitting in their seat isn't blamed
+        assert room.bots.keys() == {0, 1}
+        db = results.connect(game_server.results.path)
+        assert db.execute("SELECT side, name, bot, won FROM match_players ORDER BY side").fetchall() == sorted([
+            (alice.player_id, "alice", None, 0), (1 - alice.player_id, "easy bot", "easy", 1)])
+    finally:
+        for sock in sockets:
+            sock.close()
+        game_server.server.close()
+        game_server.selector.close()
+
+def test_shared_memory_can_be_turned_off(game_server, monkeypatch):
+    game_server, sockets = game_server
+    game_server.shared_memory = False
+    monkeypatch.setattr(server.shmlink, "same_host", lambda sock: True)
+    opened = []
+    monkeypatch.setattr(server.shmlink, "SharedMemoryLink", opened.append)
+    alice = join(game_server, sockets, "alice")
+    game_server.handle_message(alice, ("shm", "pingpong_0123"))
+    
+    assert alice.shm is None and not opened
+    received = MessageBuffer()
+    received.feed(sockets[1].recv(65536))
+    assert list(received.messages())[-1] == ("shm", False)
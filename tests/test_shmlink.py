@@ -0,0 +1,68 @@
+import pytest
+
+import shmlink
+from protocol import encode_message
+from shmlink import CACHE_LINE, Ring, SharedMemoryLink
+
+pytestmark = pytest.mark.skipif(not shmlink.supported(), reason="no multiprocessing.shared_memory")
+
+def ring(size=16):
+    return Ring(bytearray(Ring.span(size)), 0, size)
+
+def test_writes_wrap_around_the_end():
+    one = ring()
+    sent = received = b""
+    for n in range(50):
+        data = bytes([n]) * (n % 7 + 1)
+        assert one.write(data)
+        sent += data
+        received += one.read()
+        assert one.backlog() == 0
+    assert received == sent
+
+def test_a_full_ring_refuses_writes_until_read():
+    one = ring()
+    assert one.write(b"x" * 10)
+    assert not one.write(b"y" * 7)  # 17 > 16, and nothing is half-written
+    assert one.write(b"y" * 6)
+    assert one.backlog() == 16
+    assert one.read() == b"x" * 10 + b"y" * 6
+    assert one.read() == b""
+
+def test_counters_sit_on_their_own_cache_lines():
+    one = Ring(bytearray(64 + Ring.span(16)), 64, 16)
+    assert one.read_at - one.written_at == CACHE_LINE
+    assert one.data - one.written_at == 2 * CACHE_LINE
+
+@pytest.fixture
+def link(monkeypatch):
+    client = SharedMemoryLink(ring_size=4096)
+    # Both ends live in this process, which already tracks the segment
+    with monkeypatch.context() as patch:
+        patch.setattr(shmlink.resource_tracker, "unregister", lambda *args: None)
+        server = SharedMemoryLink(client.name)
+    yield client, server
+    server.close()
+    client.close()
+
+def test_messages_cross_in_both_directions(link):
+    client, server = link
+    assert client.send(encode_message("ready") + encode_message((1, b"\x03")))
+    assert server.send(encode_message({"tick": 5}))
+    assert server.receive() > 0
+    assert list(server.inbox.messages()) == ["ready", (1, b"\x03")]
+    assert client.receive() > 0
+    assert list(client.inbox.messages()) == [{"tick": 5}]
+    assert client.receive() == server.receive() == 0
+
+def test_backlog_counts_what_the_other_side_has_not_read(link):
+    client, server = link
+    data = encode_message("x" * 100)
+    assert server.send(data)
+    assert server.backlog() == len(data)
+    client.receive()
+    assert server.backlog() == 0
+
+def test_only_our_segments_attach():
+    with pytest.raises(ValueError):
+        SharedMemoryLink("someone_elses_segment")
@@ -0,0 +1,47 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+import results
+import supervisor
+
+pytestmark = pytest.mark.skipif(not supervisor.supported(), reason="worker processes need fork()")
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A supervisor whose worker has results queued (not yet written) as soon as it starts
+SCRIPT = """
+import sys
+sys.path.insert(0, {repo!r})
+import results, server
+server.DEBUG_MODE = False
+start = server.Server.start
+def queue_results_then_start(self):
+    for _ in range(5):
+        self.results.record(results.MatchStats().result(["alice", "bob"], 0, "server"))
+    open({ready!r}, "w").close()
+    start(self)
+server.Server.start = queue_results_then_start
+server.main(["--workers", "1", "--port", "0", "--results", {path!r}])
+"""
+
+def test_stopping_the_supervisor_saves_its_workers_queued_results(tmp_path):
+    path = str(tmp_path / "results.db")
+    ready = str(tmp_path / "ready")
+    process = subprocess.Popen([sys.executable, "-c", SCRIPT.format(repo=REPO, ready=ready, path=path)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(ready):
+            assert process.poll() is None and time.monotonic() < deadline
+            time.sleep(0.01)
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(20) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+    assert results.connect(path).execute("SELECT COUNT(*) FROM matches").fetchone() == (5,)